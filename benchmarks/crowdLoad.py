@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+from faceDatabase import FaceDatabase  # noqa: E402
+from faceGallery import (GALLERY_HEADER, GALLERY_HEADER_SIZE, GALLERY_MAGIC, GALLERY_VERSION,  # noqa: E402
+                         LAYOUT_FEATURE_MAJOR, GalleryRecognizer, lbpHistogram)
+from facePreprocess import FacePreprocessor  # noqa: E402
+from pipelineBench import buildDetector, replay, summarize  # noqa: E402
+from syntheticScenes import drawFace, loadFaceImages, scenes  # noqa: E402
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 人群负载测试：按不同的同屏人脸数和人脸库规模合成画面、人脸库和users表，按人脸检测线程的流程处理
+# 记录帧率、延迟、跟踪器数量和内存占用，绘制随负载变化的曲线（需要matplotlib），超出阈值时以非零状态退出
+
+resultDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+# 当前进程的常驻内存（MB），无法获取时返回None
+def memoryUsage():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1048576
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# 生成指定样本数的人脸库文件，每个用户samplesPerUser个样本，标签（face_id）从1开始
+# 每个用户的直方图由绘制的人脸计算，样本在其基础上加入扰动；按特征存储并逐块写入，大规模人脸库不需要一次放入内存
+def writeSyntheticGallery(path, samples, samplesPerUser, preprocessor, seed=0, chunkSize=1000):
+    rng = np.random.default_rng(seed)
+    users = -(-samples // samplesPerUser)
+    labels = np.repeat(np.arange(1, users + 1, dtype=np.int32), samplesPerUser)[:samples]
+    bases = {}
+
+    def baseHistogram(label):
+        if label not in bases:
+            bases[label] = lbpHistogram(preprocessor.normalizeCrop(drawFace(preprocessor.width, label - 1)))
+        return bases[label]
+
+    cols = len(baseHistogram(1))
+    header = GALLERY_HEADER.pack(GALLERY_MAGIC, GALLERY_VERSION, samples, cols, 1, 8, 8, 8, LAYOUT_FEATURE_MAJOR)
+    with open(path, 'wb') as file:
+        file.write(header.ljust(GALLERY_HEADER_SIZE, b'\0'))
+        file.truncate(GALLERY_HEADER_SIZE + samples * cols * 4 + samples * 4)
+    features = np.memmap(path, dtype=np.float32, mode='r+', offset=GALLERY_HEADER_SIZE, shape=(cols, samples))
+    for start in range(0, samples, chunkSize):
+        chunk = labels[start:start + chunkSize]
+        histograms = np.stack([baseHistogram(int(label)) for label in chunk])
+        histograms *= rng.uniform(0.8, 1.2, histograms.shape).astype(np.float32)
+        features[:, start:start + len(chunk)] = histograms.T
+    features.flush()
+    del features
+    labelMap = np.memmap(path, dtype=np.int32, mode='r+', offset=GALLERY_HEADER_SIZE + samples * cols * 4,
+                         shape=(samples,))
+    labelMap[:] = labels
+    labelMap.flush()
+    del labelMap
+    return users
+
+
+# 生成users表，学号按序编号，face_id与人脸库标签对应
+def writeSyntheticUsers(faceDatabase, users):
+    rows = [('{:012d}'.format(index), '测试用户', 'Test User {}'.format(index)) for index in range(1, users + 1)]
+    faceDatabase.upsertUsers(rows)
+    faceDatabase.setFaceIDs([(row[0], index) for index, row in enumerate(rows, 1)])
+
+
+# 读取阈值配置，[DEFAULT]对所有负载生效，名为“人脸数x样本数”（例如50x10000）的段覆盖对应负载的阈值
+def readThresholds(path):
+    cfg = ConfigParser()
+    if path:
+        cfg.read(path, encoding='utf-8-sig')
+    return cfg
+
+
+# 检查一组负载的结果，返回超出阈值的说明
+def checkThresholds(cfg, result, args):
+    section = '{}x{}'.format(result['faces'], result['gallery'])
+    section = section if cfg.has_section(section) else 'DEFAULT'
+    minFps = args.min_fps if args.min_fps is not None else cfg.getfloat(section, 'min_fps', fallback=0)
+    maxLatency = args.max_latency if args.max_latency is not None else \
+        cfg.getfloat(section, 'max_frame_p95', fallback=0)
+    maxMemory = args.max_memory if args.max_memory is not None else cfg.getfloat(section, 'max_memory', fallback=0)
+    failures = []
+    if minFps > 0 and result['fps'] < minFps:
+        failures.append('帧率{:.1f} < {}'.format(result['fps'], minFps))
+    if maxLatency > 0 and result['frame']['p95_ms'] > maxLatency:
+        failures.append('整帧p95延迟{:.1f} ms > {} ms'.format(result['frame']['p95_ms'], maxLatency))
+    if maxMemory > 0 and result['memory_mb'] is not None and result['memory_mb'] > maxMemory:
+        failures.append('内存{:.0f} MB > {} MB'.format(result['memory_mb'], maxMemory))
+    return failures
+
+
+# 绘制帧率、延迟、跟踪器数量和内存随同屏人脸数变化的曲线，每种人脸库规模一条曲线
+def plotResults(results, path):
+    figure, axes = plt.subplots(2, 2, figsize=(11, 8))
+    charts = (('fps', 'FPS'), ('latency', 'frame p95 latency (ms)'), ('trackers', 'mean trackers'),
+              ('memory_mb', 'RSS (MB)'))
+    for axis, (key, title) in zip(axes.ravel(), charts):
+        for gallery in sorted({result['gallery'] for result in results}):
+            rows = sorted((result for result in results if result['gallery'] == gallery), key=lambda r: r['faces'])
+            values = [row['frame']['p95_ms'] if key == 'latency' else row[key] for row in rows]
+            if any(value is None for value in values):
+                continue
+            axis.plot([row['faces'] for row in rows], values, marker='o', label='{} samples'.format(gallery))
+        axis.set_title(title)
+        axis.set_xlabel('faces in view')
+        axis.grid(True, alpha=0.3)
+        axis.legend(fontsize='small')
+    figure.tight_layout()
+    figure.savefig(path, dpi=100)
+    plt.close(figure)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='合成人群画面和人脸库，测试同屏人脸数和人脸库规模对处理性能的影响')
+    parser.add_argument('--faces', default='1,5,20,50', help='同屏人脸数，逗号分隔')
+    parser.add_argument('--galleries', default='100,1000,10000',
+                        help='人脸库样本数，逗号分隔；每个样本约占64KB，100000个样本需要约6.5GB磁盘空间')
+    parser.add_argument('--samples-per-user', type=int, default=10, help='每个用户的样本数')
+    parser.add_argument('--frames', type=int, default=30, help='每组负载处理的帧数')
+    parser.add_argument('--warmup', type=int, default=3, help='每组负载开始时不计入统计的帧数')
+    parser.add_argument('--width', type=int, default=1280, help='画面宽度')
+    parser.add_argument('--height', type=int, default=720, help='画面高度')
+    parser.add_argument('--face-images', default=None, help='人脸图像目录（例如./datasets），默认使用绘制的人脸')
+    parser.add_argument('--cascade', default=None, help='Haar分类器文件，覆盖config/detector.cfg')
+    parser.add_argument('--scale-factor', type=float, default=None, help='detectMultiScale的scaleFactor，覆盖配置文件')
+    parser.add_argument('--min-neighbors', type=int, default=None, help='detectMultiScale的minNeighbors，覆盖配置文件')
+    parser.add_argument('--min-size', type=int, default=None, help='detectMultiScale的最小人脸边长，覆盖配置文件')
+    parser.add_argument('--equalize', action='store_true', help='检测前进行直方图均衡化')
+    parser.add_argument('--confidence', type=float, default=85, help='置信度阈值，低于该值时查询数据库')
+    parser.add_argument('--workers', type=int, default=None, help='识别线程数，默认读取配置文件')
+    parser.add_argument('--thresholds', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             'crowdLoad.cfg'), help='阈值配置文件')
+    parser.add_argument('--min-fps', type=float, default=None, help='最低帧率，覆盖阈值配置文件')
+    parser.add_argument('--max-latency', type=float, default=None, help='整帧p95延迟上限（毫秒），覆盖阈值配置文件')
+    parser.add_argument('--max-memory', type=float, default=None, help='常驻内存上限（MB），覆盖阈值配置文件')
+    parser.add_argument('--output', default=os.path.join(resultDir, 'crowdLoad.json'), help='结果JSON文件')
+    parser.add_argument('--chart', default=os.path.join(resultDir, 'crowdLoad.png'), help='曲线图文件')
+    args = parser.parse_args()
+
+    configPath = os.path.join(root, 'config', 'recognizer.cfg')
+    cfg = ConfigParser()
+    cfg.read(configPath, encoding='utf-8-sig')
+    workers = args.workers or cfg.getint('recognizer', 'workers', fallback=4)
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    faceDetector = buildDetector(args)  # 与各界面使用相同的检测参数（config/detector.cfg）
+    preprocessor = FacePreprocessor.fromConfig(configPath)
+    faceImages = loadFaceImages(args.face_images) if args.face_images else None
+    if args.face_images and not faceImages:
+        sys.exit('{}中没有人脸图像'.format(args.face_images))
+    thresholds = readThresholds(args.thresholds)
+    faceCounts = [int(value) for value in args.faces.split(',')]
+    gallerySizes = [int(value) for value in args.galleries.split(',')]
+
+    results, failures = [], []
+    print('{:>6}{:>9}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+        '人脸数', '样本数', 'FPS', 'p50 ms', 'p95 ms', 'p99 ms', '跟踪器', '内存 MB'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for gallerySize in gallerySizes:
+            galleryPath = os.path.join(tmp, 'gallery_{}.fgal'.format(gallerySize))
+            users = writeSyntheticGallery(galleryPath, gallerySize, args.samples_per_user, preprocessor)
+            faceDatabase = FaceDatabase(os.path.join(tmp, 'FaceBase_{}.db'.format(gallerySize)))
+            writeSyntheticUsers(faceDatabase, users)
+            recognizer = GalleryRecognizer.read(galleryPath)
+
+            for faceCount in faceCounts:
+                # 预先生成画面，合成耗时不计入capture阶段
+                frames = [frame for frame, _ in scenes(faceCount, args.frames, args.width, args.height, seed=faceCount,
+                                                       minSize=faceDetector.minSize, maxSize=faceDetector.minSize + 40,
+                                                       crowd=True, faceImages=faceImages)]
+                start = time.perf_counter()
+                timings, counts = replay(frames, args, faceDetector, recognizer, preprocessor, faceDatabase, executor)
+                elapsed = time.perf_counter() - start
+                del frames
+                stats = summarize(timings)
+                result = {
+                    'faces': faceCount,
+                    'gallery': gallerySize,
+                    'users': users,
+                    'fps': args.frames / elapsed,
+                    'frame': stats['frame'],
+                    'stages': {stage: entry for stage, entry in stats.items() if stage != 'frame'},
+                    'detected': counts['faces'] / max(1, counts['frames']),
+                    'recognitions': counts['recognitions'],
+                    'trackers': counts['trackers'] / max(1, counts['frames']),
+                    'memory_mb': memoryUsage(),
+                }
+                result['failures'] = checkThresholds(thresholds, result, args)
+                results.append(result)
+                failures.extend('{}张人脸、{}个样本：{}'.format(faceCount, gallerySize, failure)
+                                for failure in result['failures'])
+                print('{:>6}{:>9}{:>8.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10}{}'.format(
+                    faceCount, gallerySize, result['fps'], result['frame']['p50_ms'], result['frame']['p95_ms'],
+                    result['frame']['p99_ms'], result['trackers'],
+                    '-' if result['memory_mb'] is None else '{:.0f}'.format(result['memory_mb']),
+                    '  超出阈值' if result['failures'] else ''))
+
+            del recognizer
+            faceDatabase.close()
+    if executor is not None:
+        executor.shutdown()
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'opencv': cv2.__version__,
+                   'workers': workers, 'frames': args.frames, 'size': [args.width, args.height],
+                   'results': results}, file, ensure_ascii=False, indent=2)
+    print('结果已写入{}'.format(args.output))
+    if plt is not None:
+        plotResults(results, args.chart)
+        print('曲线图已写入{}'.format(args.chart))
+    else:
+        print('未安装matplotlib，不绘制曲线图')
+
+    if failures:
+        print('\n以下负载超出阈值：')
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
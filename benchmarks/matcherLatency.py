@@ -0,0 +1,59 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from faceGallery import GalleryRecognizer, galleryFromRecognizer, saveGallery  # noqa: E402
+
+
+# 生成平滑的随机灰度图，作为合成人脸样本
+def syntheticFace(rng, size):
+    return cv2.GaussianBlur(rng.integers(0, 256, (size, size), dtype=np.uint8), (5, 5), 0)
+
+
+# 统计单次预测耗时的中位数（毫秒）
+def measure(predict, probes):
+    timings = []
+    for probe in probes:
+        start = time.perf_counter()
+        predict(probe)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较cv2.face.LBPHFaceRecognizer与GalleryRecognizer的预测延迟')
+    parser.add_argument('--samples', type=int, default=10000, help='人脸库样本数')
+    parser.add_argument('--users', type=int, default=500, help='用户数')
+    parser.add_argument('--size', type=int, default=100, help='人脸图像边长')
+    parser.add_argument('--probes', type=int, default=20, help='查询次数')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    bases = [syntheticFace(rng, args.size) for _ in range(args.users)]
+    labels = np.sort(rng.integers(0, args.users, args.samples)).astype(np.int32)
+    images = [bases[label] for label in labels]
+    probes = [syntheticFace(rng, args.size) for _ in range(args.probes)]
+
+    lbph = cv2.face.LBPHFaceRecognizer_create()
+    lbph.train(images, labels)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'gallery.fgal')
+        saveGallery(path, galleryFromRecognizer(lbph))
+        start = time.perf_counter()
+        gallery = GalleryRecognizer.read(path)
+        loadTime = (time.perf_counter() - start) * 1000
+
+        print('样本数：{}，用户数：{}'.format(args.samples, args.users))
+        print('GalleryRecognizer加载耗时：{:.1f}ms'.format(loadTime))
+        print('LBPHFaceRecognizer.predict：{:.2f}ms'.format(measure(lbph.predict, probes)))
+        print('GalleryRecognizer.predict：{:.2f}ms'.format(measure(gallery.predict, probes)))
+        print('GalleryRecognizer.match(k=5)：{:.2f}ms'.format(measure(lambda p: gallery.match(p, 5), probes)))
+        del gallery
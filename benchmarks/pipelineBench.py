@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+from faceDetector import FaceDetector  # noqa: E402
+from faceGallery import GalleryRecognizer, galleryFromRecognizer  # noqa: E402
+from facePreprocess import FacePreprocessor  # noqa: E402
+from syntheticScenes import enrolmentFrames, writeClip  # noqa: E402
+
+try:
+    import dlib
+except ImportError:
+    dlib = None
+
+try:
+    from PyQt5.QtGui import QImage
+except ImportError:
+    QImage = None
+
+# 逐阶段基准测试：回放视频片段，按人脸检测线程的流程依次执行各阶段，输出各阶段吞吐量和p50/p95/p99延迟（JSON）
+# 默认使用合成片段（首次运行时生成到benchmarks/clips），也可通过--clip指定录制的视频
+# 检测参数与各界面一样读取config/detector.cfg，cascadeTuner.py调优后的参数会同样生效，命令行参数只用于临时覆盖
+# 与保存的基线比较，任一阶段的p95延迟超出容差时以非零状态退出
+#
+# 基线与机器相关，不随仓库提供，第一次使用时在用于比较的机器上生成：
+#   python benchmarks/pipelineBench.py --save-baseline
+# 结果保存到benchmarks/baseline.json（可提交到仓库），之后的运行会自动与之比较；修改检测参数后应重新生成基线
+
+clipDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clips')
+# 内置片段：(文件名, 人脸数, 帧数, 种子)
+builtinClips = (
+    ('single.avi', 1, 120, 1),
+    ('group.avi', 3, 120, 3),
+    ('crowd.avi', 6, 120, 6),
+)
+stages = ('capture', 'preprocess', 'detect', 'tracker', 'association', 'predict', 'database', 'display')
+quantiles = (0.5, 0.95, 0.99)
+
+
+# 返回内置片段路径，不存在时生成
+def builtinClipPaths():
+    paths = []
+    for name, faceCount, frameCount, seed in builtinClips:
+        path = os.path.join(clipDir, name)
+        if not os.path.isfile(path):
+            writeClip(path, faceCount, frameCount, seed=seed)
+        paths.append(path)
+    return paths
+
+
+# 人脸检测器，读取config/detector.cfg，命令行给出的参数优先
+def buildDetector(args):
+    cwd = os.getcwd()
+    os.chdir(root)  # 配置文件中的分类器路径相对于项目根目录
+    try:
+        detector = FaceDetector.fromConfig()
+    finally:
+        os.chdir(cwd)
+    if args.cascade is not None:
+        if not os.path.isfile(args.cascade):
+            sys.exit('找不到Haar分类器：{}'.format(args.cascade))
+        detector = FaceDetector(args.cascade, detector.scaleFactor, detector.minNeighbors, detector.minSize)
+    if detector.cascade.empty():
+        sys.exit('无法加载Haar分类器：{}'.format(detector.cascadePath))
+    if args.scale_factor is not None:
+        detector.scaleFactor = args.scale_factor
+    if args.min_neighbors is not None:
+        detector.minNeighbors = args.min_neighbors
+    if args.min_size is not None:
+        detector.minSize = args.min_size
+    return detector
+
+
+# 用合成人脸训练识别模型，样本与采集时一样经检测、截取和预处理得到，标签为身份+1
+def buildRecognizer(users, samplesPerUser, preprocessor, faceDetector):
+    images, labels = [], []
+    for identity in range(users):
+        for frame, _ in enrolmentFrames(identity, samplesPerUser):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = faceDetector.detect(gray)
+            face = preprocessor.normalize(gray, faces[0]) if len(faces) == 1 else None
+            if face is not None:
+                images.append(face)
+                labels.append(identity + 1)
+    lbph = cv2.face.LBPHFaceRecognizer_create()
+    lbph.train(images, np.asarray(labels, dtype=np.int32))
+    return GalleryRecognizer(galleryFromRecognizer(lbph))
+
+
+# 与人脸检测线程相同的关联逻辑：检测到的人脸中心落在跟踪器内且跟踪器中心落在人脸内时认为已被跟踪
+def isTracked(rect, position):
+    x, y, w, h = rect
+    t_x, t_y = int(position.left()), int(position.top())
+    t_w, t_h = int(position.width()), int(position.height())
+    x_bar, y_bar = x + 0.5 * w, y + 0.5 * h
+    t_x_bar, t_y_bar = t_x + 0.5 * t_w, t_y + 0.5 * t_h
+    return (t_x <= x_bar <= t_x + t_w and t_y <= y_bar <= t_y + t_h and
+            x <= t_x_bar <= x + w and y <= t_y_bar <= y + h)
+
+
+# 界面显示前的颜色转换，与CoreUI.displayImage一致
+def displayConvert(frame):
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    if QImage is not None:
+        return QImage(rgb, rgb.shape[1], rgb.shape[0], QImage.Format_RGB888).copy()
+    return rgb
+
+
+# 逐帧读取视频片段
+def readClip(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
+# 依次处理各帧，返回{阶段: [每帧耗时（秒）]}和检测、识别、跟踪计数
+# 给出faceDatabase时查询识别出的用户，给出executor时同一帧的多张人脸并行识别，与人脸检测线程一致
+def replay(frames, args, faceDetector, recognizer, preprocessor, faceDatabase=None, executor=None):
+    timings = {stage: [] for stage in stages}
+    counts = {'frames': 0, 'faces': 0, 'recognitions': 0, 'trackers': 0}
+    faceTrackers = {}
+    currentFaceID = 0
+    frames = iter(frames)
+    frameIndex = 0
+    while True:
+        start = time.perf_counter()
+        frame = next(frames, None)
+        if frame is None:
+            break
+        lap = {'capture': time.perf_counter() - start}
+
+        start = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if args.equalize:
+            gray = cv2.equalizeHist(gray)
+        lap['preprocess'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        faces = faceDetector.detect(gray)
+        lap['detect'] = time.perf_counter() - start
+
+        if dlib is not None:
+            start = time.perf_counter()
+            for fid in [fid for fid, tracker in faceTrackers.items() if tracker.update(frame) < 7]:
+                faceTrackers.pop(fid)
+            lap['tracker'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        crops = [face for face in (preprocessor.normalize(gray, rect) for rect in faces) if face is not None]
+        if executor is not None and len(crops) > 1:
+            results = list(executor.map(recognizer.predict, crops))
+        else:
+            results = [recognizer.predict(face) for face in crops]
+        recognized = [face_id for face_id, confidence in results if face_id > 0 and confidence < args.confidence]
+        counts['recognitions'] += len(recognized)
+        lap['predict'] = time.perf_counter() - start
+
+        if faceDatabase is not None:
+            start = time.perf_counter()
+            for face_id in recognized:
+                faceDatabase.getUserByFaceID(face_id)
+            lap['database'] = time.perf_counter() - start
+
+        if dlib is not None:
+            start = time.perf_counter()
+            if frameIndex % 10 == 0:  # 人脸检测线程每10帧关联一次
+                for rect in faces:
+                    x, y, w, h = (int(v) for v in rect)
+                    if not any(isTracked((x, y, w, h), tracker.get_position()) for tracker in faceTrackers.values()):
+                        tracker = dlib.correlation_tracker()
+                        tracker.start_track(frame, dlib.rectangle(x - 5, y - 10, x + w + 5, y + h + 10))
+                        faceTrackers[currentFaceID] = tracker
+                        currentFaceID += 1
+            lap['association'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        displayConvert(frame)
+        lap['display'] = time.perf_counter() - start
+
+        if frameIndex >= args.warmup:
+            for stage, seconds in lap.items():
+                timings[stage].append(seconds)
+            counts['frames'] += 1
+            counts['faces'] += len(faces)
+            counts['trackers'] += len(faceTrackers)
+        frameIndex += 1
+    return timings, counts
+
+
+# 一组耗时（秒）的统计结果，分位数取法与PipelineMetrics一致
+def stageSummary(values):
+    values = sorted(values)
+    total = sum(values)
+    entry = {'count': len(values), 'mean_ms': 1000 * total / len(values),
+             'throughput_fps': len(values) / total if total > 0 else None}
+    for q in quantiles:
+        entry['p{}_ms'.format(int(q * 100))] = 1000 * values[min(len(values) - 1, int(q * len(values)))]
+    return entry
+
+
+# 各阶段及整帧的统计结果
+def summarize(timings):
+    measured = [stage for stage in stages if timings.get(stage)]
+    result = {stage: stageSummary(timings[stage]) for stage in measured}
+    if measured:
+        result['frame'] = stageSummary([sum(frame) for frame in zip(*(timings[stage] for stage in measured))])
+    return result
+
+
+# 与基线比较，返回(阶段, 基线p95, 当前p95, 变化比例, 是否退化)
+def compare(report, baseline, tolerance, minDelta):
+    rows = []
+    for clip, current in report['clips'].items():
+        previous = baseline.get('clips', {}).get(clip)
+        if previous is None:
+            continue
+        for stage, entry in current['stages'].items():
+            if stage not in previous['stages']:
+                continue
+            before, after = previous['stages'][stage]['p95_ms'], entry['p95_ms']
+            change = (after - before) / before if before > 0 else 0.0
+            # 极短的阶段受计时抖动影响大，同时超出比例和绝对值才认为退化
+            rows.append((clip, stage, before, after, change, change > tolerance and after - before > minDelta))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='回放视频片段，测量人脸检测线程各阶段的吞吐量和延迟分位数')
+    parser.add_argument('--clip', action='append', help='视频片段，可指定多次，默认使用内置合成片段')
+    parser.add_argument('--cascade', default=None, help='Haar分类器文件，覆盖config/detector.cfg')
+    parser.add_argument('--scale-factor', type=float, default=None, help='detectMultiScale的scaleFactor，覆盖配置文件')
+    parser.add_argument('--min-neighbors', type=int, default=None, help='detectMultiScale的minNeighbors，覆盖配置文件')
+    parser.add_argument('--min-size', type=int, default=None, help='detectMultiScale的最小人脸边长，覆盖配置文件')
+    parser.add_argument('--equalize', action='store_true', help='检测前进行直方图均衡化')
+    parser.add_argument('--users', type=int, default=6, help='识别模型的用户数')
+    parser.add_argument('--samples', type=int, default=20, help='每个用户的训练样本数')
+    parser.add_argument('--confidence', type=float, default=85, help='置信度阈值，只影响识别计数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个片段的回放次数')
+    parser.add_argument('--warmup', type=int, default=5, help='每次回放开始时不计入统计的帧数')
+    parser.add_argument('--threads', type=int, default=1, help='OpenCV线程数，默认为1以便结果可复现')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                                                         'pipelineBench.json'), help='结果JSON文件')
+    parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'baseline.json'), help='基线JSON文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的p95延迟增长比例')
+    parser.add_argument('--min-delta', type=float, default=0.5, help='允许的p95延迟增长绝对值（毫秒）')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(args.threads)
+    faceDetector = buildDetector(args)
+    preprocessor = FacePreprocessor.fromConfig(os.path.join(root, 'config', 'recognizer.cfg'))
+    recognizer = buildRecognizer(args.users, args.samples, preprocessor, faceDetector)
+    clips = args.clip or builtinClipPaths()
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'opencv': cv2.__version__, 'machine': platform.machine(),
+                        'processor': platform.processor(), 'threads': args.threads,
+                        'dlib': dlib is not None, 'qt': QImage is not None},
+        'parameters': {'cascade': os.path.basename(faceDetector.cascadePath), 'scaleFactor': faceDetector.scaleFactor,
+                       'minNeighbors': faceDetector.minNeighbors, 'minSize': faceDetector.minSize,
+                       'equalize': args.equalize,
+                       'users': args.users, 'samples': args.samples, 'repeat': args.repeat, 'warmup': args.warmup},
+        'clips': {},
+    }
+    if dlib is None:
+        print('未安装dlib，跳过tracker和association阶段')
+
+    for path in clips:
+        timings = {stage: [] for stage in stages}
+        counts = {}
+        for _ in range(args.repeat):
+            clipTimings, clipCounts = replay(readClip(path), args, faceDetector, recognizer, preprocessor)
+            for stage, values in clipTimings.items():
+                timings[stage].extend(values)
+            for key, value in clipCounts.items():
+                counts[key] = counts.get(key, 0) + value
+        name = os.path.basename(path)
+        report['clips'][name] = {'counts': counts, 'stages': summarize(timings)}
+
+        print('\n{}：{}帧，检测到{}张人脸，识别{}次'.format(name, counts['frames'], counts['faces'],
+                                                 counts['recognitions']))
+        print('{:<12}{:>10}{:>10}{:>10}{:>12}'.format('阶段', 'p50 ms', 'p95 ms', 'p99 ms', '吞吐 fps'))
+        for stage, entry in report['clips'][name]['stages'].items():
+            print('{:<12}{:>10.2f}{:>10.2f}{:>10.2f}{:>12.1f}'.format(
+                stage, entry['p50_ms'], entry['p95_ms'], entry['p99_ms'], entry['throughput_fps'] or 0))
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print('\n结果已写入{}'.format(args.output))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print('基线已保存到{}'.format(args.baseline))
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline.get('parameters') != report['parameters']:
+            print('注意：基线的测试参数与本次不同')
+        rows = compare(report, baseline, args.tolerance, args.min_delta)
+        print('\n与基线（{}）比较p95延迟：'.format(baseline.get('created')))
+        for clip, stage, before, after, change, isRegression in rows:
+            print('{:<12}{:<12}{:>9.2f} -> {:>8.2f} ms  {:>+7.1%}{}'.format(
+                clip, stage, before, after, change, '  退化' if isRegression else ''))
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+    else:
+        print('基线文件不存在，使用--save-baseline保存本次结果作为基线')
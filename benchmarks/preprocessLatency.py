@@ -0,0 +1,56 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from facePreprocess import FacePreprocessor  # noqa: E402
+
+
+# 生成平滑的随机灰度图，模拟检测得到的人脸区域，边长在检测器常见范围内随机
+def syntheticCrop(rng, minSize, maxSize):
+    size = int(rng.integers(minSize, maxSize + 1))
+    return cv2.GaussianBlur(rng.integers(0, 256, (size, size), dtype=np.uint8), (5, 5), 0)
+
+
+# 统计单次预测耗时的中位数（毫秒），预处理耗时计入其中
+def measure(recognizer, probes, prepare):
+    timings = []
+    for probe in probes:
+        start = time.perf_counter()
+        recognizer.predict(prepare(probe))
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较原始人脸区域与标准尺寸人脸的LBPH预测延迟')
+    parser.add_argument('--samples', type=int, default=1000, help='训练样本数')
+    parser.add_argument('--users', type=int, default=50, help='用户数')
+    parser.add_argument('--probes', type=int, default=50, help='查询次数')
+    parser.add_argument('--min-size', type=int, default=90, help='人脸区域最小边长')
+    parser.add_argument('--max-size', type=int, default=300, help='人脸区域最大边长')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    preprocessor = FacePreprocessor.fromConfig(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                                            'config', 'recognizer.cfg'))
+    crops = [syntheticCrop(rng, args.min_size, args.max_size) for _ in range(args.samples)]
+    labels = np.sort(rng.integers(0, args.users, args.samples)).astype(np.int32)
+    probes = [syntheticCrop(rng, args.min_size, args.max_size) for _ in range(args.probes)]
+
+    before = cv2.face.LBPHFaceRecognizer_create()
+    before.train(crops, labels)
+    after = cv2.face.LBPHFaceRecognizer_create()
+    after.train([preprocessor.normalizeCrop(crop) for crop in crops], labels)
+
+    sampleBytes = sum(crop.nbytes for crop in crops) / len(crops)
+    print('样本数：{}，人脸边长：{}-{}，标准尺寸：{}x{}'.format(args.samples, args.min_size, args.max_size,
+                                                   preprocessor.width, preprocessor.height))
+    print('平均样本大小：原始{:.0f}字节，标准尺寸{}字节'.format(sampleBytes, preprocessor.width * preprocessor.height))
+    print('原始人脸区域predict：{:.2f}ms'.format(measure(before, probes, lambda crop: crop)))
+    print('标准尺寸人脸predict：{:.2f}ms'.format(measure(after, probes, preprocessor.normalizeCrop)))
@@ -0,0 +1,182 @@
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+
+# 合成测试画面：绘制可被Haar分类器检测到的正面人脸，按设定轨迹合成到背景上，并写出视频片段和逐帧人脸位置标注
+# 不同身份的人脸在肤色、五官间距和大小上有差异，可用于训练识别模型
+# 所有随机量都由种子决定，同一参数生成的画面完全一致
+
+# 绘制一张灰度正面人脸，identity决定五官特征
+def drawFace(size, identity=0):
+    rng = np.random.default_rng(identity)
+    tone = int(rng.integers(160, 220))  # 肤色亮度
+    eyeSpacing = rng.uniform(0.15, 0.19)  # 双眼到中线的距离
+    eyeHeight = rng.uniform(0.40, 0.44)
+    browTilt = rng.uniform(-0.02, 0.02)
+    mouthWidth = rng.uniform(0.10, 0.17)
+    mouthHeight = rng.uniform(0.72, 0.78)
+    noseLength = rng.uniform(0.14, 0.20)
+
+    image = np.full((size, size), 60, np.uint8)
+    center = size // 2
+    thickness = max(2, size // 40)
+    cv2.ellipse(image, (center, int(center * 1.05)), (int(size * 0.36), int(size * 0.46)), 0, 0, 360, tone, -1)
+    for side in (-1, 1):
+        eyeX = center + side * int(size * eyeSpacing)
+        cv2.ellipse(image, (eyeX, int(size * eyeHeight)), (int(size * 0.09), int(size * 0.045)), 0, 0, 360, 40, -1)
+        cv2.line(image, (center + side * int(size * 0.08), int(size * (eyeHeight - 0.09))),
+                 (center + side * int(size * 0.26), int(size * (eyeHeight - 0.10 + side * browTilt))), 50, thickness)
+    cv2.line(image, (center, int(size * 0.45)), (center, int(size * (0.45 + noseLength))), 130, thickness)
+    cv2.ellipse(image, (center, int(size * mouthHeight)), (int(size * mouthWidth), int(size * 0.04)), 0, 0, 360, 70, -1)
+    return cv2.GaussianBlur(image, (5, 5), 0)
+
+
+# 采集用画面：画面中只有指定身份的一张人脸，位置、大小和亮度随机，与采集界面一样经检测后截取样本
+def enrolmentFrames(identity, count, width=640, height=480, seed=0, minSize=100, maxSize=180):
+    rng = np.random.default_rng((seed, identity))
+    scene = background(width, height, seed)
+    for _ in range(count):
+        size = int(rng.integers(minSize, maxSize + 1))
+        x, y = int(rng.integers(0, width - size)), int(rng.integers(0, height - size))
+        frame = scene.copy()
+        frame[y:y + size, x:x + size] = cv2.cvtColor(drawFace(size, identity), cv2.COLOR_GRAY2BGR)
+        sample = frame.astype(np.int16) + int(rng.integers(-20, 21)) + rng.normal(0, 3, frame.shape).astype(np.int16)
+        yield np.clip(sample, 0, 255).astype(np.uint8), (x, y, size, size)
+
+
+# 读取目录下的人脸图像（例如采集得到的数据集），返回灰度图像列表
+def loadFaceImages(root, limit=1000):
+    images = []
+    for directory, _, names in sorted(os.walk(root)):
+        for name in sorted(names):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
+                image = cv2.imread(os.path.join(directory, name), cv2.IMREAD_GRAYSCALE)
+                if image is not None:
+                    images.append(image)
+                    if len(images) >= limit:
+                        return images
+    return images
+
+
+# 带纹理的背景
+def background(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(40, 160, (height // 8, width // 8, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC), (9, 9), 0)
+
+
+# 一段画面中各人脸的运动参数：身份、边长、起点、振幅、周期和相位
+def faceTracks(faceCount, width, height, seed=0, minSize=100, maxSize=180):
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for index in range(faceCount):
+        size = int(rng.integers(minSize, maxSize + 1))
+        tracks.append({
+            'identity': index,
+            'size': size,
+            'x': float(rng.uniform(0, max(1, width - size))),
+            'y': float(rng.uniform(0, max(1, height - size))),
+            'amplitude': float(rng.uniform(5, 40)),
+            'period': float(rng.uniform(30, 120)),
+            'phase': float(rng.uniform(0, 2 * math.pi)),
+        })
+    return tracks
+
+
+# 人群画面的运动参数：把画面划分为网格，每张人脸在自己的格子内运动，人脸之间不重叠
+def crowdTracks(faceCount, width, height, seed=0, minSize=90, maxSize=130):
+    rng = np.random.default_rng(seed)
+    columns = max(1, int(math.ceil(math.sqrt(faceCount * width / float(height)))))
+    rows = int(math.ceil(faceCount / float(columns)))
+    cellWidth, cellHeight = width // columns, height // rows
+    if min(cellWidth, cellHeight) < minSize:
+        raise ValueError('画面{}x{}放不下{}张边长{}的人脸'.format(width, height, faceCount, minSize))
+    tracks = []
+    for index in range(faceCount):
+        size = int(rng.integers(minSize, min(maxSize, cellWidth, cellHeight) + 1))
+        slackX, slackY = (cellWidth - size) / 2.0, (cellHeight - size) / 2.0
+        tracks.append({
+            'identity': index,
+            'size': size,
+            'x': index % columns * cellWidth + slackX,
+            'y': index // columns * cellHeight + slackY,
+            'amplitude': float(min(slackX, 2 * slackY) * rng.uniform(0.5, 1.0)),
+            'period': float(rng.uniform(30, 120)),
+            'phase': float(rng.uniform(0, 2 * math.pi)),
+        })
+    return tracks
+
+
+# 第index帧中各人脸的位置，返回[(身份, x, y, 边长)]，人脸不超出画面
+def trackPositions(tracks, index, width, height):
+    positions = []
+    for track in tracks:
+        angle = 2 * math.pi * index / track['period'] + track['phase']
+        size = track['size']
+        x = int(min(max(track['x'] + track['amplitude'] * math.sin(angle), 0), width - size))
+        y = int(min(max(track['y'] + track['amplitude'] * math.cos(angle) / 2, 0), height - size))
+        positions.append((track['identity'], x, y, size))
+    return positions
+
+
+# 生成一段画面，逐帧返回(BGR图像, 人脸位置)
+# crowd为True时按网格排布人脸；给出faceImages（灰度人脸图像列表）时使用这些人脸代替绘制的人脸
+def scenes(faceCount, frameCount, width=640, height=480, seed=0, minSize=100, maxSize=180, crowd=False,
+           faceImages=None):
+    rng = np.random.default_rng(seed)
+    scene = background(width, height, seed)
+    if crowd:
+        tracks = crowdTracks(faceCount, width, height, seed, minSize, maxSize)
+    else:
+        tracks = faceTracks(faceCount, width, height, seed, minSize, maxSize)
+    faces = {}
+    for track in tracks:
+        size, identity = track['size'], track['identity']
+        if faceImages:
+            face = cv2.resize(faceImages[identity % len(faceImages)], (size, size), interpolation=cv2.INTER_AREA)
+        else:
+            face = drawFace(size, identity)
+        faces[identity] = cv2.cvtColor(face, cv2.COLOR_GRAY2BGR)
+    for index in range(frameCount):
+        frame = scene.copy()
+        positions = trackPositions(tracks, index, width, height)
+        for identity, x, y, size in positions:
+            frame[y:y + size, x:x + size] = faces[identity]
+        noise = rng.normal(0, 3, frame.shape).astype(np.int16)  # 传感器噪声
+        yield np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8), positions
+
+
+# 把画面写为MJPG视频片段，同名.json文件保存逐帧人脸位置标注，返回视频路径
+def writeClip(path, faceCount, frameCount, width=640, height=480, fps=15, seed=0):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError('无法写入视频文件：{}'.format(path))
+    labels = []
+    try:
+        for frame, positions in scenes(faceCount, frameCount, width, height, seed):
+            writer.write(frame)
+            labels.append([[x, y, size, size] for _, x, y, size in positions])
+    finally:
+        writer.release()
+    with open(labelPath(path), 'w', encoding='utf-8') as file:
+        json.dump({'faces': faceCount, 'seed': seed, 'labels': labels}, file)
+    return path
+
+
+# 视频片段对应的标注文件
+def labelPath(clipPath):
+    return os.path.splitext(clipPath)[0] + '.json'
+
+
+# 读取逐帧人脸位置标注，返回[[(x, y, w, h)]]，没有标注文件时返回None
+def readLabels(clipPath):
+    path = labelPath(clipPath)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        return [[tuple(box) for box in boxes] for boxes in json.load(file)['labels']]
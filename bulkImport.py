@@ -0,0 +1,195 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import cv2
+
+from faceDatabase import FaceDatabase
+from faceDedup import SampleDeduplicator
+from faceDetector import FaceDetector
+from facePreprocess import FacePreprocessor
+
+# 批量导入用户：读取照片目录和花名册，多进程检测人脸，把标准尺寸人脸写入数据集并批量写入数据库
+# 照片目录下每个用户一个以学号命名的子目录，或者直接是以学号命名的图片文件
+# 花名册为CSV文件，表头为stu_id,cn_name,en_name
+# 已导入的学号记录在状态文件中，中断后重新运行会跳过这些用户
+
+imageExtensions = ('.jpg', '.jpeg', '.png', '.bmp')
+detectMaxSide = 640  # 检测前把大图缩小到该边长，证件照分辨率较高，直接检测很慢
+
+# 与用户信息填写对话框的输入限制一致
+stuIDPattern = re.compile('^[0-9]{12}$')
+cnNamePattern = re.compile('^[\u4e00-\u9fa5]{1,10}$')
+enNamePattern = re.compile('^[ A-Za-z]{1,16}$')
+
+# 工作进程内的检测器和预处理器，由initWorker创建
+faceDetector = None
+preprocessor = None
+deduplicatorConfig = None
+
+
+def initWorker(configPath):
+    global faceDetector, preprocessor, deduplicatorConfig
+    cv2.setNumThreads(1)  # 并行度由进程数决定，避免每个进程再开多个线程
+    faceDetector = FaceDetector.fromConfig()
+    preprocessor = FacePreprocessor.fromConfig(configPath)
+    deduplicatorConfig = configPath
+
+
+# 在图片中检测最大的人脸，大图缩小后检测，再按原图坐标截取
+def detectLargestFace(gray):
+    scale = min(1.0, detectMaxSide / float(max(gray.shape)))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    faces = faceDetector.detect(small, scale)
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    return tuple(int(round(v / scale)) for v in (x, y, w, h))
+
+
+# 处理一个用户的全部照片，返回(学号, 照片数, 写入的样本数)，在工作进程中运行
+def importUser(task):
+    stu_id, imagePaths, datasets = task
+    deduplicator = SampleDeduplicator.fromConfig(deduplicatorConfig)
+    subjectDir = '{}/stu_{}'.format(datasets, stu_id)
+    sampleCount = 0
+    for imagePath in imagePaths:
+        image = cv2.imread(imagePath, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        rect = detectLargestFace(image)
+        if rect is None:
+            continue
+        face = preprocessor.crop(image, rect)
+        if face is None or deduplicator.isDuplicate(face):
+            continue
+        if sampleCount == 0:
+            os.makedirs(subjectDir, exist_ok=True)
+        sampleCount += 1
+        # 使用独立的文件名前缀，不覆盖摄像头采集的样本；重复导入时覆盖同名文件
+        cv2.imwrite('{}/import.{}.jpg'.format(subjectDir, sampleCount), face)
+    return stu_id, len(imagePaths), sampleCount
+
+
+# 读取花名册，返回{学号: (中文名, 英文名)}，格式不正确的行计入invalid
+def readRoster(path):
+    roster = {}
+    invalid = []
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        for row in csv.DictReader(file):
+            stu_id = (row.get('stu_id') or '').strip()
+            cn_name = (row.get('cn_name') or '').strip()
+            en_name = (row.get('en_name') or '').strip()
+            if stuIDPattern.match(stu_id) and cnNamePattern.match(cn_name) and enNamePattern.match(en_name):
+                roster[stu_id] = (cn_name, en_name)
+            else:
+                invalid.append(stu_id)
+    return roster, invalid
+
+
+# 扫描照片目录，返回{学号: [照片路径]}
+def scanPhotos(root):
+    photos = {}
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if entry.name.startswith('.'):
+            continue
+        if entry.is_dir():
+            paths = [os.path.join(entry.path, name) for name in sorted(os.listdir(entry.path))
+                     if name.lower().endswith(imageExtensions) and not name.startswith('.')]
+            if paths:
+                photos.setdefault(entry.name, []).extend(paths)
+        elif entry.name.lower().endswith(imageExtensions):
+            photos.setdefault(os.path.splitext(entry.name)[0], []).append(entry.path)
+    return photos
+
+
+def readState(path):
+    if not os.path.isfile(path):
+        return set()
+    with open(path, encoding='utf-8') as file:
+        return {line.strip() for line in file if line.strip()}
+
+
+def bulkImport(photoRoot, rosterPath, database='./FaceBase.db', datasets='./datasets', statePath=None,
+               workers=None, batchSize=200, configPath='./config/recognizer.cfg'):
+    statePath = statePath or os.path.join(datasets, '.import_state')
+    roster, invalid = readRoster(rosterPath)
+    photos = scanPhotos(photoRoot)
+    done = readState(statePath)
+
+    tasks = [(stu_id, photos[stu_id], datasets) for stu_id in sorted(roster) if stu_id in photos and stu_id not in done]
+    missing = [stu_id for stu_id in roster if stu_id not in photos]
+    unlisted = [stu_id for stu_id in photos if stu_id not in roster]
+    print('花名册用户：{}，格式错误：{}，无照片：{}，照片目录中不在花名册的用户：{}'.format(
+        len(roster), len(invalid), len(missing), len(unlisted)))
+    print('已完成：{}，本次待导入：{}'.format(len(done & set(roster)), len(tasks)))
+    if not tasks:
+        return
+
+    os.makedirs(datasets, exist_ok=True)
+    faceDatabase = FaceDatabase(database)
+
+    workers = workers or multiprocessing.cpu_count()
+    imported, imageCount, sampleCount, failed = 0, 0, 0, []
+    pending, processedBatch = [], []  # 当前批次待写入数据库的用户，当前批次已处理的学号
+    start = time.perf_counter()
+
+    # 数据库写入成功后才记录状态，中断时最多重新处理一个批次；未检测到人脸的用户不记录，下次运行重试
+    def flush():
+        if not processedBatch:
+            return
+        if pending:
+            faceDatabase.upsertUsers(pending)  # 一个批次一个事务，已存在的用户只更新姓名
+            with open(statePath, 'a', encoding='utf-8') as stateFile:
+                stateFile.writelines(row[0] + '\n' for row in pending)
+        elapsed = time.perf_counter() - start
+        processed = imported + len(failed)
+        print('进度：{}/{}，{:.1f}人/秒，{:.1f}张/秒，已用时{:.0f}秒，预计剩余{:.0f}秒'.format(
+            processed, len(tasks), processed / elapsed, imageCount / elapsed, elapsed,
+            (len(tasks) - processed) * elapsed / processed))
+        pending.clear()
+        processedBatch.clear()
+
+    with multiprocessing.Pool(workers, initializer=initWorker, initargs=(configPath,)) as pool:
+        try:
+            for stu_id, photoCount, samples in pool.imap_unordered(importUser, tasks, chunksize=4):
+                imageCount += photoCount
+                processedBatch.append(stu_id)
+                if samples == 0:  # 所有照片都没有检测到人脸
+                    failed.append(stu_id)
+                else:
+                    imported += 1
+                    sampleCount += samples
+                    pending.append((stu_id,) + roster[stu_id])
+                if len(processedBatch) >= batchSize:
+                    flush()
+            flush()
+        finally:
+            faceDatabase.close()
+
+    elapsed = time.perf_counter() - start
+    print('导入完成：{}个用户，{}个样本，{}张照片，用时{:.1f}秒（{:.1f}张/秒，{}个进程）'.format(
+        imported, sampleCount, imageCount, elapsed, imageCount / elapsed, workers))
+    if failed:
+        print('{}个用户的照片中未检测到人脸：{}'.format(len(failed), '，'.join(failed[:20]) + ('……' if len(failed) > 20 else '')))
+    print('请在数据管理中重新训练人脸数据')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='从照片目录和花名册批量导入用户')
+    parser.add_argument('photos', help='照片目录，每个用户一个以学号命名的子目录或图片文件')
+    parser.add_argument('roster', help='花名册CSV文件，表头为stu_id,cn_name,en_name')
+    parser.add_argument('--database', default='./FaceBase.db', help='数据库文件')
+    parser.add_argument('--datasets', default='./datasets', help='数据集目录')
+    parser.add_argument('--state', default=None, help='断点续传状态文件，默认为数据集目录下的.import_state')
+    parser.add_argument('--workers', type=int, default=None, help='检测进程数，默认为CPU核数')
+    parser.add_argument('--batch', type=int, default=200, help='每个数据库事务写入的用户数')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.photos) or not os.path.isfile(args.roster):
+        sys.exit('照片目录或花名册不存在')
+    bulkImport(args.photos, args.roster, args.database, args.datasets, args.state, args.workers, args.batch)
@@ -0,0 +1,179 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import cv2
+
+from faceDetector import FaceDetector
+
+# Haar分类器参数调优：在带标注的视频片段上遍历分类器文件和检测参数，测量召回率、精确率和每帧检测耗时
+# 在召回率-耗时的帕累托前沿中选出满足耗时预算且召回率最高的参数，写入config/detector.cfg，采集、管理和识别界面均读取该文件
+# 标注文件与视频同名（.json），格式为{"labels": [[[x, y, w, h], ...], ...]}，每帧一个人脸框列表
+# 未指定片段目录时使用benchmarks/clips下的合成片段，不存在时自动生成
+# 检测耗时与CPU有关，应在实际运行识别程序的机器上调优
+
+cascades = ('haarcascade_frontalface_default.xml', 'haarcascade_frontalface_alt.xml',
+            'haarcascade_frontalface_alt2.xml', 'haarcascade_frontalface_alt_tree.xml')
+videoExtensions = ('.avi', '.mp4', '.mkv', '.mov')
+
+
+# 读取片段目录，返回[(灰度帧, 人脸框列表)]，每隔stride帧取一帧
+def loadLabeledFrames(directory, stride, limit):
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        labelPath = os.path.splitext(path)[0] + '.json'
+        if not name.lower().endswith(videoExtensions) or not os.path.isfile(labelPath):
+            continue
+        with open(labelPath, encoding='utf-8') as file:
+            labels = json.load(file)['labels']
+        cap = cv2.VideoCapture(path)
+        index = 0
+        while index < len(labels):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % stride == 0:
+                samples.append((cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), [tuple(box) for box in labels[index]]))
+            index += 1
+        cap.release()
+    if limit and len(samples) > limit:
+        samples = samples[::-(-len(samples) // limit)]
+    return samples
+
+
+def iou(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    intersection = max(0, x1 - x0) * max(0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / float(union) if union > 0 else 0.0
+
+
+# 按IoU从大到小贪心匹配检测框和标注框，返回匹配数
+def matchCount(detections, labels, threshold):
+    pairs = sorted(((iou(d, l), i, j) for i, d in enumerate(detections) for j, l in enumerate(labels)), reverse=True)
+    usedDetections, usedLabels = set(), set()
+    for overlap, i, j in pairs:
+        if overlap < threshold:
+            break
+        if i not in usedDetections and j not in usedLabels:
+            usedDetections.add(i)
+            usedLabels.add(j)
+    return len(usedLabels)
+
+
+# 评估一组参数，返回召回率、精确率和每帧检测耗时（毫秒）
+def evaluate(detector, samples, iouThreshold):
+    matched = labelCount = detectionCount = 0
+    timings = []
+    for gray, labels in samples:
+        start = time.perf_counter()
+        detections = detector.detect(gray)
+        timings.append((time.perf_counter() - start) * 1000)
+        detections = [tuple(int(v) for v in box) for box in detections]
+        matched += matchCount(detections, labels, iouThreshold)
+        labelCount += len(labels)
+        detectionCount += len(detections)
+    timings.sort()
+    return {
+        'recall': matched / float(labelCount) if labelCount else 0.0,
+        'precision': matched / float(detectionCount) if detectionCount else 1.0,
+        'mean_ms': sum(timings) / len(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+    }
+
+
+# 召回率-耗时的帕累托前沿：不存在召回率不低且耗时更短（其中之一严格更优）的其它参数
+def paretoFront(results):
+    front = []
+    for result in results:
+        dominated = any(other['recall'] >= result['recall'] and other['p95_ms'] <= result['p95_ms'] and
+                        (other['recall'] > result['recall'] or other['p95_ms'] < result['p95_ms'])
+                        for other in results)
+        if not dominated:
+            front.append(result)
+    return sorted(front, key=lambda result: result['p95_ms'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='在带标注的视频片段上调优Haar分类器和检测参数')
+    parser.add_argument('--clips', default=None, help='带标注的视频片段目录，默认使用benchmarks/clips下的合成片段')
+    parser.add_argument('--budget', type=float, required=True, help='每帧检测耗时预算（毫秒，p95）')
+    parser.add_argument('--scale-factors', default='1.05,1.1,1.2,1.3,1.4', help='scaleFactor候选值')
+    parser.add_argument('--min-neighbors', default='3,4,5,6', help='minNeighbors候选值')
+    parser.add_argument('--min-sizes', default='90', help='最小人脸边长候选值')
+    parser.add_argument('--cascades', default=','.join(cascades), help='分类器文件候选值，位于./haarcascades')
+    parser.add_argument('--min-precision', type=float, default=0.9, help='精确率下限，低于该值的参数不会被选中')
+    parser.add_argument('--iou', type=float, default=0.4, help='检测框与标注框匹配的IoU阈值')
+    parser.add_argument('--stride', type=int, default=4, help='每隔多少帧取一帧')
+    parser.add_argument('--max-frames', type=int, default=90, help='最多使用的帧数')
+    parser.add_argument('--output', default='./config/detector.cfg', help='写入的检测参数配置文件')
+    parser.add_argument('--report', default=None, help='保存全部结果的JSON文件')
+    parser.add_argument('--dry-run', action='store_true', help='只输出结果，不写入配置文件')
+    args = parser.parse_args()
+
+    clipDir = args.clips
+    if clipDir is None:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+        from pipelineBench import builtinClipPaths, clipDir
+        builtinClipPaths()
+    samples = loadLabeledFrames(clipDir, args.stride, args.max_frames)
+    if not samples:
+        sys.exit('{}中没有带标注的视频片段'.format(clipDir))
+    print('使用{}帧，{}个人脸标注'.format(len(samples), sum(len(labels) for _, labels in samples)))
+
+    cv2.setNumThreads(1)  # 与识别程序中检测线程的耗时一致，也使结果可复现
+    results = []
+    grid = list(itertools.product(args.cascades.split(','), [float(v) for v in args.scale_factors.split(',')],
+                                  [int(v) for v in args.min_neighbors.split(',')],
+                                  [int(v) for v in args.min_sizes.split(',')]))
+    for index, (cascade, scaleFactor, minNeighbors, minSize) in enumerate(grid, 1):
+        detector = FaceDetector('./haarcascades/' + cascade, scaleFactor, minNeighbors, minSize)
+        if detector.cascadePath != './haarcascades/' + cascade:  # 分类器文件加载失败
+            continue
+        detector.detect(samples[0][0])  # 预热
+        result = evaluate(detector, samples, args.iou)
+        result.update({'cascade': cascade, 'scaleFactor': scaleFactor, 'minNeighbors': minNeighbors,
+                       'minSize': minSize})
+        results.append(result)
+        print('[{}/{}] {:<40} scale={:<5} neighbors={} minSize={:<4} 召回率={:.3f} 精确率={:.3f} '
+              'p95={:.1f}ms'.format(index, len(grid), cascade, scaleFactor, minNeighbors, minSize,
+                                   result['recall'], result['precision'], result['p95_ms']))
+
+    candidates = [result for result in results if result['precision'] >= args.min_precision]
+    front = paretoFront(candidates)
+    print('\n帕累托前沿（精确率≥{}）：'.format(args.min_precision))
+    for result in front:
+        print('  {:<40} scale={:<5} neighbors={} minSize={:<4} 召回率={:.3f} 精确率={:.3f} p95={:.1f}ms'.format(
+            result['cascade'], result['scaleFactor'], result['minNeighbors'], result['minSize'],
+            result['recall'], result['precision'], result['p95_ms']))
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump({'budget': args.budget, 'results': results, 'pareto': front}, file, ensure_ascii=False,
+                      indent=2)
+
+    withinBudget = [result for result in front if result['p95_ms'] <= args.budget]
+    if not withinBudget:
+        sys.exit('没有满足耗时预算{}ms的参数，最快的参数需要{:.1f}ms'.format(
+            args.budget, front[0]['p95_ms'] if front else float('nan')))
+    # 前沿按耗时升序，满足预算的最后一个即召回率最高者
+    best = withinBudget[-1]
+    print('\n选择：{} scale={} neighbors={} minSize={}，召回率{:.3f}，精确率{:.3f}，p95耗时{:.1f}ms'.format(
+        best['cascade'], best['scaleFactor'], best['minNeighbors'], best['minSize'], best['recall'],
+        best['precision'], best['p95_ms']))
+    if not args.dry_run:
+        FaceDetector('./haarcascades/' + best['cascade'], best['scaleFactor'], best['minNeighbors'],
+                     best['minSize']).save(args.output, [
+            '人脸检测参数，采集、管理和识别界面共用',
+            '由cascadeTuner.py于{}生成：耗时预算{}ms，{}帧'.format(
+                datetime.now().strftime('%Y-%m-%d %H:%M:%S'), args.budget, len(samples)),
+            '召回率{:.3f}，精确率{:.3f}，每帧检测耗时p95 {:.1f}ms'.format(
+                best['recall'], best['precision'], best['p95_ms']),
+        ])
+        print('已写入{}，重新打开各界面后生效'.format(args.output))
@@ -3,25 +3,37 @@ import logging.config
 import multiprocessing
 import os
 import queue
-import sqlite3
 import sys
 import threading
-import webbrowser
-import winsound
+import time
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 from datetime import datetime
-from tkinter import Image
+
+from startup import StartupTimer, optionalModule
+
+startupTimer = StartupTimer()  # 启动耗时统计，从导入依赖开始计时
 
 import cv2
-import dlib
 import numpy
-import telegram
-from PyQt5.QtCore import pyqtSignal, QThread, QTimer, Qt, QRegExp
-from PyQt5.QtGui import QIcon, QImage, QPixmap, QRegExpValidator, QTextCursor
-from PyQt5.QtWidgets import QMainWindow, QApplication, QMessageBox, QDialog
+from PyQt5.QtCore import QThread, QTimer, Qt, QRegExp
+from PyQt5.QtGui import QIcon, QImage, QPixmap, QRegExpValidator, QKeySequence
+from PyQt5.QtWidgets import QMainWindow, QApplication, QMessageBox, QDialog, QLabel, QShortcut
 from PyQt5.uic import loadUi
-from PyQt5.uic.properties import QtGui
-from PIL import Image, ImageDraw, ImageFont
+
+from faceDatabase import FaceDatabase
+from faceDetector import FaceDetector
+from facePreprocess import FacePreprocessor
+from faceQuality import FaceQualityGate
+from frameScheduler import FrameScheduler, RecognitionCache
+from pipelineMetrics import PipelineMetrics
+from logView import LogThrottle, LogView
+from recognizerWatcher import TrainingDataWatcher
+from traceRecorder import TraceRecorder
+
+# dlib、telegram、PIL、winsound和webbrowser在第一次使用时才导入：
+# 这些依赖导入较慢，或者只在部分系统上可用（winsound只存在于Windows），不应影响程序启动
+startupTimer.mark('导入依赖')
 
 
 class TrainingDataNotFoundError(FileNotFoundError):  # 训练数据没有找到错误
@@ -43,11 +55,61 @@ class FaceProcessingThread(QThread):
         self.isPanalarmEnabled = True  # 是否允许进行报警
 
         self.isDebugMode = False  # 是否处于Debug模式
+        self.debugLogThrottle = LogThrottle.fromConfig()  # Debug日志限流，避免每帧每张人脸的日志占满日志队列
         self.confidenceThreshold = 50  # 置信度阈值
         self.autoAlarmThreshold = 65  # 自动报警阈值
 
         self.isEqualizeHistEnabled = False  # 是否允许进行直方图均衡化
 
+        # 读取人脸识别配置
+        cfg = ConfigParser()
+        cfg.read('./config/recognizer.cfg', encoding='utf-8-sig')
+        self.recognitionMargin = cfg.getfloat('recognizer', 'margin', fallback=0)  # 最优与次优用户的最小距离差
+        self.preprocessor = FacePreprocessor.fromConfig()  # 人脸预处理，与训练时一致
+        self.faceQualityGate = FaceQualityGate.fromConfig()  # 人脸质量门控
+        # 同一帧多张人脸并行识别的线程池，OpenCV和NumPy在计算时会释放GIL
+        workers = cfg.getint('recognizer', 'workers', fallback=4)
+        self.recognitionExecutor = ThreadPoolExecutor(max_workers=workers,
+                                                      thread_name_prefix='Recognition') if workers > 1 else None
+        self.qualityReportInterval = cfg.getint('quality', 'report_interval', fallback=60)  # 跳过率报告间隔（秒）
+        self.metrics = PipelineMetrics.fromConfig()  # 各阶段耗时统计
+        self.scheduler = FrameScheduler.fromConfig()  # 按帧耗时预算逐级减少工作量
+        if CoreUI.traceRecorder.enabled:
+            self.metrics.tracer = CoreUI.traceRecorder  # 各阶段同时记录到trace环形缓冲区
+
+        self.trainingDataWatcher = TrainingDataWatcher.fromConfig(logQueue=CoreUI.logQueue)  # 训练数据热加载线程
+
+        self.faceDetector = None  # 人脸检测器，由warmUp加载
+        self.dlib = None  # 人脸跟踪使用的dlib模块，未安装时为None
+        self.isWarmedUp = threading.Event()  # 后台预热是否完成
+
+    # 后台预热：在窗口显示后加载人脸检测器、dlib、识别模型并预热数据库，避免打开摄像头后的前几帧出现延迟尖峰
+    def warmUp(self, startupTimer):
+        try:
+            with startupTimer.measure('导入dlib'):
+                self.dlib = optionalModule('dlib')
+                if self.dlib is None:
+                    CoreUI.logQueue.put('Warning：未安装dlib，人脸跟踪不可用')
+            with startupTimer.measure('加载人脸检测器'):
+                self.faceDetector = FaceDetector.fromConfig()
+                self.faceDetector.detect(numpy.zeros((480, 640), dtype=numpy.uint8))  # 第一次检测时分配内部缓冲区
+            with startupTimer.measure('加载识别模型'):
+                self.trainingDataWatcher.check()  # 在当前线程完成第一次加载，随后由热加载线程继续监视
+                recognizer = self.trainingDataWatcher.recognizer
+                if recognizer is not None:
+                    # 预测一次，使内存映射的人脸库换入内存
+                    recognizer.predict(numpy.zeros((self.preprocessor.height, self.preprocessor.width),
+                                                   dtype=numpy.uint8))
+                if not self.trainingDataWatcher.is_alive():
+                    self.trainingDataWatcher.start()
+            with startupTimer.measure('数据库预热'):
+                if CoreUI.faceDatabase.exists():
+                    CoreUI.faceDatabase.userCount()  # 读取用户表和索引页，使其进入操作系统缓存
+        except Exception as e:
+            logging.error('后台预热失败：{}'.format(e))
+        finally:
+            self.isWarmedUp.set()
+
     # 是否开启人脸跟踪，人脸跟踪CheckBox点击事件
     def enableFaceTracker(self, coreUI):
         if coreUI.faceTrackerCheckBox.isChecked():
@@ -111,8 +173,10 @@ class FaceProcessingThread(QThread):
             coreUI.statusBar().showMessage('直方图均衡化：关闭')
 
     def run(self):
-        # 加载OpenCV官方人脸分类器
-        faceCascade = cv2.CascadeClassifier('./haarcascades/haarcascade_frontalface_default.xml')
+        # 等待后台预热完成，人脸检测器的分类器和检测参数见config/detector.cfg
+        self.isWarmedUp.wait()
+        faceDetector = self.faceDetector or FaceDetector.fromConfig()
+        dlib = self.dlib
 
         # 帧数,人脸ID初始化
         frameCounter = 0  # 帧数
@@ -121,35 +185,52 @@ class FaceProcessingThread(QThread):
         # 人脸跟踪器字典初始化,每个键值对均为一个人脸跟踪器
         faceTrackers = {}
 
-        isTrainingDataLoaded = False  # 训练数据是否已经加载
+        # 启动训练数据热加载线程，重新训练后无需重启程序
+        if not self.trainingDataWatcher.is_alive():
+            self.trainingDataWatcher.start()
+
         isDbConnected = False  # 数据库是否连接成功
+        lastQualityReport = time.time()  # 上一次报告质量门控跳过率的时间
+        recognitionCache = RecognitionCache(self.scheduler.reuseFrames)  # 最近的识别结果，负载过高时沿用
 
         while self.isRunning:  # 当程序正在运行
             if CoreUI.cap.isOpened():  # 如果相机已经打开
+                self.metrics.beginFrame()
+                # 跳帧级别下丢弃积压的画面，只处理最新的画面
+                for _ in range(self.scheduler.dropCount()):
+                    CoreUI.cap.grab()
                 ret, frame = CoreUI.cap.read()  # 尝试读取一张图片
+                self.metrics.lap('capture')
                 gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # 将图片转换为灰度图
 
                 # 是否进行直方图均衡化
                 if self.isEqualizeHistEnabled:  # 如果允许进行直方图均衡化
                     gray = cv2.equalizeHist(gray)  # 进行直方图均衡化
+                self.metrics.lap('preprocess')
+
+                # 仅跟踪帧不检测人脸，只更新跟踪器；降低检测分辨率时在缩小的灰度图上检测，再换算回原图坐标
+                isDetectFrame = self.scheduler.isDetectFrame()
+                scale = self.scheduler.scale()
+                if not isDetectFrame:
+                    faces = ()
+                elif scale < 1:
+                    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                    faces = [tuple(int(round(v / scale)) for v in rect) for rect in faceDetector.detect(small, scale)]
+                else:
+                    faces = faceDetector.detect(gray)  # 检测人脸
+                self.metrics.lap('detect')
 
-                faces = faceCascade.detectMultiScale(gray, 1.3, 5, minSize=(90, 90))  # 检测人脸
-
-                # 预加载数据文件
-                if not isTrainingDataLoaded and os.path.isfile(CoreUI.trainingData):
-                    recognizer = cv2.face.LBPHFaceRecognizer_create()  # 创建人脸分类器
-                    recognizer.read(CoreUI.trainingData)  # 加载已经读取好的数据模型
-                    isTrainingDataLoaded = True  # 训练数据模型读取完毕
+                # 每帧开始时获取当前模型，模型只在帧与帧之间替换
+                recognizer = self.trainingDataWatcher.recognizer
 
-                # 连接数据库
-                if not isDbConnected and os.path.isfile(CoreUI.database):
-                    conn = sqlite3.connect(CoreUI.database)
-                    cursor = conn.cursor()
+                # 数据库文件存在后才查询，避免创建空数据库
+                if not isDbConnected and CoreUI.faceDatabase.exists():
                     isDbConnected = True
 
                 captureData = {}  # 照片数据
                 realTimeFrame = frame.copy()  # 真实图片
                 alarmSignal = {}  # 报警信号
+                recognitions = []  # 每张人脸的识别结果
 
                 # 人脸跟踪
                 if self.isFaceTrackerEnabled:  # 如果允许进行人脸跟踪
@@ -166,35 +247,77 @@ class FaceProcessingThread(QThread):
                     # 删除跟踪质量过低的人脸跟踪器
                     for fid in fidsToDelete:
                         faceTrackers.pop(fid, None)
-
-                    for _x, _y, _w, _h in faces:  # 对于OpenCV检测到的人脸
+                    self.metrics.lap('tracker')
+
+                    # 先对所有人脸完成预处理和质量检查，再把需要识别的人脸分发到线程池并行识别
+                    recognitions = [None] * len(faces)  # 每张人脸的识别结果，None表示未识别
+                    if self.isFaceRecognizerEnabled and recognizer is not None:  # 如果允许进行人脸识别且模型已加载
+                        jobs = []
+                        frameIndex = self.scheduler.frameIndex
+                        recognizedAt = [frameIndex] * len(faces)  # 每张人脸的识别结果来自哪一帧
+                        for index, (_x, _y, _w, _h) in enumerate(faces):
+                            # 负载过高时，与最近识别过的人脸位置重合的人脸沿用识别结果，不再重复识别
+                            if self.scheduler.isReuseEnabled():
+                                cached = recognitionCache.lookup((_x, _y, _w, _h), frameIndex)
+                                if cached is not None:
+                                    recognitions[index], recognizedAt[index] = cached
+                                    continue
+                            face = self.preprocessor.normalize(gray, (_x, _y, _w, _h))  # 截取人脸并缩放到标准尺寸
+                            if face is None:
+                                continue
+                            # 人脸质量不佳时跳过识别，等待同一人脸质量更好的帧
+                            skipReason = self.faceQualityGate.check(face, _w, _h)
+                            if skipReason is not None:
+                                logging.debug('人脸质量不佳（{}），跳过识别'.format(skipReason))
+                            else:
+                                jobs.append((index, face))
+
+                        # map按提交顺序返回结果，保证输出顺序与检测顺序一致
+                        if len(jobs) > 1 and self.recognitionExecutor is not None:
+                            results = self.recognitionExecutor.map(
+                                lambda job: self.recognizeFace(recognizer, job[1]), jobs)
+                        else:
+                            results = [self.recognizeFace(recognizer, face) for _, face in jobs]
+                        for (index, _), result in zip(jobs, results):
+                            recognitions[index] = result
+                        if isDetectFrame:
+                            recognitionCache.update([(tuple(int(v) for v in rect), result, at) for rect, result, at
+                                                     in zip(faces, recognitions, recognizedAt) if result is not None])
+                    self.metrics.lap('predict')
+
+                    for index, (_x, _y, _w, _h) in enumerate(faces):  # 对于OpenCV检测到的人脸
                         isKnown = False  # 默认是陌生人
 
-                        if self.isFaceRecognizerEnabled:  # 如果允许进行人脸识别
+                        if self.isFaceRecognizerEnabled and recognizer is not None:  # 如果允许进行人脸识别且模型已加载
                             cv2.rectangle(realTimeFrame, (_x, _y), (_x + _w, _y + _h), (2323, 138, 30), 2)  # 绘制人脸区域
-                            face_id, confidence = recognizer.predict(gray[_y:_y + _h, _x:_x + _w])  # 对人脸进行预测获得人脸ID和置信度
+
+                        if recognitions[index] is not None:  # 该人脸已完成识别
+                            face_id, confidence, isAmbiguous = recognitions[index]
                             logging.debug('face_id：{}，confidence：{}'.format(face_id, confidence))
 
-                            if self.isDebugMode:  # 如果处于debug模式
-                                CoreUI.logQueue.put('Debug -> face_id：{}，confidence：{}'.format(face_id, confidence))
+                            if self.isDebugMode:  # 如果处于debug模式，每帧每张人脸一条，先限流再写入日志队列
+                                for message in self.debugLogThrottle.submit(
+                                        'Debug -> face_id：{}，confidence：{}'.format(face_id, confidence)):
+                                    CoreUI.logQueue.put(message)
 
                             # 从数据库中获取识别人脸的身份信息
 
                             try:
-                                cursor.execute('SELECT * FROM users WHERE face_id=?', (face_id,))  # 尝试在数据库中获取该人脸信息
-                                result = cursor.fetchall()
+                                # 尝试在数据库中获取该人脸信息
+                                result = CoreUI.faceDatabase.getUserByFaceID(face_id) if isDbConnected else None
                                 if result:
-                                    en_name = result[0][3]  # 获取该face_id对应的英文名
-                                    cn_name = result[0][2]  # 获取该face_id对应的中文名
+                                    en_name = result[3]  # 获取该face_id对应的英文名
+                                    cn_name = result[2]  # 获取该face_id对应的中文名
                                 else:
                                     raise Exception
                             except Exception as e:
                                 logging.error('读取数据库异常，系统无法获取Face ID为{}的身份信息'.format(face_id))
                                 CoreUI.logQueue.put('Error：读取数据库异常，系统无法获取Face ID为{}的身份信息'.format(face_id))
                                 en_name = ''
+                            self.metrics.lap('database')
 
                             # 若置信度评分小于置信度阈值，认为是可靠识别
-                            if confidence < self.confidenceThreshold:
+                            if confidence < self.confidenceThreshold and not isAmbiguous:
                                 isKnown = True  # 该身份在数据库中已存在
                                 cv2.putText(realTimeFrame, en_name, (_x - 5, _y - 10), cv2.FONT_HERSHEY_SCRIPT_SIMPLEX,
                                             1,
@@ -215,7 +338,9 @@ class FaceProcessingThread(QThread):
                                         alarmSignal['timestamp'] = datetime.now().strftime('%Y%m%d%H%M%S')
                                         alarmSignal['img'] = realTimeFrame
                                         CoreUI.alarmQueue.put(alarmSignal)
+                                        CoreUI.traceRecorder.instant('alarm signal', 'alarm')
                                         logging.info('系统发出了报警信号')
+                            self.metrics.lap('annotate')
 
                         # 帧数自增
                         frameCounter += 1
@@ -258,7 +383,7 @@ class FaceProcessingThread(QThread):
                                     matchedFid = fid
 
                             # 如果当前检测到的人脸是陌生人脸且未被跟踪
-                            if not isKnown and matchedFid is None:
+                            if not isKnown and matchedFid is None and dlib is not None:
                                 # 创建一个人脸跟踪器
                                 tracker = dlib.correlation_tracker()
                                 # 锁定跟踪范围
@@ -267,6 +392,8 @@ class FaceProcessingThread(QThread):
                                 faceTrackers[currentFaceID] = tracker
                                 # 人脸ID自增
                                 currentFaceID += 1
+                        # 每张人脸都结束关联阶段，关联和创建跟踪器的耗时不会计入下一张人脸的阶段
+                        self.metrics.lap('association')
 
                     # 使用当前的人脸跟踪器，更新画面，输出跟踪结果
                     for fid in faceTrackers.keys():
@@ -281,15 +408,47 @@ class FaceProcessingThread(QThread):
                         cv2.rectangle(realTimeFrame, (t_x, t_y), (t_x + t_w, t_y + t_h), (0, 0, 255), 2)
                         cv2.putText(realTimeFrame, 'tracking...', (15, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255),
                                     2)
+                    self.metrics.lap('annotate')
+
+                # 定期报告质量门控跳过率，即节省的predict调用次数
+                if time.time() - lastQualityReport >= self.qualityReportInterval:
+                    lastQualityReport = time.time()
+                    if self.faceQualityGate.checkedCount:
+                        logging.info(self.faceQualityGate.report())
+                        CoreUI.logQueue.put('Info：' + self.faceQualityGate.report())
+                    if self.scheduler.levelFrames[0] < sum(self.scheduler.levelFrames):  # 出现过降级
+                        logging.info(self.scheduler.report())
+                        CoreUI.logQueue.put('Info：' + self.scheduler.report())
 
                 captureData['originFrame'] = frame
                 captureData['realTimeFrame'] = realTimeFrame
-                CoreUI.captureQueue.put(captureData)
+                # 界面来不及显示时丢弃最旧的画面，显示的始终是最新的画面
+                while True:
+                    try:
+                        CoreUI.captureQueue.put_nowait(captureData)
+                        break
+                    except queue.Full:
+                        try:
+                            CoreUI.captureQueue.get_nowait()
+                        except queue.Empty:
+                            pass
+                if CoreUI.frameStream is not None:
+                    CoreUI.frameStream.publish(realTimeFrame)  # 只保存画面引用，由推流线程按各路帧率编码
+                self.metrics.lap('queue')
+                frameSeconds = self.metrics.endFrame(len(faces), sum(result is not None for result in recognitions),
+                                                     len(faceTrackers), self.scheduler.level)
+
+                # 按本帧耗时调整处理级别
+                change = self.scheduler.update(frameSeconds)
+                if change is not None:
+                    logging.warning(self.scheduler.describe(change))
+                    CoreUI.logQueue.put('Warning：' + self.scheduler.describe(change))
 
             else:
                 continue
 
     def cv2ImgAddText(self, img, text, left, top, textColor=(0, 255, 0), textSize=20):
+        from PIL import Image, ImageDraw, ImageFont
         if (isinstance(img, numpy.ndarray)):  # 判断是否OpenCV图片类型
             img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
         # 创建一个可以在给定图像上绘图的对象
@@ -302,8 +461,21 @@ class FaceProcessingThread(QThread):
         # 转换回OpenCV格式
         return cv2.cvtColor(numpy.asarray(img), cv2.COLOR_RGB2BGR)
 
+    # 识别一张人脸，返回人脸ID、置信度以及最优与次优用户是否难以区分，可在线程池中并行调用
+    def recognizeFace(self, recognizer, face):
+        if self.recognitionMargin > 0 and hasattr(recognizer, 'match'):
+            # 获取最近的两个用户，距离差小于设定值时不认为是可靠识别
+            candidates = recognizer.match(face, 2)
+            face_id, confidence = candidates[0] if candidates else (-1, float('inf'))
+            return face_id, confidence, len(candidates) > 1 and candidates[1][1] - confidence < self.recognitionMargin
+        face_id, confidence = recognizer.predict(face)  # 对人脸进行预测获得人脸ID和置信度
+        return face_id, confidence, False
+
     def stop(self):
         self.isRunning = False
+        self.trainingDataWatcher.stop()
+        if self.recognitionExecutor is not None:
+            self.recognitionExecutor.shutdown(wait=False)
         self.quit()
         self.wait()
 
@@ -361,6 +533,10 @@ class TelegramBotDialog(QDialog):
 
     # TelegramBot 测试是否连接成功
     def telegramBotTest(self, token, proxy_url):
+        telegram = optionalModule('telegram')
+        if telegram is None:
+            CoreUI.logQueue.put('Error：未安装python-telegram-bot，无法使用TelegramBot')
+            return False
         try:
             # 是否使用代理
             if proxy_url:
@@ -378,13 +554,16 @@ class TelegramBotDialog(QDialog):
 # CoreUI实现类
 class CoreUI(QMainWindow):
     database = './FaceBase.db'  # 数据库位置
-    trainingData = './recognizer/trainingData.yml'  # 训练数据模型位置
+    faceDatabase = FaceDatabase(database)  # 数据库访问，各线程复用自己的连接
 
     cap = cv2.VideoCapture()  # OpenCV
-    captureQueue = queue.Queue()  # 图像队列
+    captureQueue = queue.Queue(maxsize=2)  # 图像队列，只保留最新的画面
     alarmQueue = queue.LifoQueue()  # 报警队列，后进先出
+    traceRecorder = TraceRecorder.fromConfig()  # 检测线程和报警流程的trace记录器，默认关闭
+    # 标注后画面的MJPEG推流，默认关闭；推流模块可选，无法导入时不影响启动
+    frameStreamModule = optionalModule('frameStream')
+    frameStream = frameStreamModule.FrameStreamServer.fromConfig() if frameStreamModule else None
     logQueue = multiprocessing.Queue()  # 日志队列
-    receiveLogSignal = pyqtSignal(str)  # log信号
 
     def __init__(self):
         super(CoreUI, self).__init__()
@@ -392,6 +571,7 @@ class CoreUI(QMainWindow):
         loadUi('./ui/Core.ui', self)
         self.setWindowIcon(QIcon('./icons/icon.png'))
         self.setFixedSize(1161, 623)
+        startupTimer.mark('加载界面')
 
         # 图像捕获
         self.isExternalCameraUsed = False  # 是否使用外部摄像头
@@ -451,13 +631,57 @@ class CoreUI(QMainWindow):
 
         # 帮助与支持
         self.viewGithubRepoButton.clicked.connect(
-            lambda: webbrowser.open('https://github.com/wangjunhao999/Face_Detection'))  # 设置Github仓库按钮点击事件
-        self.contactDeveloperButton.clicked.connect(lambda: webbrowser.open('http://www.nicomoe.cn'))  # 设置联系开发者按钮点击事件
+            lambda: self.openUrl('https://github.com/wangjunhao999/Face_Detection'))  # 设置Github仓库按钮点击事件
+        self.contactDeveloperButton.clicked.connect(lambda: self.openUrl('http://www.nicomoe.cn'))  # 设置联系开发者按钮点击事件
+
+        # 性能统计，在状态栏显示帧率和主要阶段耗时，鼠标悬停显示各阶段详情，并定期导出Prometheus文本文件
+        cfg = ConfigParser()
+        cfg.read('./config/recognizer.cfg', encoding='utf-8-sig')
+        self.metricsExportPath = cfg.get('metrics', 'export_path', fallback='./metrics/face_pipeline.prom')
+        self.metricsExportInterval = cfg.getint('metrics', 'export_interval', fallback=10)  # 导出间隔（秒），0表示不导出
+        self.lastMetricsExport = time.time()
+        self.metricsLabel = QLabel()
+        self.statusBar().addPermanentWidget(self.metricsLabel)
+        self.metricsTimer = QTimer(self)
+        self.metricsTimer.timeout.connect(self.updateMetrics)
+        self.metricsTimer.start(1000)
+
+        # 开启trace记录时，Ctrl+Shift+T导出最近的trace事件
+        if self.traceRecorder.enabled:
+            self.traceShortcut = QShortcut(QKeySequence('Ctrl+Shift+T'), self)
+            self.traceShortcut.activated.connect(self.dumpTrace)
+
+        # 开启推流时，远程人员可通过浏览器观看标注后的画面
+        try:
+            if self.frameStream is not None:
+                self.frameStream.start()
+        except OSError as e:
+            logging.error('无法启动MJPEG推流：{}'.format(e))
+            self.logQueue.put('Error：无法启动MJPEG推流，端口{}可能已被占用'.format(self.frameStream.port))
 
         # 日志系统
-        self.receiveLogSignal.connect(lambda log: self.logOutput(log))  # 绑定receiveLogSignal信号到logOutput处理函数
-        self.logOutputThread = threading.Thread(target=self.receiveLog, daemon=True)  # 定义日志后台打印线程
-        self.logOutputThread.start()  # 启动日志后台打印线程
+        self.logView = LogView.fromConfig(self.logTextEdit, self.logQueue)  # 日志按固定间隔批量输出，相似日志限流
+        startupTimer.mark('初始化')
+
+        # 窗口显示后在后台预热人脸检测器、识别模型和数据库
+        QTimer.singleShot(0, self.startWarmUp)
+
+    # 启动后台预热，完成后输出启动耗时报告
+    def startWarmUp(self):
+        startupTimer.ready()
+
+        def warmUp():
+            self.faceProcessingThread.warmUp(startupTimer)
+            logging.info(startupTimer.report())
+            self.logQueue.put('Info：' + startupTimer.report())
+
+        threading.Thread(target=warmUp, name='WarmUp', daemon=True).start()
+
+    # 在浏览器中打开链接
+    @staticmethod
+    def openUrl(url):
+        import webbrowser
+        webbrowser.open(url)
 
     # 使用外接摄像头CheckBox按钮事件
     def useExternalCamera(self, useExternalCameraCheckBox):
@@ -519,12 +743,7 @@ class CoreUI(QMainWindow):
             if not os.path.isfile(self.trainingData):  # 如果训练数据模型不存在
                 raise TrainingDataNotFoundError  # 抛出训练数据模型没有找到异常
 
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-
-            cursor.execute('SELECT COUNT(*) FROM users')  # 在数据库中查询用户样本数
-            result = cursor.fetchone()
-            dbUserCount = result[0]
+            dbUserCount = self.faceDatabase.userCount()  # 在数据库中查询用户样本数
         except DataBaseNotFoundError:
             logging.error('系统找不到数据库文件{}'.format(self.database))
             self.initDbButton.setIcon(QIcon('./icons/error.png'))
@@ -538,8 +757,6 @@ class CoreUI(QMainWindow):
             self.initDbButton.setIcon(QIcon('./icons/error.png'))
             self.logQueue.put('Error：读取数据库异常，初始化数据库失败')
         else:
-            cursor.close()
-            conn.close()
             if not dbUserCount > 0:  # 如果数据库没有样本
                 logging.warning('数据库为空')
                 self.logQueue.put('warning：数据库为空，人脸识别功能不可用')
@@ -559,6 +776,31 @@ class CoreUI(QMainWindow):
                 realTimeFrame = captureData.get('realTimeFrame')  # 获得实时图片
                 self.displayImage(realTimeFrame, self.realTimeCaptureLabel)  # 展示图片
 
+    # 性能统计定时器事件，刷新状态栏并定期导出
+    def updateMetrics(self):
+        metrics = self.faceProcessingThread.metrics
+        if not metrics.counters['frames']:  # 人脸检测线程尚未处理任何一帧
+            return
+        self.metricsLabel.setText(metrics.summary())
+        self.metricsLabel.setToolTip(metrics.details())
+        if self.metricsExportInterval > 0 and time.time() - self.lastMetricsExport >= self.metricsExportInterval:
+            self.lastMetricsExport = time.time()
+            try:
+                metrics.writePrometheus(self.metricsExportPath)
+            except Exception as e:
+                logging.error('无法写入性能统计文件{}：{}'.format(self.metricsExportPath, e))
+
+    # 导出trace文件，可在chrome://tracing或Perfetto中查看
+    def dumpTrace(self):
+        try:
+            path = self.traceRecorder.dump()
+        except Exception as e:
+            logging.error('无法导出trace文件：{}'.format(e))
+            self.logQueue.put('Error：无法导出trace文件')
+        else:
+            logging.info('trace文件已导出：{}'.format(path))
+            self.logQueue.put('Success：trace文件已导出到{}'.format(path))
+
     # 展示图片，updateFrame调用子程序
     def displayImage(self, img, qlabel):
         # BGR -> RGB
@@ -598,7 +840,9 @@ class CoreUI(QMainWindow):
                 timestamp = lastAlarmSignal.get('timestamp')  # 获取报警信号时间戳
                 img = lastAlarmSignal.get('img')  # 获取报警信号图片
                 # 疑似陌生人脸，截屏存档
+                alarmStart = time.perf_counter()
                 cv2.imwrite('./unknown/{}.jpg'.format(timestamp), img)  # 将陌生人脸保存到unknown文件夹
+                CoreUI.traceRecorder.span('snapshot', alarmStart, time.perf_counter(), 'alarm')
                 logging.info('报警信号触发超出预设计数，自动报警系统已被激活')
                 self.logQueue.put('Info：报警信号触发超出预设计数，自动报警系统已被激活')
 
@@ -606,7 +850,7 @@ class CoreUI(QMainWindow):
                 if self.isBellEnabled:  # 如果可以进行响铃
                     p1 = multiprocessing.Process(target=CoreUI.bellProcess, args=(self.logQueue,))  # 定义设备响铃进程
                     p1.start()  # 启动进程
-                    jobs.append(p1)  # 将进程保存到jobs里面进行管理
+                    jobs.append(('bell', p1, time.perf_counter()))  # 将进程保存到jobs里面进行管理
 
                 # 是否进行TelegramBot推送
                 if self.isTelegramBotPushEnabled:
@@ -617,11 +861,14 @@ class CoreUI(QMainWindow):
                     p2 = multiprocessing.Process(target=CoreUI.telegramBotPushProcess,
                                                  args=(self.logQueue, img))  # 定义TelegramBot推送进程
                     p2.start()  # 启动TelegramBot推送进程
-                    jobs.append(p2)  # 将进程保存到jobs里面进行管理
+                    jobs.append(('telegram', p2, time.perf_counter()))  # 将进程保存到jobs里面进行管理
 
-                # 等待本轮报警结束
-                for p in jobs:
+                # 等待本轮报警结束，记录各通知进程从启动到结束的耗时
+                for name, p, started in jobs:
                     p.join()
+                    CoreUI.traceRecorder.span(name, started, time.perf_counter(), 'alarm')
+                CoreUI.traceRecorder.span('alarm', alarmStart, time.perf_counter(), 'alarm',
+                                          {'timestamp': timestamp, 'notifications': len(jobs)})
 
                 # 重置报警信号
                 with self.alarmQueue.mutex:
@@ -687,6 +934,10 @@ class CoreUI(QMainWindow):
     @staticmethod
     def bellProcess(queue):
         logQueue = queue
+        winsound = optionalModule('winsound')
+        if winsound is None:
+            logQueue.put('Warning：当前系统不支持设备响铃')
+            return
         logQueue.put('Info：设备正在响铃...')
         winsound.PlaySound('./alarm.wav', winsound.SND_FILENAME)
 
@@ -694,6 +945,10 @@ class CoreUI(QMainWindow):
     @staticmethod
     def telegramBotPushProcess(queue, img=None):
         logQueue = queue
+        telegram = optionalModule('telegram')
+        if telegram is None:
+            logQueue.put('Error：未安装python-telegram-bot，TelegramBot推送失败')
+            return
         cfg = ConfigParser()
         try:
             cfg.read('./config/telegramBot.cfg', encoding='utf-8-sig')
@@ -722,24 +977,6 @@ class CoreUI(QMainWindow):
         else:
             logQueue.put('Success：TelegramBot推送成功')
 
-    # LOG输出，receiveLogSignal信号处理函数
-    def logOutput(self, log):
-        time = datetime.now().strftime('[%Y/%m/%d %H:%M:%S]')
-        log = time + ' ' + log + '\n'
-
-        self.logTextEdit.moveCursor(QTextCursor.End)
-        self.logTextEdit.insertPlainText(log)
-        self.logTextEdit.ensureCursorVisible()  # 自动滚屏
-
-    # 系统日志服务常驻，接收并处理系统日志
-    def receiveLog(self):
-        while True:
-            data = self.logQueue.get()
-            if data:
-                self.receiveLogSignal.emit(data)
-            else:
-                continue
-
     @staticmethod
     def callDialog(icon, text, informativeText, standardButtons, defaultButton=None):
         msg = QMessageBox()
@@ -760,12 +997,15 @@ class CoreUI(QMainWindow):
             self.timer.stop()
         if self.cap.isOpened():
             self.cap.release()
+        if self.frameStream is not None:
+            self.frameStream.stop()
         event.accept()
 
 
 if __name__ == '__main__':
     logging.config.fileConfig('./config/logging.cfg')
     app = QApplication(sys.argv)
+    startupTimer.mark('创建QApplication')
     window = CoreUI()
     window.show()
     sys.exit(app.exec_())
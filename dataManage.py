@@ -3,27 +3,106 @@ import logging.config
 import multiprocessing
 import os
 import shutil
-import sqlite3
 import sys
-import threading
-from datetime import datetime
+import time
+from collections import OrderedDict
+from configparser import ConfigParser
 
 import cv2
 import numpy as np
-from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtGui import QIcon, QTextCursor
-from PyQt5.QtWidgets import QWidget, QAbstractItemView, QTableWidgetItem, QApplication, QMessageBox
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QIcon
+from PyQt5.QtWidgets import QWidget, QAbstractItemView, QApplication, QMessageBox
 from PyQt5.uic import loadUi
 
+from faceDatabase import FaceDatabase
+from faceDedup import SampleDeduplicator
+from faceDetector import FaceDetector
+from faceGallery import GalleryStore, galleryFromRecognizer, saveGallery, saveShards
+from facePreprocess import FacePreprocessor
+from logView import LogView
+
 
 # 记录没有找到异常
 class RecordNotFound(Exception):
     pass
 
 
+# 用户表格数据模型，表格滚动时按页从数据库读取，只在内存中保留最近访问的若干页
+# 搜索时改为显示搜索结果，刷新后恢复显示全部用户
+class UserTableModel(QAbstractTableModel):
+    headers = ('学号', 'Face ID', '姓名', '汉语拼音', '注册时间')
+
+    def __init__(self, faceDatabase, pageSize=200, maxPages=10):
+        super(UserTableModel, self).__init__()
+        self.faceDatabase = faceDatabase
+        self.pageSize = pageSize  # 每页的行数
+        self.maxPages = maxPages  # 内存中最多保留的页数
+        self.pages = OrderedDict()  # 页号 -> 该页的记录，按最近访问排序
+        self.userCount = 0  # 用户总数
+        self.searchResults = None  # 搜索结果，None表示显示全部用户
+
+    # 重新读取用户总数并清空缓存的页
+    def refresh(self):
+        self.beginResetModel()
+        self.pages.clear()
+        self.searchResults = None
+        self.userCount = self.faceDatabase.userCount()
+        self.endResetModel()
+        return self.userCount
+
+    # 显示搜索结果
+    def showSearchResults(self, rows):
+        self.beginResetModel()
+        self.searchResults = rows
+        self.endResetModel()
+
+    # 获取某一行的完整记录
+    def user(self, row):
+        if self.searchResults is not None:
+            return self.searchResults[row]
+        rows = self.page(row // self.pageSize)
+        offset = row % self.pageSize
+        return rows[offset] if offset < len(rows) else None  # 刷新后数据库中的用户可能已被删除
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.userCount if self.searchResults is None else len(self.searchResults)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return super(UserTableModel, self).headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        user = self.user(index.row())
+        return None if user is None else str(user[index.column()])
+
+    # 获取一页记录，不在缓存中时从数据库读取，并淘汰最久未访问的页
+    def page(self, number):
+        rows = self.pages.get(number)
+        if rows is None:
+            try:
+                rows = self.faceDatabase.usersPage(number * self.pageSize, self.pageSize)
+            except Exception as e:
+                logging.error('读取数据库异常，无法读取第{}页用户'.format(number))
+                return []
+            self.pages[number] = rows
+            if len(self.pages) > self.maxPages:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(number)
+        return rows
+
+
 class DataManageUI(QWidget):
     logQueue = multiprocessing.Queue()  # 日志队列
-    receiveLogSignal = pyqtSignal(str)  # 日志信号
 
     def __init__(self):
         super(DataManageUI, self).__init__()
@@ -32,17 +111,28 @@ class DataManageUI(QWidget):
         self.setWindowIcon(QIcon('./icons/icon.png'))
         self.setFixedSize(931, 577)
 
-        # 设置tableWidget只读，不允许修改
-        self.tableWidget.setEditTriggers(QAbstractItemView.NoEditTriggers)
-
         # 数据库
         self.database = './FaceBase.db'  # 数据库地址
+        self.faceDatabase = FaceDatabase(self.database)  # 数据库访问
+
+        # 用户表格，只读，滚动时按需加载
+        self.userTableModel = UserTableModel(self.faceDatabase)
+        self.tableView.setModel(self.userTableModel)
+        self.tableView.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tableView.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tableView.clicked.connect(self.selectUser)  # 点击表格中的用户，显示该用户信息
         self.datasets = './datasets'  # 数据集地址
+        self.galleryStore = GalleryStore('./recognizer/gallery')  # 按用户分段的人脸库
+        # 识别后端，只有store和auto后端使用分段人脸库，删除用户后识别端才会自动同步
+        cfg = ConfigParser()
+        cfg.read('./config/recognizer.cfg', encoding='utf-8-sig')
+        self.recognizerBackend = cfg.get('recognizer', 'backend', fallback='auto')
         self.isDbReady = False  # 数据库是否已经准备好
         self.initDbButton.clicked.connect(self.initDb)  # 定义初始化数据库按钮点击事件
 
         # 用户管理
         self.queryUserButton.clicked.connect(self.queryUser)  # 定义查询用户按钮点击事件
+        self.queryUserLineEdit.returnPressed.connect(self.queryUser)
         self.deleteUserButton.clicked.connect(self.deleteUser)  # 定义删除用户按钮点击事件
 
         # 直方图均衡化
@@ -51,35 +141,24 @@ class DataManageUI(QWidget):
             lambda: self.enableEqualizeHist(self.equalizeHistCheckBox)
         )  # 定义直方图均衡化CheckBox点击事件
 
+        # 人脸检测与预处理，与识别端使用相同的预处理参数
+        self.faceDetector = FaceDetector.fromConfig()
+        self.preprocessor = FacePreprocessor.fromConfig()
+
         # 训练人脸数据,定义开始训练按钮点击按钮事件
         self.trainButton.clicked.connect(self.train)
 
         # 系统日志
-        self.receiveLogSignal.connect(lambda log: self.logOutput(log))  # receiveLogSignal信号绑定事件
-        self.logOutputThread = threading.Thread(target=self.receiveLog, daemon=True)  # 定义logOutputThread输出后台线程
-        self.logOutputThread.start()  # 开始logOutputThread线程
+        self.logView = LogView.fromConfig(self.logTextEdit, self.logQueue)  # 日志按固定间隔批量输出，相似日志限流
 
     # 初始化/刷新数据库,初始化数据库按钮点击事件
     def initDb(self):
-        # 刷新前重置tableWidget，清空tableWidget
-        while self.tableWidget.rowCount() > 0:
-            self.tableWidget.removeRow(0)
         try:
-            if not os.path.isfile(self.database):  # 如果数据库没有找到
+            if not self.faceDatabase.exists():  # 如果数据库没有找到
                 raise FileNotFoundError  # 抛出异常
 
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-
-            res = cursor.execute('SELECT * FROM users')
-            for row_index, row_data in enumerate(res):
-                self.tableWidget.insertRow(row_index)
-                for col_index, col_data in enumerate(row_data):
-                    self.tableWidget.setItem(row_index, col_index, QTableWidgetItem(str(col_data)))  # 显示查询的数据
-
-            cursor.execute('SELECT COUNT(*) FROM users')  # 查询数据库中的样本数
-            result = cursor.fetchone()
-            dbUserCount = result[0]  # dbUserCount记录样本数
+            # 只查询用户总数，表格显示到的行再按页读取
+            dbUserCount = self.userTableModel.refresh()  # dbUserCount记录样本数
         except FileNotFoundError:
             logging.error('系统找不到数据库文件{}'.format(self.database))
             self.isDbReady = False
@@ -91,9 +170,6 @@ class DataManageUI(QWidget):
             self.initDbButton.setIcon(QIcon('./icons/error.png'))
             self.logQueue.put('Error：读取数据库异常，初始化/刷新数据库失败')
         else:
-            cursor.close()
-            conn.close()
-
             self.dbUserCountLcdNum.display(dbUserCount)
             if not self.isDbReady:
                 self.isDbReady = True  # 设置数据库已经准备好
@@ -108,38 +184,51 @@ class DataManageUI(QWidget):
                 self.logQueue.put('Success：刷新数据库成功，发现用户数：{}'.format(dbUserCount))
 
     # 查询用户，查询用户按钮点击事件
+    # 支持学号前缀以及中文名、汉语拼音的前缀查询，结果显示在表格中；输入为空时恢复显示全部用户
     def queryUser(self):
-        stu_id = self.queryUserLineEdit.text().strip()  # 获取学号
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+        keyword = self.queryUserLineEdit.text().strip()  # 获取查询关键词
+        if not keyword:
+            self.queryResultLabel.clear()
+            self.queryUserButton.setIcon(QIcon())
+            self.initDb()
+            return
 
         try:
-            cursor.execute('SELECT * FROM users WHERE stu_id=?', stu_id)
-            ret = cursor.fetchall()
+            start = time.perf_counter()
+            ret = self.faceDatabase.searchUsers(keyword)
+            elapsed = (time.perf_counter() - start) * 1000
             if not ret:
                 raise RecordNotFound
-            face_id = ret[0][1]  # 人脸ID
-            cn_name = ret[0][2]  # 中文名
         except RecordNotFound:
             self.queryUserButton.setIcon(QIcon('./icons/error.png'))
             self.queryResultLabel.setText('<font color=red>Error：此用户不存在</font>')
         except Exception as e:
-            logging.error('读取数据库异常，无法查询到{}的用户信息'.format(stu_id))
+            logging.error('读取数据库异常，无法查询到{}的用户信息'.format(keyword))
             self.queryResultLabel.clear()
             self.queryUserButton.setIcon(QIcon('./icons/error.png'))
             self.logQueue.put('Error：读取数据库异常，查询失败')
         else:
-            self.queryResultLabel.clear()
+            self.queryResultLabel.setText('找到{}个用户（{:.1f} ms）'.format(len(ret), elapsed))
             self.queryUserButton.setIcon(QIcon('./icons/success.png'))
-            # 设置查询到的数据
-            self.stuIDLineEdit.setText(stu_id)
-            self.cnNameLineEdit.setText(cn_name)
-            self.faceIDLineEdit.setText(str(face_id))
-
-            self.deleteUserButton.setEnabled(True)
-        finally:
-            cursor.close()
-            conn.close()
+            self.userTableModel.showSearchResults(ret)
+            # 学号完全匹配时直接选中该用户，否则选中第一个结果
+            row = next((index for index, user in enumerate(ret) if user[0] == keyword), 0)
+            self.tableView.selectRow(row)
+            self.showUser(ret[row])
+
+    # 点击表格中的用户
+    def selectUser(self, index):
+        user = self.userTableModel.user(index.row())
+        if user is not None:
+            self.showUser(user)
+
+    # 显示用户信息，允许删除该用户
+    def showUser(self, user):
+        stu_id, face_id, cn_name = user[0], user[1], user[2]
+        self.stuIDLineEdit.setText(stu_id)
+        self.cnNameLineEdit.setText(cn_name)
+        self.faceIDLineEdit.setText(str(face_id))
+        self.deleteUserButton.setEnabled(True)
 
     # 删除用户，删除用户按钮点击事件
     def deleteUser(self):
@@ -150,20 +239,15 @@ class DataManageUI(QWidget):
                                       QMessageBox.No)
         if ret == QMessageBox.Yes:
             stu_id = self.stuIDLineEdit.text()  # 获得学号
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
+            face_id = self.faceIDLineEdit.text()  # 获得人脸ID
 
             try:
-                cursor.execute('DELETE FROM users WHERE stu_id=?', (stu_id,))  # 从数据库中删除记录
+                self.faceDatabase.deleteUser(stu_id)  # 从数据库中删除记录
             except Exception as e:
-                cursor.close()
                 logging.error('无法从数据库中删除{}'.format(stu_id))
                 self.deleteUserButton.setIcon(QIcon('./icons/error.png'))
                 self.logQueue.put('Error：读写数据库异常，删除失败')
             else:
-                cursor.close()
-                conn.commit()
-
                 if os.path.exists('{}/stu_{}'.format(self.datasets, stu_id)):  # 从本地删除记录
                     try:
                         shutil.rmtree('{}/stu_{}'.format(self.datasets, stu_id))
@@ -171,8 +255,18 @@ class DataManageUI(QWidget):
                         logging.error('系统无法删除删除{}/stu_{}'.format(self.datasets, stu_id))
                         self.logQueue.put('Error：删除人脸数据失败，请手动删除{}/stu_{}目录'.format(self.datasets, stu_id))
 
+                # 从分段人脸库中删除该用户，使用分段人脸库的识别端会自动同步，无需重新训练
+                isRemovedFromGallery = False
+                try:
+                    isRemovedFromGallery = self.galleryStore.removeUser(int(face_id))
+                except Exception as e:
+                    logging.error('无法从人脸库中删除Face ID为{}的用户'.format(face_id))
+
                 text = '你已成功删除学号为 <font color=blue>{}</font> 的用户记录。'.format(stu_id)
-                informativeText = '<b>请在右侧菜单重新训练人脸数据。</b>'
+                if isRemovedFromGallery and self.recognizerBackend in ('auto', 'store'):
+                    informativeText = '<b>该用户已从人脸库中移除，识别端将自动同步。</b>'
+                else:
+                    informativeText = '<b>请在右侧菜单重新训练人脸数据。</b>'
                 DataManageUI.callDialog(QMessageBox.Information, text, informativeText, QMessageBox.Ok)
                 # 清空已输入缓存
                 self.stuIDLineEdit.clear()
@@ -182,8 +276,6 @@ class DataManageUI(QWidget):
                 self.deleteUserButton.setIcon(QIcon('./icons/success.png'))
                 self.deleteUserButton.setEnabled(False)
                 self.queryUserButton.setIcon(QIcon())
-            finally:
-                conn.close()
 
     # 是否执行直方图均衡化,直方图均衡化CheckBox点击事件
     def enableEqualizeHist(self, equalizeHistCheckBox):
@@ -197,13 +289,17 @@ class DataManageUI(QWidget):
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)  # 转换成灰度图，这一步其实可以不用做
         if self.isEqualizeHistEnabled:  # 如果开启了直方图均衡化
             gray = cv2.equalizeHist(gray)  # 进行直方图均衡化
-        face_cascade = cv2.CascadeClassifier('./haarcascades/haarcascade_frontalface_default.xml')  # 加载opencv官方人脸分类器
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.3, minNeighbors=5, minSize=(90, 90))  # 进行人脸检测
+
+        # 采集时已经保存为标准尺寸的人脸样本，无需再次检测
+        if self.preprocessor.isNormalized(gray):
+            return self.preprocessor.normalizeCrop(gray), (0, 0, gray.shape[1], gray.shape[0])
+
+        faces = self.faceDetector.detect(gray)  # 进行人脸检测
 
         if len(faces) == 0:  # 如果没有检测到人脸
             return None, None
-        (x, y, w, h) = faces[0]  # 前一步采集的时候保证只有一个人脸
-        return gray[y:y + w, x:x + h], faces[0]  # 返回人脸检测区域，和人脸检测信息
+        # 前一步采集的时候保证只有一个人脸，返回预处理后的人脸，和人脸检测信息
+        return self.preprocessor.normalize(gray, faces[0]), faces[0]
 
     # 准备图片数据
     def prepareTrainingData(self, data_folder_path):
@@ -211,10 +307,7 @@ class DataManageUI(QWidget):
         faces = []
         labels = []
 
-        face_id = 1
-
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+        deduplicator = SampleDeduplicator.fromConfig()  # 剔除同一用户的近似重复样本
 
         # 遍历人脸库
         for dir_name in dirs:
@@ -222,11 +315,11 @@ class DataManageUI(QWidget):
                 continue
             stu_id = dir_name.replace('stu_', '')  # 通过文件夹名获取学号
             try:
-                cursor.execute('SELECT * FROM users WHERE stu_id=?', (stu_id,))  # 从数据库中查询
-                ret = cursor.fetchall()
-                if not ret:  # 如果在数据库中没有找到
+                user = self.faceDatabase.getUser(stu_id)
+                if not user:  # 如果在数据库中没有找到
                     raise RecordNotFound
-                cursor.execute('UPDATE users SET face_id=? WHERE stu_id=?', (face_id, stu_id))  # 再次更新face_id信息
+                # 已有用户保留原来的人脸ID，新用户分配新的人脸ID，其它用户的标签不会因增删用户而改变
+                face_id = user[1] if user[1] is not None and user[1] > 0 else self.faceDatabase.assignFaceID(stu_id)
             except RecordNotFound:
                 logging.warning('数据库中找不到学号为{}的用户记录'.format(stu_id))
                 self.logQueue.put('发现学号为{}的人脸数据，但数据库中找不到相应记录，已忽略'.format(stu_id))
@@ -234,6 +327,7 @@ class DataManageUI(QWidget):
 
             subject_dir_path = data_folder_path + '/' + dir_name
             subject_images_names = os.listdir(subject_dir_path)
+            deduplicator.reset()
 
             for image_name in subject_images_names:  # 获取具体用户的人脸图片
                 if image_name.startswith('.'):  # 忽略掉以。开头的隐藏文件
@@ -243,16 +337,15 @@ class DataManageUI(QWidget):
                 if image is None:
                     continue
                 face, rect = self.detectFace(image)  # 调用detectFace检测图片
-                if face is not None:  # 如果检测到人脸
+                if face is not None and not deduplicator.isDuplicate(face):  # 如果检测到人脸且不是近似重复样本
                     faces.append(face)
                     labels.append(face_id)
-            face_id = face_id + 1
 
-            cursor.close()
-            conn.commit()
-            conn.close()
+        if deduplicator.droppedCount:
+            logging.info('训练时剔除了{}个近似重复样本'.format(deduplicator.droppedCount))
+            self.logQueue.put('Info：已剔除{}个近似重复样本，保留{}个样本'.format(deduplicator.droppedCount, len(faces)))
 
-            return faces, labels
+        return faces, labels
 
     # 训练人脸数据,开始训练按钮点击按钮事件
     def train(self):
@@ -273,8 +366,27 @@ class DataManageUI(QWidget):
                     os.makedirs('./recognizer')  # 创建文件夹
 
                 faces, labels = self.prepareTrainingData(self.datasets)  # 调用prepareTrainingData对数据进行预处理
+                self.galleryStore.saveOptions(self.isEqualizeHistEnabled)  # 采集端追加用户时使用相同的预处理
                 face_recognizer.train(faces, np.array(labels))  # 对人脸识别器进行训练
-                face_recognizer.save('./recognizer/trainingData.yml')  # 将训练数据保存
+                # 先写入临时文件再替换，避免人脸检测线程热加载到写了一半的模型
+                face_recognizer.save('./recognizer/trainingData.tmp.yml')
+                os.replace('./recognizer/trainingData.tmp.yml', './recognizer/trainingData.yml')  # 将训练数据保存
+                # 同时更新按用户分段的人脸库，并导出二进制人脸库，供识别端内存映射快速加载
+                # 二进制人脸库最后写入，作为分段人脸库的快照，识别端只需应用快照之后变化的用户段
+                gallery = galleryFromRecognizer(face_recognizer)
+                written, removed = self.galleryStore.replaceAll(gallery)
+                saveGallery('./recognizer/trainingData.fgal', gallery)
+                self.logQueue.put('Info：按用户分段的人脸库已更新{}人，删除{}人'.format(written, removed))
+
+                # 按配置的分片数重新均衡分片人脸库
+                cfg = ConfigParser()
+                cfg.read('./config/recognizer.cfg', encoding='utf-8-sig')
+                shards = cfg.getint('recognizer', 'shards', fallback=1)
+                if shards > 1:
+                    shards = saveShards('./recognizer/shards', gallery, shards)
+                    self.logQueue.put('Info：人脸库已均衡为{}个分片'.format(shards))
+                elif os.path.isdir('./recognizer/shards'):
+                    shutil.rmtree('./recognizer/shards')
 
         except FileNotFoundError:
             logging.error('系统找不到人脸数据目录{}'.format(self.datasets))
@@ -285,30 +397,13 @@ class DataManageUI(QWidget):
             self.trainButton.setIcon(QIcon('./icons/error.png'))
             self.logQueue.put('Error：遍历人脸库出现异常，训练失败')
         else:
-            text = '<font color=green><b>Success!</b></font> 系统已生成./recognizer/trainingData.yml'
+            text = '<font color=green><b>Success!</b></font> 系统已生成./recognizer/trainingData.yml及trainingData.fgal'
             informativeText = '<b>人脸数据训练完成！</b>'
             DataManageUI.callDialog(QMessageBox.Information, text, informativeText, QMessageBox.Ok)
             self.trainButton.setIcon(QIcon('./icons/success.png'))
             self.logQueue.put('Success：人脸数据训练完成')
             self.initDb()
 
-    # receiveLogSignal信号绑定事件,其中Log为str类型
-    def logOutput(self, log):
-        time = datetime.now().strftime('[%Y/%m/%d %H:%M:%S]')
-        log = time + ' ' + log + '\n'
-
-        self.logTextEdit.moveCursor(QTextCursor.End)
-        self.logTextEdit.insertPlainText(log)
-        self.logTextEdit.ensureCursorVisible()  # 自动滚屏
-
-    def receiveLog(self):
-        while True:
-            data = self.logQueue.get()
-            if data:
-                self.receiveLogSignal.emit(data)
-            else:
-                continue
-
     @staticmethod
     def callDialog(icon, text, informativeText, standardButtons, defaultButton=None):
         msg = QMessageBox()
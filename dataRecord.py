@@ -2,17 +2,26 @@
 import logging.config
 import os
 import queue
-import sqlite3
+from collections import deque
 import sys
 import threading
-from datetime import datetime
+import time
+from configparser import ConfigParser
 
 import cv2
-from PyQt5.QtCore import pyqtSignal, QTimer, QRegExp
-from PyQt5.QtGui import QIcon, QImage, QPixmap, QTextCursor, QRegExpValidator
+from PyQt5.QtCore import pyqtSignal, QThread, QTimer, QRegExp
+from PyQt5.QtGui import QIcon, QImage, QPixmap, QRegExpValidator
 from PyQt5.QtWidgets import QWidget, QApplication, QMessageBox, QDialog
 from PyQt5.uic import loadUi
 
+from faceDatabase import FaceDatabase
+from faceDedup import SampleDeduplicator
+from faceDetector import FaceDetector
+from faceGallery import GalleryStore, lbpHistogram
+from facePreprocess import FacePreprocessor
+from faceQuality import FaceQualityGate
+from logView import LogView
+
 
 # 用户取消了更新数据库操作
 class OperationCancel(Exception):
@@ -24,6 +33,80 @@ class RecordDisturbance(Exception):
     pass
 
 
+# 人脸样本后台写入线程，图像编码和磁盘写入不占用GUI线程
+class SampleWriter(threading.Thread):
+    def __init__(self, callback):
+        super(SampleWriter, self).__init__(daemon=True)
+        self.queue = queue.Queue()  # 待写入的(路径, 图像)
+        self.callback = callback  # 写入完成回调，参数为路径和是否写入成功
+        self.directories = set()  # 已确认存在的目录，避免每个样本都访问文件系统
+
+    # 提交一个样本，立即返回
+    def put(self, path, image):
+        self.queue.put((path, image))
+
+    # 等待已提交的样本全部写入
+    def flush(self):
+        self.queue.join()
+
+    def run(self):
+        while True:
+            path, image = self.queue.get()
+            try:
+                directory = os.path.dirname(path)
+                if directory not in self.directories:
+                    os.makedirs(directory, exist_ok=True)
+                    self.directories.add(directory)
+                isWritten = cv2.imwrite(path, image)
+            except Exception as e:
+                logging.error('写入人脸图像文件{}时发生异常：{}'.format(path, e))
+                isWritten = False
+            self.callback(path, isWritten)
+            self.queue.task_done()
+
+
+# 摄像头读取与人脸检测线程，GUI线程只负责显示
+# 只保留最新一帧交给GUI线程，检测或显示较慢时丢弃旧帧，不会积压延迟
+class FrameDetectThread(QThread):
+    def __init__(self, cap, faceDetector):
+        super(FrameDetectThread, self).__init__()
+        self.cap = cap
+        self.faceDetector = faceDetector
+        self.isRunning = False
+        self.isFaceDetectEnabled = False  # 是否进行人脸检测
+        self.lock = threading.Lock()
+        self.latestFrame = None  # 最新一帧及其检测结果，GUI线程取走后置为None
+
+    def run(self):
+        self.isRunning = True
+        while self.isRunning:
+            ret, frame = self.cap.read()  # 读取一帧
+            if not ret:
+                self.msleep(10)
+                continue
+
+            frameData = {'frame': frame, 'gray': None, 'faces': None, 'latency': None}
+            if self.isFaceDetectEnabled:  # 如果开启了人脸检测
+                start = time.perf_counter()
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # 将Frame转换为灰度图
+                frameData['faces'] = self.faceDetector.detect(gray)
+                frameData['gray'] = gray
+                frameData['latency'] = time.perf_counter() - start  # 检测耗时（秒）
+
+            with self.lock:
+                self.latestFrame = frameData  # 覆盖尚未显示的旧帧
+
+    # 取走最新一帧，没有新帧时返回None
+    def takeLatestFrame(self):
+        with self.lock:
+            frameData, self.latestFrame = self.latestFrame, None
+        return frameData
+
+    def stop(self):
+        self.isRunning = False
+        self.wait()
+
+
 # 用户信息填写对话框
 class UserInfoDialog(QDialog):
     def __init__(self):
@@ -49,8 +132,8 @@ class UserInfoDialog(QDialog):
 
 
 class DataRecordUI(QWidget):
-    # 传递Log信号
-    receiveLogSignal = pyqtSignal(str)
+    # 人脸样本写入完成信号
+    sampleWrittenSignal = pyqtSignal(str, bool)
 
     def __init__(self):
         super(DataRecordUI, self).__init__()
@@ -61,7 +144,9 @@ class DataRecordUI(QWidget):
 
         # OpenCV
         self.cap = cv2.VideoCapture()
-        self.faceCascade = cv2.CascadeClassifier('./haarcascades/haarcascade_frontalface_default.xml')
+        self.faceDetector = FaceDetector.fromConfig()  # 人脸检测，与识别端使用相同的检测参数
+        self.preprocessor = FacePreprocessor.fromConfig()  # 人脸预处理，与训练和识别端一致
+        self.frameDetectThread = FrameDetectThread(self.cap, self.faceDetector)  # 摄像头读取与人脸检测线程
 
         self.logQueue = queue.Queue()  # 日志队列
 
@@ -76,6 +161,8 @@ class DataRecordUI(QWidget):
         # 定时器
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.updateFrame)  # 利用定时器更新Frame
+        self.frameTimes = deque(maxlen=30)  # 最近显示的帧的时间，用于计算预览帧率
+        self.detectLatencies = deque(maxlen=30)  # 最近的人脸检测耗时
 
         # 人脸检测
         self.isFaceDetectEnabled = False
@@ -84,7 +171,9 @@ class DataRecordUI(QWidget):
 
         # 数据库
         self.database = './FaceBase.db'  # 数据库地址
+        self.faceDatabase = FaceDatabase(self.database)  # 数据库访问
         self.datasets = './datasets'  # 数据集地址
+        self.galleryStore = GalleryStore('./recognizer/gallery')  # 按用户分段的人脸库
         self.isDbReady = False  # 这个状态表示数据库是否准备好
         self.initDbButton.setIcon(QIcon('./icons/warning.png'))
         self.initDbButton.clicked.connect(self.initDb)  # 设置初始化数据库按钮点击事件
@@ -104,11 +193,26 @@ class DataRecordUI(QWidget):
         self.isFaceDataReady = False  # 人脸数据是否准备好
         self.isFaceRecordEnabled = False  # 人脸采集是否允许
         self.enableFaceRecordButton.clicked.connect(self.enableFaceRecord)  # 采集当前捕获帧按钮点击事件
+        self.queuedRecordCount = 0  # 已提交写入的人脸数量，用于样本编号
+        self.sampleWrittenSignal.connect(self.onSampleWritten)
+        self.sampleWriter = SampleWriter(self.sampleWrittenSignal.emit)  # 样本后台写入线程
+        self.sampleWriter.start()
+        self.deduplicator = SampleDeduplicator.fromConfig()  # 近似重复样本过滤
+
+        # 连续采集，按设定间隔自动采集质量合格的人脸样本
+        cfg = ConfigParser()
+        cfg.read('./config/recognizer.cfg', encoding='utf-8-sig')
+        self.burstCount = cfg.getint('record', 'burst_count', fallback=100)  # 每次连续采集的样本数
+        self.burstInterval = cfg.getfloat('record', 'burst_interval', fallback=0.1)  # 两次采集的最小间隔（秒）
+        self.burstQualityGate = FaceQualityGate.fromConfig() if cfg.getboolean(
+            'record', 'burst_quality', fallback=True) else None
+        self.burstRemaining = 0  # 本次连续采集还需采集的样本数
+        self.lastBurstRecordTime = 0
+        self.burstFaceRecordButton.toggled.connect(self.burstFaceRecord)  # 连续采集按钮点击事件
+        self.burstFaceRecordButton.setCheckable(True)
 
         # 日志系统
-        self.receiveLogSignal.connect(lambda log: self.logOutput(log))  # receiveLogSignal信号绑定事件
-        self.logOutputThread = threading.Thread(target=self.receiveLog, daemon=True)  # Log输入后台线程
-        self.logOutputThread.start()  # 启动Log线程
+        self.logView = LogView.fromConfig(self.logTextEdit, self.logQueue)  # 日志按固定间隔批量输出，相似日志限流
 
     # 是否使用外接摄像头CheckBox点击事件
     def useExternalCamera(self, useExternalCameraCheckBox):
@@ -138,13 +242,18 @@ class DataRecordUI(QWidget):
             else:  # 如果读取成功
                 self.startWebcamButton.setText('关闭摄像头')
                 self.enableFaceDetectButton.setEnabled(True)  # 允许点击开启人脸检测按钮
+                self.frameDetectThread.start()  # 启动摄像头读取与人脸检测线程
                 self.timer.start(5)  # 利用定时器更新Frame
                 self.startWebcamButton.setIcon(QIcon('./icons/success.png'))
         else:  # 关闭摄像头
             if self.cap.isOpened():
                 if self.timer.isActive():
                     self.timer.stop()  # 停止Frame更新
+                self.frameDetectThread.stop()  # 停止读取摄像头后才能释放
                 self.cap.release()  # 释放当前摄像头
+                self.frameTimes.clear()
+                self.detectLatencies.clear()
+                self.frameStatsLabel.clear()
                 self.faceDetectCaptureLabel.clear()
                 self.faceDetectCaptureLabel.setText('<font color=red>摄像头未开启</font>')  # 设置label显示为摄像头未开启
                 self.startWebcamButton.setText('打开摄像头')  # 修改为打开摄像头
@@ -160,48 +269,95 @@ class DataRecordUI(QWidget):
             else:  # 关闭人脸检测
                 self.enableFaceDetectButton.setText('开启人脸检测')
                 self.isFaceDetectEnabled = False
+                self.detectLatencies.clear()
+            self.frameDetectThread.isFaceDetectEnabled = self.isFaceDetectEnabled
 
     # 采集当前捕获帧按钮点击事件
     def enableFaceRecord(self):
         if not self.isFaceRecordEnabled:
             self.isFaceRecordEnabled = True
 
-    # timer定时器事件，不断更新Frame
-    def updateFrame(self):
-        ret, frame = self.cap.read()  # 读取一帧
-        # self.image = cv2.flip(self.image, 1)
-        if ret:  # 读取成功
-            self.displayImage(frame)  # 展示图片
+    # 连续采集按钮点击事件
+    def burstFaceRecord(self, status):
+        if status:
+            self.burstRemaining = self.burstCount
+            self.lastBurstRecordTime = 0
+            self.burstFaceRecordButton.setText('停止连续采集')
+            self.logQueue.put('Info：开始连续采集{}个人脸样本，请缓慢转动头部'.format(self.burstCount))
+        else:
+            if self.burstRemaining > 0:
+                self.logQueue.put('Info：连续采集已停止，本次还剩{}个样本未采集'.format(self.burstRemaining))
+            self.burstRemaining = 0
+            self.burstFaceRecordButton.setText('连续采集')
+
+    # 连续采集时判断当前帧的人脸是否可以作为样本
+    def isBurstSample(self, faces, gray):
+        if self.burstRemaining <= 0 or len(faces) != 1:
+            return False
+        if time.time() - self.lastBurstRecordTime < self.burstInterval:
+            return False
+        if self.burstQualityGate is not None:
+            x, y, w, h = faces[0]
+            face = self.preprocessor.crop(gray, (x, y, w, h))
+            if face is None or self.burstQualityGate.check(face, w, h) is not None:
+                return False
+        return True
+
+    # 提交一个人脸样本到后台写入线程，统一缩放为标准尺寸，训练时无需再次检测
+    # 与已采集样本近似重复时不保存，返回是否提交
+    def recordSample(self, gray, face):
+        sample = self.preprocessor.crop(gray, face)
+        if sample is None or self.deduplicator.isDuplicate(sample):
+            return False
+        stu_id = self.userInfo.get('stu_id')  # 获得当前用户学号
+        self.queuedRecordCount += 1
+        self.sampleWriter.put('{}/stu_{}/img.{}.jpg'.format(self.datasets, stu_id, self.queuedRecordCount), sample)
+        return True
+
+    # 人脸样本写入完成事件，在GUI线程中更新采集进度
+    def onSampleWritten(self, path, isWritten):
+        if isWritten:
+            self.faceRecordCount = self.faceRecordCount + 1  # 增加已采集人脸样本数
+            self.faceRecordCountLcdNum.display(self.faceRecordCount)
+            if not self.burstFaceRecordButton.isChecked():
+                self.enableFaceRecordButton.setIcon(QIcon('./icons/success.png'))
+        else:
+            self.enableFaceRecordButton.setIcon(QIcon('./icons/error.png'))
+            self.logQueue.put('Error：无法保存人脸图像{}'.format(path))
 
-            if self.isFaceDetectEnabled:  # 如果开启了人脸检测
-                detected_frame = self.detectFace(frame)
-                self.displayImage(detected_frame)  # 展示检测人脸后的图片
-            else:
-                self.displayImage(frame)  # 直接展示原来的图片
+    # timer定时器事件，取检测线程的最新一帧进行显示
+    def updateFrame(self):
+        frameData = self.frameDetectThread.takeLatestFrame()
+        if frameData is None:  # 没有新的帧
+            return
+
+        frame = frameData['frame']
+        if frameData['faces'] is not None:  # 该帧进行了人脸检测
+            self.detectLatencies.append(frameData['latency'])
+            frame = self.detectFace(frame, frameData['gray'], frameData['faces'])  # 采集人脸并绘制人脸矩形
+        self.displayImage(frame)  # 展示图片
+
+        self.frameTimes.append(time.perf_counter())
+        self.updateFrameStats()
+
+    # 显示预览帧率和人脸检测耗时
+    def updateFrameStats(self):
+        stats = []
+        if len(self.frameTimes) > 1:
+            stats.append('预览：{:.1f} FPS'.format((len(self.frameTimes) - 1) / (self.frameTimes[-1] - self.frameTimes[0])))
+        if self.isFaceDetectEnabled and self.detectLatencies:
+            stats.append('检测：{:.1f} ms'.format(1000 * sum(self.detectLatencies) / len(self.detectLatencies)))
+        self.frameStatsLabel.setText('  '.join(stats))
 
     # 初始化数据库按钮点击事件
     def initDb(self):
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
         try:
             # 检测人脸数据目录是否存在，不存在则创建
             if not os.path.isdir(self.datasets):
                 os.makedirs(self.datasets)
 
-            # 查询数据表是否存在，不存在则创建
-            # 学号，人脸编号，中文名，英文名，创建日期
-            cursor.execute('''CREATE TABLE IF NOT EXISTS users (
-                              stu_id VARCHAR(12) PRIMARY KEY NOT NULL,
-                              face_id INTEGER DEFAULT -1,
-                              cn_name VARCHAR(10) NOT NULL,
-                              en_name VARCHAR(16) NOT NULL,
-                              created_time DATE DEFAULT (date('now','localtime'))
-                              )
-                          ''')
-            # 查询数据表记录数
-            cursor.execute('SELECT Count(*) FROM users')
-            result = cursor.fetchone()
-            dbUserCount = result[0]  # 记录当前用户数量
+            # 第一次连接时创建数据表或升级旧版本的数据库，再查询数据表记录数
+            dbUserCount = self.faceDatabase.userCount()  # 记录当前用户数量
         except Exception as e:
             logging.error('读取数据库异常，无法完成数据库初始化')
             self.isDbReady = False  # 数据库没有准备好
@@ -214,44 +370,34 @@ class DataRecordUI(QWidget):
             self.initDbButton.setIcon(QIcon('./icons/success.png'))
             self.initDbButton.setEnabled(False)
             self.addOrUpdateUserInfoButton.setEnabled(True)  # 允许点击添加或修改用户信息按钮
-        finally:
-            cursor.close()
-            conn.commit()
-            conn.close()
 
-    # 在图片中检测人脸，updateFrame程序调用
-    def detectFace(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # 将Frame转换为灰度图
-        faces = self.faceCascade.detectMultiScale(gray, 1.3, 5, minSize=(90, 90))  # 加载OPENCV官方的人脸分类器
-
-        stu_id = self.userInfo.get('stu_id')  # 获得当前用户学号
+    # 处理检测线程在该帧中检测到的人脸，采集样本并绘制人脸矩形，updateFrame程序调用
+    def detectFace(self, frame, gray, faces):
+        # 连续采集模式，按设定间隔自动采集单人且质量合格的人脸
+        if self.isBurstSample(faces, gray) and self.recordSample(gray, faces[0]):
+            self.lastBurstRecordTime = time.time()
+            self.burstRemaining -= 1
+            if self.burstRemaining == 0:
+                self.logQueue.put('Success：连续采集完成')
+                self.burstFaceRecordButton.setChecked(False)
 
         for (x, y, w, h) in faces:
             if self.isFaceRecordEnabled:  # 允许进行人脸采集
                 try:
-                    if not os.path.exists('{}/stu_{}'.format(self.datasets, stu_id)):  # 如果不存在该学生datasets
-                        # ，则创建当前学生datasets
-                        os.makedirs('{}/stu_{}'.format(self.datasets, stu_id))
                     if len(faces) > 1:  # 采集到多张人脸
                         raise RecordDisturbance
-                    # 保存已采集图片
-                    cv2.imwrite('{}/stu_{}/img.{}.jpg'.format(self.datasets, stu_id, self.faceRecordCount + 1),
-                                gray[y - 20:y + h + 20, x - 20:x + w + 20])
+                    isRecorded = self.recordSample(gray, (x, y, w, h))  # 保存已采集图片，写入完成后更新采集数量
                 except RecordDisturbance:  # 捕获到采集到多张人脸干扰异常
                     self.isFaceRecordEnabled = False
                     logging.error('检测到多张人脸或环境干扰')
                     self.logQueue.put('Warning：检测到多张人脸或环境干扰，请解决问题后继续')
                     self.enableFaceRecordButton.setIcon(QIcon('./icons/warning.png'))
                     continue
-                except Exception as e:  # 捕获到其他异常
-                    logging.error('写入人脸图像文件到计算机过程中发生异常')
-                    self.enableFaceRecordButton.setIcon(QIcon('./icons/error.png'))
-                    self.logQueue.put('Error：无法保存人脸图像，采集当前捕获帧失败')
                 else:  # 没有出现异常
-                    self.enableFaceRecordButton.setIcon(QIcon('./icons/success.png'))
-                    self.faceRecordCount = self.faceRecordCount + 1  # 增加已采集人脸样本数
                     self.isFaceRecordEnabled = False
-                    self.faceRecordCountLcdNum.display(self.faceRecordCount)
+                    if not isRecorded:
+                        self.logQueue.put('Warning：当前帧与已采集的样本近似重复，已忽略')
+                        self.enableFaceRecordButton.setIcon(QIcon('./icons/warning.png'))
             cv2.rectangle(frame, (x - 5, y - 10), (x + w + 5, y + h + 10), (0, 0, 255), 2)  # 在Frame上绘制人脸矩形
 
         return frame  # 返回绘制矩形后的Frame
@@ -298,12 +444,9 @@ class DataRecordUI(QWidget):
         if self.isFaceDataReady:  # 人脸数据已经尊卑好
             stu_id, cn_name, en_name = self.userInfo.get('stu_id'), self.userInfo.get('cn_name'), self.userInfo.get(
                 'en_name')  # 获取学号，中文名，英文名
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
 
             try:
-                cursor.execute('SELECT * FROM users WHERE stu_id=?', (stu_id,))
-                if cursor.fetchall():  # 如果已经存在该用户
+                if self.faceDatabase.getUser(stu_id):  # 如果已经存在该用户
                     text = '数据库已存在学号为 <font color=blue>{}</font> 的用户记录。'.format(stu_id)
                     informativeText = '<b>是否覆盖？</b>'
                     ret = DataRecordUI.callDialog(QMessageBox.Warning, text, informativeText,
@@ -311,18 +454,24 @@ class DataRecordUI(QWidget):
 
                     if ret == QMessageBox.Yes:
                         # 更新已有记录
-                        cursor.execute('UPDATE users SET cn_name=?, en_name=? WHERE stu_id=?',
-                                       (cn_name, en_name, stu_id,))
+                        self.faceDatabase.updateUser(stu_id, cn_name, en_name)
                     else:
                         raise OperationCancel  # 记录取消覆盖操作
                 else:  # 数据库中不存在该用户
                     # 插入新记录
-                    cursor.execute('INSERT INTO users (stu_id, cn_name, en_name) VALUES (?, ?, ?)',
-                                   (stu_id, cn_name, en_name,))
+                    self.faceDatabase.insertUser(stu_id, cn_name, en_name)
+
+                # 已经训练过人脸库时，直接追加该用户，无需重新训练
+                if os.path.isdir(self.galleryStore.root):
+                    try:
+                        sampleCount = self.appendToGallery(stu_id)
+                    except Exception as e:
+                        logging.error('无法将学号为{}的人脸数据追加到人脸库'.format(stu_id))
+                        self.logQueue.put('Warning：追加人脸库失败，请在数据管理中重新训练人脸数据')
+                    else:
+                        self.logQueue.put('Success：已将{}个人脸样本追加到人脸库'.format(sampleCount))
 
-                cursor.execute('SELECT Count(*) FROM users')
-                result = cursor.fetchone()
-                dbUserCount = result[0]  # 更新dbUserCount信息
+                dbUserCount = self.faceDatabase.userCount()  # 更新dbUserCount信息
             except OperationCancel:
                 pass
             except Exception as e:
@@ -340,6 +489,7 @@ class DataRecordUI(QWidget):
                 self.isUserInfoReady = False
 
                 self.faceRecordCount = 0
+                self.queuedRecordCount = 0
                 self.isFaceDataReady = False
                 self.faceRecordCountLcdNum.display(self.faceRecordCount)
                 self.dbUserCountLcdNum.display(dbUserCount)
@@ -353,15 +503,42 @@ class DataRecordUI(QWidget):
                 # 允许继续增加新用户
                 self.addOrUpdateUserInfoButton.setEnabled(True)
                 self.migrateToDbButton.setEnabled(False)
-
-            finally:
-                cursor.close()
-                conn.commit()
-                conn.close()
         else:
             self.logQueue.put('Error：操作失败，你尚未完成人脸数据采集')
             self.migrateToDbButton.setIcon(QIcon('./icons/error.png'))
 
+    # 将用户的人脸数据追加到分段人脸库，识别端检测到新的用户段后自动同步
+    def appendToGallery(self, stu_id):
+        face_id = self.faceDatabase.assignFaceID(stu_id)  # 新用户分配新的人脸ID
+
+        histograms = []
+        deduplicator = SampleDeduplicator.fromConfig()  # 与训练时一样剔除近似重复样本
+        isEqualizeHistEnabled = self.galleryStore.loadOptions()['equalizeHist']  # 与训练时一样进行直方图均衡化
+        subject_dir_path = '{}/stu_{}'.format(self.datasets, stu_id)
+        for image_name in os.listdir(subject_dir_path):
+            if image_name.startswith('.'):  # 忽略掉以。开头的隐藏文件
+                continue
+            image = cv2.imread(subject_dir_path + '/' + image_name)
+            if image is None:
+                continue
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if isEqualizeHistEnabled:
+                gray = cv2.equalizeHist(gray)
+            if self.preprocessor.isNormalized(gray):  # 标准尺寸的人脸样本
+                face = self.preprocessor.normalizeCrop(gray)
+            else:  # 旧版本采集的样本，需要重新检测人脸
+                faces = self.faceDetector.detect(gray)
+                if len(faces) == 0:
+                    continue
+                face = self.preprocessor.normalize(gray, faces[0])
+            if deduplicator.isDuplicate(face):
+                continue
+            histograms.append(lbpHistogram(face))
+
+        if histograms:
+            self.galleryStore.addUser(face_id, histograms)
+        return len(histograms)
+
     # 开始采集人脸数据按钮点击事件
     def startFaceRecord(self, startFaceRecordButton):
         if startFaceRecordButton.text() == '开始采集人脸数据':
@@ -370,9 +547,12 @@ class DataRecordUI(QWidget):
                     self.addOrUpdateUserInfoButton.setEnabled(False)  # 此时禁止添加或者修改用户信息
                     if not self.enableFaceRecordButton.isEnabled():  # 允许点击采集当前捕获帧按钮
                         self.enableFaceRecordButton.setEnabled(True)
+                    self.burstFaceRecordButton.setEnabled(True)  # 允许连续采集
                     self.enableFaceRecordButton.setIcon(QIcon())
                     self.startFaceRecordButton.setIcon(QIcon('./icons/success.png'))
                     self.startFaceRecordButton.setText('结束当前人脸采集')
+                    self.deduplicator.reset()  # 只与当前用户的样本比较
+                    self.deduplicator.droppedCount = 0
                 else:  # 用户信息没有准备好
                     self.startFaceRecordButton.setIcon(QIcon('./icons/error.png'))
                     self.startFaceRecordButton.setChecked(False)
@@ -381,6 +561,11 @@ class DataRecordUI(QWidget):
                 self.startFaceRecordButton.setIcon(QIcon('./icons/error.png'))
                 self.logQueue.put('Error：操作失败，请开启人脸检测')
         else:  # 点击采集结束
+            self.burstFaceRecordButton.setChecked(False)  # 停止连续采集
+            self.sampleWriter.flush()  # 等待已提交的样本写入完成
+            QApplication.processEvents()  # 处理写入完成信号，更新采集数量
+            if self.deduplicator.droppedCount:
+                self.logQueue.put('Info：已丢弃{}个近似重复样本'.format(self.deduplicator.droppedCount))
             if self.faceRecordCount < self.minFaceRecordCount:  # 采集数量小于当前最低要求的人脸采集数量
                 text = '系统当前采集了 <font color=blue>{}</font> 帧图像，采集数据过少会导致较大的识别误差。'.format(self.faceRecordCount)
                 informativeText = '<b>请至少采集 <font color=red>{}</font> 帧图像。</b>'.format(self.minFaceRecordCount)
@@ -399,30 +584,12 @@ class DataRecordUI(QWidget):
                         self.isFaceRecordEnabled = False
                     self.enableFaceRecordButton.setEnabled(False)
                     self.enableFaceRecordButton.setIcon(QIcon())
+                    self.burstFaceRecordButton.setEnabled(False)
                     self.startFaceRecordButton.setText('开始采集人脸数据')
                     self.startFaceRecordButton.setEnabled(False)
                     self.startFaceRecordButton.setIcon(QIcon())
                     self.migrateToDbButton.setEnabled(True)
 
-    # receiveLogSignal信号绑定事件，输出LOG日志，log参数为str类型
-    def logOutput(self, log):
-        # 获取当前系统时间
-        time = datetime.now().strftime('[%Y/%m/%d %H:%M:%S]')
-        log = time + ' ' + log + '\n'
-
-        self.logTextEdit.moveCursor(QTextCursor.End)
-        self.logTextEdit.insertPlainText(log)
-        self.logTextEdit.ensureCursorVisible()  # 自动滚屏
-
-    # 获得log并发出receiveLogSignal信号，从而logOutput捕获到进行输出
-    def receiveLog(self):
-        while True:
-            data = self.logQueue.get()  # 获取log队列中的log
-            if data:
-                self.receiveLogSignal.emit(data)  # 发出receiveLogSignal信号
-            else:
-                continue
-
     # 显示图像，updateFrame程序调用
     def displayImage(self, img):
         # BGR -> RGB
@@ -464,10 +631,13 @@ class DataRecordUI(QWidget):
             msg.setDefaultButton(defaultButton)
         return msg.exec()
 
-    # 窗口关闭事件，关闭定时器、摄像头
+    # 窗口关闭事件，关闭定时器、检测线程、摄像头，等待样本写入完成
     def closeEvent(self, event):
+        self.sampleWriter.flush()
         if self.timer.isActive():
             self.timer.stop()
+        if self.frameDetectThread.isRunning:
+            self.frameDetectThread.stop()
         if self.cap.isOpened():
             self.cap.release()
         event.accept()
@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+# 人脸数据库访问层，采集、管理、识别和批量导入共用
+# 每个线程使用自己的连接并复用，sqlite3会按SQL文本缓存每个连接上已编译的语句，因此SQL均定义为常量
+# 使用WAL日志模式，识别线程读取时不会被管理端的写入阻塞
+class FaceDatabase:
+    schemaVersion = 2  # 当前数据库结构版本，记录在PRAGMA user_version中
+
+    createTableSQL = '''CREATE TABLE IF NOT EXISTS users (
+                        stu_id VARCHAR(12) PRIMARY KEY NOT NULL,
+                        face_id INTEGER DEFAULT -1,
+                        cn_name VARCHAR(10) NOT NULL,
+                        en_name VARCHAR(16) NOT NULL,
+                        created_time DATE DEFAULT (date('now','localtime'))
+                        )'''
+    createFaceIDIndexSQL = 'CREATE INDEX IF NOT EXISTS users_face_id ON users (face_id)'
+    # 姓名前缀查询使用的索引，LIKE默认不区分大小写，须使用NOCASE排序规则才能走索引
+    createNameIndexSQL = (
+        'CREATE INDEX IF NOT EXISTS users_cn_name ON users (cn_name COLLATE NOCASE)',
+        'CREATE INDEX IF NOT EXISTS users_en_name ON users (en_name COLLATE NOCASE)',
+    )
+    # 全文索引，以users为外部内容表，由触发器在增删改时同步
+    # unicode61分词把连续的汉字作为一个词，prefix为前1~3个字符建立前缀索引
+    createFullTextSQL = (
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5 (
+           stu_id, cn_name, en_name, content='users', content_rowid='rowid', prefix='1 2 3'
+           )''',
+        '''CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+           INSERT INTO users_fts (rowid, stu_id, cn_name, en_name) VALUES (new.rowid, new.stu_id, new.cn_name, new.en_name);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+           INSERT INTO users_fts (users_fts, rowid, stu_id, cn_name, en_name)
+           VALUES ('delete', old.rowid, old.stu_id, old.cn_name, old.en_name);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF stu_id, cn_name, en_name ON users BEGIN
+           INSERT INTO users_fts (users_fts, rowid, stu_id, cn_name, en_name)
+           VALUES ('delete', old.rowid, old.stu_id, old.cn_name, old.en_name);
+           INSERT INTO users_fts (rowid, stu_id, cn_name, en_name) VALUES (new.rowid, new.stu_id, new.cn_name, new.en_name);
+           END''',
+        "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",  # 为已有用户建立索引
+    )
+
+    columns = 'stu_id, face_id, cn_name, en_name, created_time'
+    countSQL = 'SELECT COUNT(*) FROM users'
+    usersPageSQL = 'SELECT {} FROM users ORDER BY rowid LIMIT ? OFFSET ?'.format(columns)
+    userSQL = 'SELECT {} FROM users WHERE stu_id=?'.format(columns)
+    userByFaceIDSQL = 'SELECT {} FROM users WHERE face_id=? LIMIT 1'.format(columns)
+    insertUserSQL = 'INSERT INTO users (stu_id, cn_name, en_name) VALUES (?, ?, ?)'
+    updateUserSQL = 'UPDATE users SET cn_name=?, en_name=? WHERE stu_id=?'
+    upsertUserSQL = '''INSERT INTO users (stu_id, cn_name, en_name) VALUES (?, ?, ?)
+                       ON CONFLICT(stu_id) DO UPDATE SET cn_name=excluded.cn_name, en_name=excluded.en_name'''
+    insertIgnoreUserSQL = 'INSERT OR IGNORE INTO users (stu_id, cn_name, en_name) VALUES (?, ?, ?)'
+    hasUpsert = sqlite3.sqlite_version_info >= (3, 24, 0)  # UPSERT语法需要SQLite 3.24及以上版本
+    deleteUserSQL = 'DELETE FROM users WHERE stu_id=?'
+    searchStuIDSQL = 'SELECT {} FROM users WHERE stu_id>=? AND stu_id<? ORDER BY stu_id LIMIT ?'.format(columns)
+    searchFullTextSQL = '''SELECT {} FROM users_fts JOIN users ON users.rowid=users_fts.rowid
+                           WHERE users_fts MATCH ? ORDER BY users_fts.rowid LIMIT ?'''.format(
+        ', '.join('users.' + column for column in columns.split(', ')))
+    searchNameSQL = '''SELECT {0} FROM users WHERE cn_name LIKE ? ESCAPE '\\'
+                       UNION SELECT {0} FROM users WHERE en_name LIKE ? ESCAPE '\\' LIMIT ?'''.format(columns)
+    faceIDSQL = 'SELECT face_id FROM users WHERE stu_id=?'
+    maxFaceIDSQL = 'SELECT MAX(face_id) FROM users'
+    setFaceIDSQL = 'UPDATE users SET face_id=? WHERE stu_id=?'
+
+    def __init__(self, path='./FaceBase.db', timeout=5.0):
+        self.path = path
+        self.timeout = timeout  # 等待其它连接释放写锁的时间（秒）
+        self.local = threading.local()  # 每个线程的连接
+        self.lock = threading.Lock()
+        self.connections = []  # 所有线程的连接，关闭时统一释放
+        self.isMigrated = False
+        self.hasFullText = False  # SQLite是否支持FTS5并已建立全文索引
+
+    # 数据库文件是否存在，管理端和识别端不应创建空数据库
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    # 获取当前线程的连接，第一次使用时创建并完成迁移
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # 自动提交模式，写入通过transaction显式开启事务
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')  # WAL模式下仍能保证数据库一致性
+            with self.lock:
+                if not self.isMigrated:
+                    self.migrate(conn)
+                    self.isMigrated = True
+                self.connections.append(conn)
+            self.local.conn = conn
+        return conn
+
+    # 创建或升级数据库结构，旧版本的数据库会补建索引并切换为WAL模式
+    def migrate(self, conn):
+        conn.execute('PRAGMA journal_mode=WAL')  # 日志模式保存在数据库文件中，只需设置一次
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < self.schemaVersion:
+            with self.transaction(conn):
+                if version < 1:
+                    conn.execute(self.createTableSQL)
+                    conn.execute(self.createFaceIDIndexSQL)
+                if version < 2:
+                    for sql in self.createNameIndexSQL:
+                        conn.execute(sql)
+                conn.execute('PRAGMA user_version={}'.format(self.schemaVersion))
+
+        # 全文索引依赖FTS5扩展，不支持时使用姓名前缀查询
+        self.hasFullText = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='users_fts'").fetchone()[0] > 0
+        if not self.hasFullText:
+            try:
+                with self.transaction(conn):
+                    for sql in self.createFullTextSQL:
+                        conn.execute(sql)
+            except sqlite3.OperationalError:
+                pass
+            else:
+                self.hasFullText = True
+
+    # 写事务，BEGIN IMMEDIATE在开始时就获取写锁，避免读后写时与其它连接发生死锁
+    @contextmanager
+    def transaction(self, conn=None):
+        conn = conn or self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def userCount(self):
+        return self.connection().execute(self.countSQL).fetchone()[0]
+
+    # 按插入顺序读取一页用户，供管理端表格按需加载
+    def usersPage(self, offset, limit):
+        return self.connection().execute(self.usersPageSQL, (limit, offset)).fetchall()
+
+    # 按学号查询用户，返回(stu_id, face_id, cn_name, en_name, created_time)，不存在时返回None
+    def getUser(self, stu_id):
+        return self.connection().execute(self.userSQL, (stu_id,)).fetchone()
+
+    # 按人脸ID查询用户，识别端每帧调用
+    def getUserByFaceID(self, face_id):
+        return self.connection().execute(self.userByFaceIDSQL, (face_id,)).fetchone()
+
+    # 搜索用户：纯数字按学号前缀查询，否则按学号、中文名和汉语拼音的词前缀全文查询
+    # 多个关键词之间为“且”的关系，例如“zhang san”
+    def searchUsers(self, text, limit=200):
+        text = text.strip()
+        if not text:
+            return []
+        conn = self.connection()
+        if text.isdigit():
+            # 学号是主键，范围查询直接走主键索引
+            upper = text[:-1] + chr(ord(text[-1]) + 1)
+            return conn.execute(self.searchStuIDSQL, (text, upper, limit)).fetchall()
+        if self.hasFullText:
+            query = ' '.join('"{}"*'.format(token.replace('"', '""')) for token in text.split())
+            return conn.execute(self.searchFullTextSQL, (query, limit)).fetchall()
+        pattern = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return conn.execute(self.searchNameSQL, (pattern, pattern, limit)).fetchall()
+
+    def insertUser(self, stu_id, cn_name, en_name):
+        with self.transaction() as conn:
+            conn.execute(self.insertUserSQL, (stu_id, cn_name, en_name))
+
+    def updateUser(self, stu_id, cn_name, en_name):
+        with self.transaction() as conn:
+            conn.execute(self.updateUserSQL, (cn_name, en_name, stu_id))
+
+    # 在一个事务中写入多个用户，已存在的用户更新姓名，保留原有的face_id
+    def upsertUsers(self, rows):
+        with self.transaction() as conn:
+            if self.hasUpsert:
+                conn.executemany(self.upsertUserSQL, rows)
+            else:  # 较旧的SQLite先插入新用户，再更新全部用户的姓名
+                conn.executemany(self.insertIgnoreUserSQL, rows)
+                conn.executemany(self.updateUserSQL, [(cn_name, en_name, stu_id) for stu_id, cn_name, en_name in rows])
+
+    def deleteUser(self, stu_id):
+        with self.transaction() as conn:
+            return conn.execute(self.deleteUserSQL, (stu_id,)).rowcount > 0
+
+    # 在一个事务中更新多个用户的人脸ID，rows为(stu_id, face_id)
+    def setFaceIDs(self, rows):
+        with self.transaction() as conn:
+            conn.executemany(self.setFaceIDSQL, [(face_id, stu_id) for stu_id, face_id in rows])
+
+    # 返回用户的人脸ID，尚未分配时分配一个新的人脸ID
+    def assignFaceID(self, stu_id):
+        with self.transaction() as conn:
+            face_id = conn.execute(self.faceIDSQL, (stu_id,)).fetchone()[0]
+            if face_id is None or face_id < 0:
+                face_id = max(conn.execute(self.maxFaceIDSQL).fetchone()[0] or 0, 0) + 1
+                conn.execute(self.setFaceIDSQL, (face_id, stu_id))
+            return face_id
+
+    # 关闭所有线程的连接
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
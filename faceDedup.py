@@ -0,0 +1,49 @@
+from configparser import ConfigParser
+
+import cv2
+import numpy as np
+
+
+# 近似重复样本过滤，使用差值哈希（dHash）比较人脸样本
+# 摄像头连续采集的相邻帧几乎相同，保留它们只会增加磁盘占用、训练时间和人脸库大小，不会提高识别准确率
+class SampleDeduplicator:
+    def __init__(self, enabled=True, hashSize=8, threshold=3):
+        self.enabled = enabled  # 是否过滤近似重复样本
+        self.hashSize = hashSize  # 哈希边长，哈希位数为hashSize*hashSize
+        self.threshold = threshold  # 汉明距离不超过该值的两个样本认为是近似重复
+
+        self.hashes = []  # 当前用户已保留样本的哈希
+        self.droppedCount = 0  # 已丢弃的样本数
+
+    # 从配置文件读取去重参数
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return SampleDeduplicator(
+            cfg.getboolean('dedup', 'enabled', fallback=True),
+            cfg.getint('dedup', 'hash_size', fallback=8),
+            cfg.getint('dedup', 'threshold', fallback=3),
+        )
+
+    # 计算灰度人脸的差值哈希：缩小到(hashSize+1)*hashSize后比较水平相邻像素的大小
+    def hash(self, face):
+        small = cv2.resize(face, (self.hashSize + 1, self.hashSize), interpolation=cv2.INTER_AREA)
+        bits = small[:, 1:] > small[:, :-1]
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    # 判断样本是否与已保留的样本近似重复，不重复时记录该样本的哈希
+    def isDuplicate(self, face):
+        if not self.enabled:
+            return False
+        value = self.hash(face)
+        for kept in self.hashes:
+            if bin(value ^ kept).count('1') <= self.threshold:
+                self.droppedCount += 1
+                return True
+        self.hashes.append(value)
+        return False
+
+    # 开始处理新的用户，已丢弃的样本数继续累计
+    def reset(self):
+        self.hashes = []
@@ -0,0 +1,60 @@
+import logging
+import os
+from configparser import ConfigParser
+
+import cv2
+
+
+# Haar人脸检测，采集、管理和识别共用同一组检测参数
+# 参数保存在单独的配置文件中，可由cascadeTuner.py根据本机实测的检测耗时和召回率重新生成
+class FaceDetector:
+    defaultCascade = './haarcascades/haarcascade_frontalface_default.xml'
+
+    def __init__(self, cascade=defaultCascade, scaleFactor=1.3, minNeighbors=5, minSize=90):
+        self.scaleFactor = scaleFactor  # 图像金字塔相邻两层的缩放比例
+        self.minNeighbors = minNeighbors  # 候选框最少相邻数
+        self.minSize = minSize  # 最小人脸边长（像素）
+        self.cascade = cv2.CascadeClassifier(cascade)
+        if self.cascade.empty() and cascade != self.defaultCascade:
+            logging.warning('无法加载Haar分类器{}，使用默认分类器'.format(cascade))
+            cascade = self.defaultCascade
+            self.cascade = cv2.CascadeClassifier(cascade)
+        self.cascadePath = cascade
+
+    # 从配置文件读取检测参数
+    @staticmethod
+    def fromConfig(path='./config/detector.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return FaceDetector(
+            cfg.get('detector', 'cascade', fallback=FaceDetector.defaultCascade),
+            cfg.getfloat('detector', 'scale_factor', fallback=1.3),
+            cfg.getint('detector', 'min_neighbors', fallback=5),
+            cfg.getint('detector', 'min_size', fallback=90),
+        )
+
+    # 检测灰度图中的人脸，返回[(x, y, w, h)]；scale为图像相对原图的缩放比例，最小人脸边长随之缩放
+    def detect(self, gray, scale=1.0):
+        minSize = max(30, int(self.minSize * scale))
+        return self.cascade.detectMultiScale(gray, self.scaleFactor, self.minNeighbors, minSize=(minSize, minSize))
+
+    # 写入配置文件，comments为写在文件开头的说明
+    def save(self, path='./config/detector.cfg', comments=()):
+        lines = ['; ' + comment for comment in comments]
+        lines += [
+            '[detector]',
+            '; Haar分类器文件，./haarcascades下的frontalface_default、alt、alt2、alt_tree均可使用',
+            'cascade = {}'.format(self.cascadePath),
+            '; 图像金字塔相邻两层的缩放比例，越小越不容易漏检，检测耗时越长',
+            'scale_factor = {}'.format(self.scaleFactor),
+            '; 候选框最少相邻数，越大误检越少，也越容易漏检',
+            'min_neighbors = {}'.format(self.minNeighbors),
+            '; 最小人脸边长（像素），越大检测越快，距离摄像头较远的人脸会被忽略',
+            'min_size = {}'.format(self.minSize),
+        ]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(path + '.tmp', path)
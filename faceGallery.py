@@ -0,0 +1,598 @@
+import argparse
+import math
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+
+import cv2
+import numpy as np
+
+# 二进制人脸库格式（.fgal）：
+# 64字节文件头 | float32直方图矩阵（rows x cols，连续存储） | int32标签向量（rows）
+# 文件头：魔数，格式版本，样本数，直方图维度，LBP半径，LBP邻域点数，网格列数，网格行数，矩阵存储顺序，标志位
+GALLERY_MAGIC = b'FGAL'
+GALLERY_VERSION = 1
+GALLERY_HEADER = struct.Struct('<4s8I')
+# 标志位紧跟在文件头字段之后，位于补齐区内，旧文件中为0
+GALLERY_FLAGS = struct.Struct('<I')
+# 所有样本都是归一化的LBP直方图（每个网格的直方图之和为1），每个样本的元素和均为gridX*gridY
+GALLERY_FLAG_NORMALIZED = 1
+GALLERY_HEADER_SIZE = 64  # 文件头补齐到64字节，保证直方图矩阵按缓存行对齐
+
+# 矩阵存储顺序：按样本存储（每个样本的直方图连续）或按特征存储（所有样本的同一维连续）
+# 按特征存储时，匹配只需读取查询直方图非零维度对应的连续行，GalleryRecognizer优先使用这种顺序
+LAYOUT_SAMPLE_MAJOR = 0
+LAYOUT_FEATURE_MAJOR = 1
+
+
+# 人脸库文件格式错误
+class GalleryFormatError(ValueError):
+    pass
+
+
+# 人脸库，histograms和labels可以是内存映射数组，也可以是普通数组
+# histograms的逻辑形状始终为（样本数，直方图维度），按特征存储时是转置矩阵的视图
+class Gallery:
+    def __init__(self, histograms, labels, radius=1, neighbors=8, gridX=8, gridY=8, normalized=False):
+        self.histograms = histograms  # 直方图矩阵，每行一个样本
+        self.labels = labels  # 标签向量，即face_id
+        self.radius = radius  # LBP半径
+        self.neighbors = neighbors  # LBP邻域点数
+        self.gridX = gridX  # 网格列数
+        self.gridY = gridY  # 网格行数
+        self.normalized = normalized  # 是否所有样本都是归一化的直方图，元素和均为gridX*gridY
+
+    def __len__(self):
+        return len(self.labels)
+
+
+# 保存人脸库，先写入临时文件再替换，避免读到写了一半的文件
+def saveGallery(path, gallery, layout=LAYOUT_FEATURE_MAJOR):
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as file:
+        for part in galleryParts(gallery, layout):
+            file.write(part)
+    os.replace(tmpPath, path)
+
+
+# 人脸库文件的各部分：文件头、直方图矩阵和标签向量，依次写入即为完整的文件
+def galleryParts(gallery, layout=LAYOUT_FEATURE_MAJOR):
+    histograms = np.asarray(gallery.histograms, dtype=np.float32)
+    labels = np.ascontiguousarray(gallery.labels, dtype=np.int32).reshape(-1)
+    if histograms.ndim != 2 or histograms.shape[0] != labels.shape[0]:
+        raise GalleryFormatError('直方图矩阵与标签数量不一致')
+
+    rows, cols = histograms.shape
+    header = GALLERY_HEADER.pack(GALLERY_MAGIC, GALLERY_VERSION, rows, cols, gallery.radius, gallery.neighbors,
+                                 gallery.gridX, gallery.gridY, layout)
+    # 保存时数据已在内存中，顺便检查是否归一化，加载时即可省去遍历整个矩阵计算元素和
+    if isNormalized(histograms, gallery.gridX, gallery.gridY):
+        header += GALLERY_FLAGS.pack(GALLERY_FLAG_NORMALIZED)
+    if layout == LAYOUT_FEATURE_MAJOR:
+        histograms = histograms.T
+
+    return header.ljust(GALLERY_HEADER_SIZE, b'\0'), np.ascontiguousarray(histograms), labels
+
+
+# 读取人脸库，默认使用内存映射，启动时只读取文件头，直方图数据按需由操作系统换页
+def loadGallery(path, mmap=True):
+    with open(path, 'rb') as file:
+        header = file.read(GALLERY_HEADER_SIZE)
+    if len(header) < GALLERY_HEADER_SIZE:
+        raise GalleryFormatError('{}不是有效的人脸库文件'.format(path))
+
+    magic, version, rows, cols, radius, neighbors, gridX, gridY, layout = GALLERY_HEADER.unpack_from(header)
+    flags, = GALLERY_FLAGS.unpack_from(header, GALLERY_HEADER.size)
+    if magic != GALLERY_MAGIC:
+        raise GalleryFormatError('{}不是有效的人脸库文件'.format(path))
+    if version != GALLERY_VERSION:
+        raise GalleryFormatError('不支持的人脸库格式版本：{}'.format(version))
+    if layout not in (LAYOUT_SAMPLE_MAJOR, LAYOUT_FEATURE_MAJOR):
+        raise GalleryFormatError('不支持的人脸库存储顺序：{}'.format(layout))
+
+    expectedSize = GALLERY_HEADER_SIZE + rows * cols * 4 + rows * 4
+    if os.path.getsize(path) != expectedSize:
+        raise GalleryFormatError('{}文件大小与文件头不一致，文件可能已损坏'.format(path))
+
+    labelsOffset = GALLERY_HEADER_SIZE + rows * cols * 4
+    shape = (cols, rows) if layout == LAYOUT_FEATURE_MAJOR else (rows, cols)
+    if rows == 0 or cols == 0:  # 空人脸库无法映射，直接返回空数组
+        histograms = np.zeros(shape, dtype=np.float32)
+        labels = np.zeros(rows, dtype=np.int32)
+    elif mmap:
+        histograms = np.memmap(path, dtype=np.float32, mode='r', offset=GALLERY_HEADER_SIZE, shape=shape)
+        labels = np.memmap(path, dtype=np.int32, mode='r', offset=labelsOffset, shape=(rows,))
+    else:
+        with open(path, 'rb') as file:
+            file.seek(GALLERY_HEADER_SIZE)
+            histograms = np.fromfile(file, dtype=np.float32, count=rows * cols).reshape(shape)
+            labels = np.fromfile(file, dtype=np.int32, count=rows)
+    if layout == LAYOUT_FEATURE_MAJOR:
+        histograms = histograms.T
+
+    return Gallery(histograms, labels, radius, neighbors, gridX, gridY, bool(flags & GALLERY_FLAG_NORMALIZED))
+
+
+# 每个样本的元素和是否都等于归一化LBP直方图的元素和gridX*gridY
+def isNormalized(histograms, gridX, gridY):
+    if len(histograms) == 0:
+        return False
+    sums = np.asarray(histograms).sum(axis=1, dtype=np.float64)
+    return bool(np.allclose(sums, gridX * gridY, rtol=1e-4, atol=0))
+
+
+# 从已训练的OpenCV LBPH识别器中导出人脸库
+def galleryFromRecognizer(recognizer):
+    histograms = recognizer.getHistograms()
+    if histograms:
+        histograms = np.vstack([np.asarray(h, dtype=np.float32).reshape(1, -1) for h in histograms])
+    else:
+        histograms = np.zeros((0, 0), dtype=np.float32)
+    labels = np.asarray(recognizer.getLabels(), dtype=np.int32).reshape(-1)
+    # 按标签排序保存，GalleryRecognizer加载时无需再重排样本
+    order = np.argsort(labels, kind='stable')
+    histograms, labels = histograms[order], labels[order]
+    return Gallery(histograms, labels, recognizer.getRadius(), recognizer.getNeighbors(), recognizer.getGridX(),
+                   recognizer.getGridY())
+
+
+# 将YAML格式的LBPH模型转换为二进制人脸库
+def convertFromYaml(ymlPath, galleryPath):
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(ymlPath)
+    gallery = galleryFromRecognizer(recognizer)
+    saveGallery(galleryPath, gallery)
+    return gallery
+
+
+# 计算LBP特征图，与OpenCV LBPH的elbp实现逐像素一致
+def lbpImage(src, radius=1, neighbors=8):
+    src = np.asarray(src)
+    rows, cols = src.shape
+    height, width = rows - 2 * radius, cols - 2 * radius
+    center = src[radius:radius + height, radius:radius + width]
+    codes = np.zeros((height, width), dtype=np.int32)
+
+    for n in range(neighbors):
+        # 采样点坐标及双线性插值权重，计算精度与OpenCV保持一致
+        x = np.float32(radius * math.cos(2.0 * math.pi * n / float(neighbors)))
+        y = np.float32(-radius * math.sin(2.0 * math.pi * n / float(neighbors)))
+        fx, fy = int(math.floor(x)), int(math.floor(y))
+        cx, cy = int(math.ceil(x)), int(math.ceil(y))
+        ty, tx = y - np.float32(fy), x - np.float32(fx)
+        w1 = (np.float32(1) - tx) * (np.float32(1) - ty)
+        w2 = tx * (np.float32(1) - ty)
+        w3 = (np.float32(1) - tx) * ty
+        w4 = tx * ty
+
+        t = (w1 * src[radius + fy:radius + fy + height, radius + fx:radius + fx + width] +
+             w2 * src[radius + fy:radius + fy + height, radius + cx:radius + cx + width] +
+             w3 * src[radius + cy:radius + cy + height, radius + fx:radius + fx + width] +
+             w4 * src[radius + cy:radius + cy + height, radius + cx:radius + cx + width])
+        codes |= ((t > center) | (np.abs(t - center) < np.finfo(np.float32).eps)).astype(np.int32) << n
+
+    return codes
+
+
+# 计算LBP空间直方图，与OpenCV LBPH的spatial_histogram实现一致
+def lbpHistogram(face, radius=1, neighbors=8, gridX=8, gridY=8):
+    codes = lbpImage(face, radius, neighbors)
+    numPatterns = 2 ** neighbors
+    width = codes.shape[1] // gridX
+    height = codes.shape[0] // gridY
+    if width == 0 or height == 0:
+        return np.zeros(gridX * gridY * numPatterns, dtype=np.float32)
+
+    # 将每个像素的LBP编码偏移到所在网格的直方图区间，一次bincount完成所有网格的统计
+    cells = codes[:gridY * height, :gridX * width].reshape(gridY, height, gridX, width)
+    cellIndex = (np.arange(gridY)[:, None, None, None] * gridX + np.arange(gridX)[None, None, :, None])
+    bins = np.bincount((cellIndex * numPatterns + cells).ravel(), minlength=gridX * gridY * numPatterns)
+    return bins.astype(np.float32) * np.float32(1.0 / (width * height))
+
+
+# 基于二进制人脸库的人脸识别器，predict接口与cv2.face.LBPHFaceRecognizer保持一致
+# 整个人脸库按特征存储为一个连续矩阵，一次向量化计算得到查询直方图到所有样本的距离
+# 每个用户的样本在矩阵中占据连续的一段，可以单独追加或删除，删除的样本在积累到一定比例后才压缩
+class GalleryRecognizer:
+    metrics = ('chisqr', 'l1')  # 支持的距离：卡方距离（与LBPH的HISTCMP_CHISQR_ALT一致），L1距离
+    blockBytes = 8 * 1024 * 1024  # 每次参与计算的矩阵块大小，控制临时内存占用
+    compactRatio = 0.25  # 已删除样本占比超过该值时压缩人脸库
+
+    def __init__(self, gallery, metric='chisqr'):
+        if metric not in self.metrics:
+            raise ValueError('不支持的距离：{}'.format(metric))
+        self.metric = metric
+        self.radius = gallery.radius
+        self.neighbors = gallery.neighbors
+        self.gridX = gallery.gridX
+        self.gridY = gallery.gridY
+        self.lock = threading.Lock()  # 保护增删用户与匹配时取快照
+
+        histograms = gallery.histograms
+        labels = np.asarray(gallery.labels, dtype=np.int32)
+        # 按标签排序，使同一用户的样本相邻，每个用户成为一段
+        order = np.argsort(labels, kind='stable')
+        if np.any(order != np.arange(len(order))):
+            histograms = np.asarray(histograms)[order]
+            labels = labels[order]
+
+        # 按特征存储的人脸库直接使用（内存映射时不会复制），否则转置为按特征存储
+        self.features = histograms.T if histograms.T.flags.c_contiguous else np.ascontiguousarray(histograms.T)
+        self.size = len(labels)  # 矩阵中已使用的列数，包括已删除但尚未压缩的样本
+        # 每个样本直方图的元素和；归一化的人脸库直接使用常数，否则在第一次匹配时计算，避免加载时读取整个矩阵
+        self.sampleSums = np.full(self.size, float(self.gridX * self.gridY)) if gallery.normalized else None
+
+        uniqueLabels, starts = np.unique(labels, return_index=True)
+        self.segmentLabels = uniqueLabels.astype(np.int32)  # 每一段对应的用户标签
+        self.segmentStarts = starts.astype(np.intp)  # 每一段在矩阵中的起始列
+        self.segmentAlive = np.ones(len(uniqueLabels), dtype=bool)  # 每一段是否仍然有效
+        self.segments = {int(label): index for index, label in enumerate(uniqueLabels)}  # 用户标签 -> 段序号
+        self.deadSamples = 0  # 已删除但尚未压缩的样本数
+
+    @staticmethod
+    def read(path, metric='chisqr'):
+        return GalleryRecognizer(loadGallery(path), metric)
+
+    def __len__(self):
+        return self.size - self.deadSamples
+
+    # 每个样本直方图的元素和，尚未计算时计算，调用方须持有self.lock
+    def ensureSampleSums(self):
+        if self.sampleSums is None:
+            self.sampleSums = self.features[:, :self.size].sum(axis=0, dtype=np.float64)
+        return self.sampleSums
+
+    # 计算查询直方图到前size个样本的距离
+    # 卡方距离：sum((g-q)^2/(g+q)) = sum(g) + sum(q) - 4*sum(g*q/(g+q))
+    # L1距离：sum(|g-q|) = sum(g) + sum(q) - 2*sum(min(g, q))
+    # 后一项只在g和q同时非零的维度上不为零，因此只需读取查询直方图非零维度对应的行
+    def distances(self, query, features, size, sampleSums):
+        support = np.flatnonzero(query > 0)
+        accumulator = np.zeros(size, dtype=np.float64)
+        blockRows = max(1, self.blockBytes // max(1, 4 * size))
+        for start in range(0, len(support), blockRows):
+            index = support[start:start + blockRows]
+            g = features[index, :size]
+            q = query[index][:, None]
+            if self.metric == 'chisqr':
+                accumulator += (g * q / (g + q)).sum(axis=0)
+            else:
+                accumulator += np.minimum(g, q).sum(axis=0)
+
+        total = sampleSums + float(query.sum(dtype=np.float64))
+        # 浮点舍入可能使完全相同的直方图得到极小的负距离
+        if self.metric == 'chisqr':
+            return np.maximum(2 * (total - 4 * accumulator), 0)
+        return np.maximum(total - 2 * accumulator, 0)
+
+    # 匹配人脸，返回距离最近的k个用户及其距离，按距离升序排列，调用方可据此判断最优与次优之间的差距
+    def match(self, face, k=1):
+        return self.matchHistogram(lbpHistogram(face, self.radius, self.neighbors, self.gridX, self.gridY), k)
+
+    # 匹配已计算好的LBP直方图
+    # 在锁内取得当前数据的快照，距离计算在锁外进行，多个线程可以同时匹配
+    # 增删用户只会替换数组或写入快照范围之外的列，不会修改快照中的数据
+    def matchHistogram(self, query, k=1):
+        with self.lock:
+            features, size, sampleSums = self.features, self.size, self.ensureSampleSums()
+            segmentLabels, segmentStarts = self.segmentLabels, self.segmentStarts
+            segmentAlive = self.segmentAlive.copy()
+
+        aliveCount = int(segmentAlive.sum())
+        if aliveCount == 0:
+            return []
+        distances = self.distances(query, features, size, sampleSums)
+        userDistances = np.minimum.reduceat(distances, segmentStarts)  # 每个用户取最近样本的距离
+        userDistances[~segmentAlive] = np.inf
+        k = min(k, aliveCount)
+        nearest = np.argpartition(userDistances, k - 1)[:k]
+        nearest = nearest[np.argsort(userDistances[nearest], kind='stable')]
+        return [(int(segmentLabels[i]), float(userDistances[i])) for i in nearest]
+
+    # 预测人脸，返回最近样本的标签和距离（即置信度，越小越可靠）
+    def predict(self, face):
+        result = self.match(face, 1)
+        if not result:
+            return -1, float('inf')
+        return result[0]
+
+    # 追加一个用户的样本，已存在的用户会先删除旧的一段
+    def addUser(self, label, histograms):
+        histograms = np.asarray(histograms, dtype=np.float32)
+        if len(histograms) == 0:
+            return self.removeUser(label)
+
+        with self.lock:
+            self.removeSegment(label)
+            count = len(histograms)
+            capacity = self.features.shape[1]
+            # 内存映射的人脸库是只读的，第一次追加时复制到内存；容量不足时按倍数扩容，摊还复制开销
+            if not self.features.flags.writeable or self.size + count > capacity:
+                capacity = max(2 * capacity, self.size + count, 16)
+                features = np.empty((histograms.shape[1], capacity), dtype=np.float32)
+                if self.size > 0:
+                    features[:, :self.size] = self.features[:, :self.size]
+                self.features = features
+            self.features[:, self.size:self.size + count] = histograms.T
+
+            self.sampleSums = np.concatenate([self.ensureSampleSums(), histograms.sum(axis=1, dtype=np.float64)])
+            self.segmentLabels = np.append(self.segmentLabels, np.int32(label))
+            self.segmentStarts = np.append(self.segmentStarts, self.size)
+            self.segmentAlive = np.append(self.segmentAlive, True)
+            self.segments[int(label)] = len(self.segmentLabels) - 1
+            self.size += count
+        return True
+
+    # 删除一个用户的样本，只做标记，不立即移动数据
+    def removeUser(self, label):
+        with self.lock:
+            return self.removeSegment(label)
+
+    # 标记删除一段，调用方须持有self.lock
+    def removeSegment(self, label):
+        index = self.segments.pop(int(label), None)
+        if index is None:
+            return False
+        self.segmentAlive[index] = False
+        self.deadSamples += self.segmentLength(index)
+        if self.deadSamples > self.compactRatio * self.size:
+            self.compact()
+        return True
+
+    def segmentLength(self, index):
+        stop = self.segmentStarts[index + 1] if index + 1 < len(self.segmentStarts) else self.size
+        return int(stop - self.segmentStarts[index])
+
+    # 压缩人脸库，移除已删除的样本，调用方须持有self.lock
+    def compact(self):
+        lengths = np.array([self.segmentLength(index) for index in range(len(self.segmentStarts))], dtype=np.intp)
+        keep = np.repeat(self.segmentAlive, lengths)
+        self.sampleSums = self.ensureSampleSums()[keep]
+        self.features = np.ascontiguousarray(self.features[:, :self.size][:, keep])
+        self.size = self.features.shape[1]
+
+        lengths = lengths[self.segmentAlive]
+        self.segmentLabels = self.segmentLabels[self.segmentAlive]
+        self.segmentStarts = (np.cumsum(lengths) - lengths).astype(np.intp)
+        self.segmentAlive = np.ones(len(self.segmentLabels), dtype=bool)
+        self.segments = {int(label): index for index, label in enumerate(self.segmentLabels)}
+        self.deadSamples = 0
+
+
+# 分片人脸识别器，每个分片是一个独立的GalleryRecognizer，查询时并行计算各分片再取距离最小的结果
+# 各分片的用户互不重叠，单个分片的样本数决定了每张人脸的识别延迟
+class ShardedRecognizer:
+    def __init__(self, shards):
+        if not shards:
+            raise ValueError('至少需要一个分片')
+        first = shards[0]
+        for shard in shards:
+            if (shard.radius, shard.neighbors, shard.gridX, shard.gridY) != \
+                    (first.radius, first.neighbors, first.gridX, first.gridY):
+                raise ValueError('各分片的LBP参数不一致')
+        self.shards = shards
+        self.radius = first.radius
+        self.neighbors = first.neighbors
+        self.gridX = first.gridX
+        self.gridY = first.gridY
+        self.executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='GalleryShard')
+
+    # 将人脸库切分为若干分片，每个分片是一段连续的face_id，并尽量使各分片的样本数相同
+    @staticmethod
+    def fromGallery(gallery, count, metric='chisqr'):
+        return ShardedRecognizer([GalleryRecognizer(shard, metric) for shard in splitGallery(gallery, count)])
+
+    @staticmethod
+    def read(paths, metric='chisqr'):
+        return ShardedRecognizer([GalleryRecognizer.read(path, metric) for path in paths])
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    # 查询直方图只计算一次，各分片并行匹配，合并后取距离最小的k个用户
+    def match(self, face, k=1):
+        query = lbpHistogram(face, self.radius, self.neighbors, self.gridX, self.gridY)
+        if len(self.shards) == 1:
+            return self.shards[0].matchHistogram(query, k)
+        try:
+            results = self.executor.map(lambda shard: shard.matchHistogram(query, k), self.shards)
+        except RuntimeError:  # 识别器已被替换并关闭，仍在使用它的调用方逐个分片匹配
+            results = [shard.matchHistogram(query, k) for shard in self.shards]
+        return sorted((candidate for result in results for candidate in result), key=lambda c: c[1])[:k]
+
+    def predict(self, face):
+        result = self.match(face, 1)
+        if not result:
+            return -1, float('inf')
+        return result[0]
+
+    # 已存在的用户在原分片中更新，新用户追加到样本数最少的分片
+    def addUser(self, label, histograms):
+        for shard in self.shards:
+            if int(label) in shard.segments:
+                return shard.addUser(label, histograms)
+        return min(self.shards, key=len).addUser(label, histograms)
+
+    def removeUser(self, label):
+        return any([shard.removeUser(label) for shard in self.shards])
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+# 按face_id切分人脸库，每个分片是一段连续的face_id，同一用户的样本不会被分到不同分片
+def splitGallery(gallery, count):
+    labels = np.asarray(gallery.labels)
+    histograms = gallery.histograms
+    order = np.argsort(labels, kind='stable')
+    if np.any(order != np.arange(len(order))):
+        histograms = np.asarray(histograms)[order]
+        labels = labels[order]
+
+    # 每个用户的起始位置，按样本数均分后对齐到用户边界
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]]) if len(labels) else np.zeros(0, dtype=np.intp)
+    count = max(1, min(count, len(starts)))
+    bounds = [0]
+    for i in range(1, count):
+        target = len(labels) * i // count
+        bound = int(starts[min(np.searchsorted(starts, target), len(starts) - 1)])
+        bounds.append(max(bound, bounds[-1]))
+    bounds.append(len(labels))
+
+    return [Gallery(histograms[start:stop], labels[start:stop], gallery.radius, gallery.neighbors, gallery.gridX,
+                    gallery.gridY, gallery.normalized) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start or count == 1]
+
+
+# 保存分片人脸库，每次训练都会按当前分片数重新均衡，并删除多余的旧分片
+def saveShards(root, gallery, count):
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    shards = splitGallery(gallery, count)
+    for index, shard in enumerate(shards):
+        saveGallery(shardPath(root, index), shard)
+    for path in listShards(root)[len(shards):]:
+        os.remove(path)
+    return len(shards)
+
+
+def shardPath(root, index):
+    return os.path.join(root, 'shard_{}.fgal'.format(index))
+
+
+# 按分片序号列出分片文件
+def listShards(root):
+    if not os.path.isdir(root):
+        return []
+    indexes = []
+    for name in os.listdir(root):
+        if name.startswith('shard_') and name.endswith('.fgal') and name[6:-5].isdigit():
+            indexes.append(int(name[6:-5]))
+    return [shardPath(root, index) for index in sorted(indexes)]
+
+
+# 按用户分段持久化的人脸库，每个用户的直方图保存为目录下一个独立的user_<face_id>.fgal文件
+# 增加或删除用户只需写入或删除对应文件，识别端检测到文件变化后增量更新GalleryRecognizer
+class GalleryStore:
+    def __init__(self, root):
+        self.root = root  # 人脸库目录
+
+    def segmentPath(self, label):
+        return os.path.join(self.root, 'user_{}.fgal'.format(label))
+
+    # 目录的修改时间，增加、替换或删除用户段都会改变它；目录不存在时返回None
+    # 识别端据此判断是否需要重新列出用户段，不必每次都读取每个文件的修改时间
+    def modified(self):
+        try:
+            return os.stat(self.root).st_mtime_ns
+        except OSError:
+            return None
+
+    # 列出所有用户段，返回 用户标签 -> 文件修改时间
+    def segments(self):
+        result = {}
+        if not os.path.isdir(self.root):
+            return result
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                name = entry.name
+                if not (name.startswith('user_') and name.endswith('.fgal')):
+                    continue
+                try:
+                    result[int(name[5:-5])] = entry.stat().st_mtime_ns
+                except (ValueError, OSError):  # 文件名不合法或文件已被删除
+                    continue
+        return result
+
+    # 增加/更新一个用户段；onlyIfChanged为True时，与已有用户段内容相同则不重写，返回是否写入了文件
+    def addUser(self, label, histograms, radius=1, neighbors=8, gridX=8, gridY=8, onlyIfChanged=False):
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        histograms = np.asarray(histograms, dtype=np.float32)
+        labels = np.full(len(histograms), label, dtype=np.int32)
+        path = self.segmentPath(label)
+        data = b''.join(part if isinstance(part, bytes) else part.tobytes() for part in galleryParts(
+            Gallery(histograms, labels, radius, neighbors, gridX, gridY), LAYOUT_SAMPLE_MAJOR))  # 单个用户的数据量很小
+        if onlyIfChanged and self.isUnchanged(path, data):
+            return False
+        with open(path + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(path + '.tmp', path)
+        return True
+
+    # 用户段文件与data完全相同：先比较文件大小，大小相同时再逐字节比较
+    @staticmethod
+    def isUnchanged(path, data):
+        try:
+            if os.path.getsize(path) != len(data):
+                return False
+            with open(path, 'rb') as file:
+                return file.read() == data
+        except OSError:
+            return False
+
+    # 删除一个用户段
+    def removeUser(self, label):
+        try:
+            os.remove(self.segmentPath(label))
+        except FileNotFoundError:
+            return False
+        return True
+
+    # 训练时的预处理选项，保存在人脸库目录下；采集端追加用户时使用相同的选项，追加的用户段才能与训练得到的一致
+    def optionsPath(self):
+        return os.path.join(self.root, 'options.cfg')
+
+    def saveOptions(self, equalizeHist=False):
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        cfg = ConfigParser()
+        cfg['train'] = {'equalize_hist': 'true' if equalizeHist else 'false'}
+        with open(self.optionsPath() + '.tmp', 'w', encoding='utf-8') as file:
+            cfg.write(file)
+        os.replace(self.optionsPath() + '.tmp', self.optionsPath())
+
+    # 读取训练时的预处理选项，尚未训练时返回默认值
+    def loadOptions(self):
+        cfg = ConfigParser()
+        cfg.read(self.optionsPath(), encoding='utf-8-sig')
+        return {'equalizeHist': cfg.getboolean('train', 'equalize_hist', fallback=False)}
+
+    def loadSegment(self, label):
+        return loadGallery(self.segmentPath(label), mmap=False)
+
+    # 合并所有用户段为一个人脸库
+    def load(self):
+        segments = [self.loadSegment(label) for label in sorted(self.segments())]
+        if not segments:
+            return Gallery(np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int32))
+        first = segments[0]
+        return Gallery(np.vstack([segment.histograms for segment in segments]),
+                       np.concatenate([segment.labels for segment in segments]),
+                       first.radius, first.neighbors, first.gridX, first.gridY,
+                       all(segment.normalized for segment in segments))
+
+    # 用完整训练得到的人脸库替换全部用户段，只重写样本发生变化的用户，返回(写入的用户数, 删除的用户数)
+    # 未变化的用户段保持原文件和修改时间，识别端也就不会重新同步这些用户
+    def replaceAll(self, gallery):
+        labels = np.asarray(gallery.labels)
+        histograms = np.asarray(gallery.histograms)
+        written = 0
+        for label in np.unique(labels):
+            written += self.addUser(int(label), histograms[labels == label], gallery.radius, gallery.neighbors,
+                                    gallery.gridX, gallery.gridY, onlyIfChanged=True)
+        removed = 0
+        for label in set(self.segments()) - set(int(label) for label in np.unique(labels)):
+            removed += self.removeUser(label)
+        return written, removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='将YAML格式的LBPH模型转换为二进制人脸库')
+    parser.add_argument('yml', nargs='?', default='./recognizer/trainingData.yml', help='LBPH模型文件')
+    parser.add_argument('gallery', nargs='?', default='./recognizer/trainingData.fgal', help='输出的人脸库文件')
+    args = parser.parse_args()
+
+    result = convertFromYaml(args.yml, args.gallery)
+    print('已生成{}，样本数：{}'.format(args.gallery, len(result)))
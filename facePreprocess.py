@@ -0,0 +1,58 @@
+from configparser import ConfigParser
+
+import cv2
+
+
+# 人脸预处理，训练、采集和识别共用，保证进入LBPH的人脸图像尺寸和处理方式一致
+# 固定尺寸使每张人脸的LBP直方图计算量恒定，也减小了采集样本的存储空间
+class FacePreprocessor:
+    def __init__(self, width=100, height=100, equalize=False):
+        self.width = width  # 标准人脸宽度
+        self.height = height  # 标准人脸高度
+        self.equalize = equalize  # 是否对人脸进行直方图均衡化
+
+    # 从配置文件读取预处理参数
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        width = cfg.getint('preprocess', 'width', fallback=100)
+        height = cfg.getint('preprocess', 'height', fallback=100)
+        equalize = cfg.getboolean('preprocess', 'equalize', fallback=False)
+        return FacePreprocessor(width, height, equalize)
+
+    # 从灰度图中截取人脸区域并缩放到标准尺寸，rect为(x, y, w, h)，超出图像边界的部分会被裁掉
+    # 采集时保存的就是这一步的结果，直方图均衡化在训练和识别时统一进行
+    def crop(self, gray, rect):
+        x, y, w, h = (int(v) for v in rect)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, gray.shape[1]), min(y + h, gray.shape[0])
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return self.resize(gray[y0:y1, x0:x1])
+
+    # 将已截取的人脸缩放到标准尺寸
+    def resize(self, face):
+        if face.shape[1] != self.width or face.shape[0] != self.height:
+            # 缩小时使用区域插值，放大时使用双线性插值
+            interpolation = cv2.INTER_AREA if face.shape[1] > self.width else cv2.INTER_LINEAR
+            face = cv2.resize(face, (self.width, self.height), interpolation=interpolation)
+        return face
+
+    # 截取人脸并完成全部预处理，得到送入识别器的人脸图像
+    def normalize(self, gray, rect):
+        face = self.crop(gray, rect)
+        if face is None:
+            return None
+        return self.normalizeCrop(face)
+
+    # 对已截取的人脸完成全部预处理
+    def normalizeCrop(self, face):
+        face = self.resize(face)
+        if self.equalize:
+            face = cv2.equalizeHist(face)
+        return face
+
+    # 判断图像是否已经是标准尺寸的人脸样本
+    def isNormalized(self, img):
+        return img.shape[:2] == (self.height, self.width)
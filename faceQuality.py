@@ -0,0 +1,78 @@
+from configparser import ConfigParser
+
+import cv2
+import numpy as np
+
+
+# 人脸质量门控，在识别之前过滤模糊、过小、过暗/过亮、比例异常或明显侧脸的人脸
+# 这些人脸的识别结果不可靠，直接跳过识别，等待同一人脸质量更好的帧
+class FaceQualityGate:
+    # 跳过原因
+    reasons = ('size', 'aspect', 'brightness', 'blur', 'pose')
+
+    def __init__(self, enabled=True, minSize=90, minAspect=0.75, maxAspect=1.33, minBrightness=40,
+                 maxBrightness=220, minSharpness=30.0, maxAsymmetry=50.0):
+        self.enabled = enabled  # 是否启用质量门控
+        self.minSize = minSize  # 人脸区域最小边长（像素）
+        self.minAspect = minAspect  # 人脸区域宽高比下限
+        self.maxAspect = maxAspect  # 人脸区域宽高比上限
+        self.minBrightness = minBrightness  # 平均亮度下限
+        self.maxBrightness = maxBrightness  # 平均亮度上限
+        self.minSharpness = minSharpness  # 拉普拉斯方差下限，低于该值认为人脸模糊
+        self.maxAsymmetry = maxAsymmetry  # 左右镜像平均差异上限，高于该值认为是明显侧脸
+
+        self.checkedCount = 0  # 已检查的人脸数
+        self.skippedCounts = dict.fromkeys(self.reasons, 0)  # 各原因跳过的人脸数
+
+    # 从配置文件读取质量门控参数
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return FaceQualityGate(
+            cfg.getboolean('quality', 'enabled', fallback=True),
+            cfg.getint('quality', 'min_size', fallback=90),
+            cfg.getfloat('quality', 'min_aspect', fallback=0.75),
+            cfg.getfloat('quality', 'max_aspect', fallback=1.33),
+            cfg.getfloat('quality', 'min_brightness', fallback=40),
+            cfg.getfloat('quality', 'max_brightness', fallback=220),
+            cfg.getfloat('quality', 'min_sharpness', fallback=30.0),
+            cfg.getfloat('quality', 'max_asymmetry', fallback=50.0),
+        )
+
+    # 检查人脸质量，face为预处理后的标准尺寸人脸，width和height为原始人脸区域的尺寸
+    # 返回None表示可以识别，否则返回跳过原因；由便宜到昂贵依次检查，任一项不满足立即返回
+    def check(self, face, width, height):
+        if not self.enabled:
+            return None
+        self.checkedCount += 1
+
+        reason = None
+        if min(width, height) < self.minSize:
+            reason = 'size'
+        elif not self.minAspect <= width / float(height) <= self.maxAspect:
+            reason = 'aspect'
+        else:
+            brightness = float(face.mean())
+            if not self.minBrightness <= brightness <= self.maxBrightness:
+                reason = 'brightness'
+            elif cv2.Laplacian(face, cv2.CV_64F).var() < self.minSharpness:
+                reason = 'blur'
+            elif np.abs(face.astype(np.int16) - face[:, ::-1]).mean() > self.maxAsymmetry:
+                reason = 'pose'
+
+        if reason is not None:
+            self.skippedCounts[reason] += 1
+        return reason
+
+    # 跳过的人脸数，即节省的predict调用次数
+    def skippedCount(self):
+        return sum(self.skippedCounts.values())
+
+    # 生成跳过率报告
+    def report(self):
+        skipped = self.skippedCount()
+        rate = 100.0 * skipped / self.checkedCount if self.checkedCount else 0.0
+        details = '，'.join('{}：{}'.format(reason, count) for reason, count in self.skippedCounts.items() if count)
+        return '质量门控：检查{}张人脸，跳过识别{}次（{:.1f}%）{}'.format(
+            self.checkedCount, skipped, rate, '，' + details if details else '')
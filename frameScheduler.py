@@ -0,0 +1,136 @@
+from configparser import ConfigParser
+
+
+# 按帧耗时预算调度人脸检测线程的工作量，CPU不足时按固定顺序逐级减少工作，负载下降后逐级恢复
+# 0级：正常处理
+# 1级：跳过重复识别，与上一次识别位置重合的人脸直接沿用识别结果，只识别新出现的人脸
+# 2级：仅跟踪帧，每隔若干帧才进行一次人脸检测和识别，其余帧只更新跟踪器
+# 3级：降低检测分辨率，在缩小后的灰度图上检测人脸
+# 4级：跳帧，每处理一帧丢弃一帧摄像头画面，避免画面积压造成延迟
+# 各级的措施逐级叠加
+class FrameScheduler:
+    levels = ('正常', '跳过重复识别', '仅跟踪帧', '降低检测分辨率', '跳帧')
+
+    def __init__(self, enabled=True, budget=66.0, recoverRatio=0.7, holdFrames=15, recoverFrames=30, smoothing=0.2,
+                 trackerInterval=3, detectScale=0.5, reuseFrames=15):
+        self.enabled = enabled  # 是否启用调度
+        self.budget = budget  # 每帧耗时预算（毫秒）
+        self.recoverRatio = recoverRatio  # 平均耗时低于预算的该比例时才开始恢复，避免在两级之间来回切换
+        self.holdFrames = holdFrames  # 切换级别后至少保持的帧数，等待平均耗时反映新级别的负载
+        self.recoverFrames = recoverFrames  # 平均耗时持续低于恢复阈值的帧数达到该值时恢复一级
+        self.smoothing = smoothing  # 帧耗时指数滑动平均的权重
+        self.trackerInterval = trackerInterval  # 仅跟踪帧级别下的检测间隔（帧）
+        self.detectScale = detectScale  # 降低检测分辨率级别下的缩放比例
+        self.reuseFrames = reuseFrames  # 沿用识别结果的最长帧数，超过后重新识别
+
+        self.level = 0
+        self.average = 0.0  # 帧耗时的指数滑动平均（毫秒）
+        self.framesAtLevel = 0  # 当前级别已持续的帧数
+        self.calmFrames = 0  # 平均耗时连续低于恢复阈值的帧数
+        self.levelFrames = [0] * len(self.levels)  # 各级别累计处理的帧数
+        self.frameIndex = 0
+
+    # 从配置文件读取调度参数
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return FrameScheduler(
+            cfg.getboolean('scheduler', 'enabled', fallback=True),
+            cfg.getfloat('scheduler', 'budget', fallback=66.0),
+            cfg.getfloat('scheduler', 'recover_ratio', fallback=0.7),
+            cfg.getint('scheduler', 'hold_frames', fallback=15),
+            cfg.getint('scheduler', 'recover_frames', fallback=30),
+            cfg.getfloat('scheduler', 'smoothing', fallback=0.2),
+            cfg.getint('scheduler', 'tracker_interval', fallback=3),
+            cfg.getfloat('scheduler', 'detect_scale', fallback=0.5),
+            cfg.getint('scheduler', 'reuse_frames', fallback=15),
+        )
+
+    # 本帧是否沿用已有的识别结果
+    def isReuseEnabled(self):
+        return self.level >= 1
+
+    # 本帧是否进行人脸检测和识别
+    def isDetectFrame(self):
+        return self.level < 2 or self.frameIndex % self.trackerInterval == 0
+
+    # 本帧检测使用的缩放比例
+    def scale(self):
+        return self.detectScale if self.level >= 3 else 1.0
+
+    # 本帧之前需要丢弃的摄像头画面数
+    def dropCount(self):
+        return 1 if self.level >= 4 else 0
+
+    # 一帧处理结束，更新平均耗时并调整级别，级别变化时返回(原级别, 新级别)
+    def update(self, frameSeconds):
+        self.levelFrames[self.level] += 1
+        self.frameIndex += 1
+        if not self.enabled:
+            return None
+        milliseconds = frameSeconds * 1000
+        self.average = milliseconds if self.frameIndex == 1 else \
+            self.average + self.smoothing * (milliseconds - self.average)
+        self.framesAtLevel += 1
+        self.calmFrames = self.calmFrames + 1 if self.average < self.budget * self.recoverRatio else 0
+        if self.framesAtLevel < self.holdFrames:
+            return None
+
+        previous = self.level
+        if self.average > self.budget and self.level < len(self.levels) - 1:
+            self.level += 1
+        elif self.calmFrames >= self.recoverFrames and self.level > 0:
+            self.level -= 1
+        if self.level == previous:
+            return None
+        self.framesAtLevel = 0
+        self.calmFrames = 0
+        return previous, self.level
+
+    # 级别变化的说明
+    def describe(self, change):
+        previous, level = change
+        return '帧耗时{:.0f} ms（预算{:.0f} ms），处理级别{}：{} -> {}：{}'.format(
+            self.average, self.budget, '降低' if level > previous else '恢复', previous, level, self.levels[level])
+
+    # 各级别累计帧数
+    def report(self):
+        total = sum(self.levelFrames)
+        if not total:
+            return '尚未处理任何帧'
+        return '各处理级别帧数占比：' + '，'.join(
+            '{}（{}）{:.1%}'.format(level, name, count / total)
+            for level, (name, count) in enumerate(zip(self.levels, self.levelFrames)) if count)
+
+
+# 识别结果缓存，按人脸位置的重合度沿用上一次的识别结果
+class RecognitionCache:
+    def __init__(self, maxAge=15, minOverlap=0.5):
+        self.maxAge = maxAge  # 识别结果最长沿用的帧数
+        self.minOverlap = minOverlap  # 人脸区域的最小IoU
+        self.entries = []  # [(人脸区域, 识别结果, 识别时的帧序号)]
+
+    @staticmethod
+    def overlap(a, b):
+        x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+        x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+        intersection = max(0, x1 - x0) * max(0, y1 - y0)
+        union = a[2] * a[3] + b[2] * b[3] - intersection
+        return intersection / float(union) if union > 0 else 0.0
+
+    # 查找与人脸区域重合且未过期的识别结果，返回(识别结果, 识别时的帧序号)，没有时返回None
+    # 沿用的结果保留原来的帧序号，超过maxAge后该人脸会被重新识别
+    def lookup(self, rect, frameIndex):
+        best, bestOverlap = None, self.minOverlap
+        for cachedRect, result, recognizedAt in self.entries:
+            if frameIndex - recognizedAt > self.maxAge:
+                continue
+            value = self.overlap(rect, cachedRect)
+            if value >= bestOverlap:
+                best, bestOverlap = (result, recognizedAt), value
+        return best
+
+    # 用本帧的识别结果替换缓存，entries为[(人脸区域, 识别结果, 识别时的帧序号)]
+    def update(self, entries):
+        self.entries = entries
@@ -0,0 +1,218 @@
+import logging
+import socket
+import socketserver
+import threading
+import time
+from configparser import ConfigParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import cv2
+
+
+# 一路MJPEG视频流：每帧只编码一次，所有客户端共享同一份JPEG数据
+# 没有客户端时不编码；客户端总是取最新的一帧，处理不过来的客户端直接跳过中间的帧，不会在内存中积压
+class FrameStream:
+    def __init__(self, name, fps=10.0, quality=80, width=0):
+        self.name = name
+        self.fps = fps  # 最高帧率
+        self.quality = quality  # JPEG质量（1~100）
+        self.width = width  # 输出宽度，0表示原始尺寸
+
+        self.condition = threading.Condition()
+        self.frame = None  # 最新的待编码画面
+        self.frameSeq = 0  # 最新画面的序号
+        self.jpeg = None  # 最新编码的JPEG数据
+        self.jpegSeq = 0  # 最新JPEG数据的序号，客户端据此判断是否有新的一帧
+        self.clients = 0  # 当前连接的客户端数
+        self.encodedCount = 0  # 累计编码的帧数
+        self.encodeTime = 0.0  # 累计编码耗时（秒）
+
+        self.encoderThread = threading.Thread(target=self.encodeLoop, name='Stream-' + name, daemon=True)
+        self.encoderThread.start()
+
+    # 检测线程调用，只保存画面引用，编码在本路的编码线程中进行
+    def publish(self, frame):
+        with self.condition:
+            if not self.clients:
+                return
+            self.frame = frame
+            self.frameSeq += 1
+            self.condition.notify_all()
+
+    def encodeLoop(self):
+        encodedSeq = 0
+        lastEncode = 0.0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.frameSeq != encodedSeq)
+                # 按帧率限制编码间隔，期间到达的画面只保留最新的一帧
+                if self.fps > 0:
+                    nextEncode = lastEncode + 1.0 / self.fps
+                    while time.perf_counter() < nextEncode:
+                        self.condition.wait(nextEncode - time.perf_counter())
+                frame, encodedSeq = self.frame, self.frameSeq
+            if frame is None:
+                continue
+
+            start = time.perf_counter()
+            lastEncode = start
+            if self.width and frame.shape[1] > self.width:
+                frame = cv2.resize(frame, (self.width, frame.shape[0] * self.width // frame.shape[1]),
+                                   interpolation=cv2.INTER_AREA)
+            ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ret:
+                continue
+            with self.condition:
+                self.jpeg = jpeg.tobytes()
+                self.jpegSeq += 1
+                self.encodedCount += 1
+                self.encodeTime += time.perf_counter() - start
+                self.condition.notify_all()
+
+    # 等待比lastSeq更新的一帧，返回(序号, JPEG数据)，超时返回None
+    def nextFrame(self, lastSeq, timeout):
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.jpegSeq != lastSeq, timeout):
+                return None
+            return self.jpegSeq, self.jpeg
+
+    def connect(self):
+        with self.condition:
+            self.clients += 1
+
+    def disconnect(self):
+        with self.condition:
+            self.clients -= 1
+            if not self.clients:
+                self.frame = None  # 不再持有画面引用
+
+    def status(self):
+        with self.condition:
+            return '{}：{}个客户端，已编码{}帧，平均编码耗时{:.1f} ms'.format(
+                self.name, self.clients, self.encodedCount,
+                self.encodeTime / self.encodedCount * 1000 if self.encodedCount else 0)
+
+
+# http.server.ThreadingHTTPServer从Python 3.7开始才有，这里自行组合；每个客户端一个守护线程，退出时不等待
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StreamRequestHandler(BaseHTTPRequestHandler):
+    boundary = 'frame'
+
+    def do_GET(self):
+        streams = self.server.streams
+        path = self.path.split('?')[0].strip('/')
+        if not path:
+            body = '\n'.join('/stream/{0}  /snapshot/{0}  {1}'.format(name, stream.status())
+                             for name, stream in streams.items()).encode('utf-8')
+            self.sendBody(200, 'text/plain; charset=utf-8', body)
+            return
+        kind, _, name = path.partition('/')
+        stream = streams.get(name)
+        if stream is None or kind not in ('stream', 'snapshot'):
+            self.send_error(404)
+            return
+        if kind == 'snapshot':
+            stream.connect()
+            try:
+                frame = stream.nextFrame(stream.jpegSeq, self.server.sendTimeout)  # 等待新编码的一帧，不返回过时的画面
+            finally:
+                stream.disconnect()
+            if frame is None:
+                self.send_error(503, 'No frame available')
+            else:
+                self.sendBody(200, 'image/jpeg', frame[1])
+            return
+        self.streamFrames(stream)
+
+    def streamFrames(self, stream):
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=' + self.boundary)
+        self.send_header('Cache-Control', 'no-cache, private')
+        self.send_header('Pragma', 'no-cache')
+        self.end_headers()
+        # 发送超时的客户端直接断开，避免占用线程
+        self.connection.settimeout(self.server.sendTimeout)
+        stream.connect()
+        logging.info('MJPEG客户端{}已连接到{}'.format(self.client_address[0], stream.name))
+        seq = 0
+        try:
+            while not self.server.isStopped:
+                frame = stream.nextFrame(seq, 1.0)
+                if frame is None:  # 摄像头未打开，保持连接等待
+                    continue
+                seq, jpeg = frame
+                self.wfile.write('--{}\r\nContent-Type: image/jpeg\r\nContent-Length: {}\r\n\r\n'.format(
+                    self.boundary, len(jpeg)).encode('latin-1'))
+                self.wfile.write(jpeg)
+                self.wfile.write(b'\r\n')
+        except (ConnectionError, socket.timeout):
+            pass
+        finally:
+            stream.disconnect()
+            logging.info('MJPEG客户端{}已断开{}'.format(self.client_address[0], stream.name))
+
+    def sendBody(self, status, contentType, body):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug('MJPEG：' + format % args)
+
+
+# 标注后画面的MJPEG/HTTP推流，可配置多路不同帧率、质量和尺寸的视频流
+# 浏览器或VLC打开http://<地址>:<端口>/stream/<名称>即可观看，/snapshot/<名称>返回单张图片
+class FrameStreamServer:
+    def __init__(self, enabled=False, host='127.0.0.1', port=8080, streams=(), timeout=5.0):
+        self.enabled = enabled  # 是否启用推流
+        self.host = host
+        self.port = port
+        self.timeout = timeout  # 客户端发送超时（秒）
+        self.streams = {stream.name: stream for stream in streams} if enabled else {}
+        self.server = None
+
+    # 从配置文件读取推流参数，每个[stream.<名称>]小节定义一路视频流
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        enabled = cfg.getboolean('stream', 'enabled', fallback=False)
+        streams = [FrameStream(section.split('.', 1)[1],
+                               cfg.getfloat(section, 'fps', fallback=10.0),
+                               cfg.getint(section, 'quality', fallback=80),
+                               cfg.getint(section, 'width', fallback=0))
+                   for section in cfg.sections() if section.startswith('stream.')] if enabled else []
+        if enabled and not streams:
+            streams = [FrameStream('main')]
+        return FrameStreamServer(enabled,
+                                 cfg.get('stream', 'host', fallback='127.0.0.1'),
+                                 cfg.getint('stream', 'port', fallback=8080),
+                                 streams,
+                                 cfg.getfloat('stream', 'timeout', fallback=5.0))
+
+    def start(self):
+        if not self.enabled or self.server is not None:
+            return
+        self.server = ThreadingHTTPServer((self.host, self.port), StreamRequestHandler)
+        self.server.streams = self.streams
+        self.server.sendTimeout = self.timeout
+        self.server.isStopped = False
+        threading.Thread(target=self.server.serve_forever, name='FrameStreamServer', daemon=True).start()
+        logging.info('MJPEG推流已启动：http://{}:{}/stream/{}'.format(self.host, self.port, '、'.join(self.streams)))
+
+    # 检测线程每帧调用，没有客户端时几乎没有开销
+    def publish(self, frame):
+        for stream in self.streams.values():
+            stream.publish(frame)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.isStopped = True
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,144 @@
+import re
+import threading
+import time
+from collections import deque
+from configparser import ConfigParser
+from datetime import datetime
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QTextCursor
+
+
+# 按日志模板限流：数字替换后相同的日志视为同一类，每类在每个周期内最多输出rate条，其余只计数
+# 周期结束后输出一条汇总，说明省略了多少条相似日志
+class LogThrottle:
+    numberPattern = re.compile(r'\d+(?:\.\d+)?')
+
+    def __init__(self, rate=5, period=1.0):
+        self.rate = rate  # 每类日志每个周期最多输出的条数，0表示不限流
+        self.period = period  # 限流周期（秒）
+        self.lock = threading.Lock()
+        self.windows = {}  # 日志模板 -> [周期开始时间, 已输出条数, 已省略条数, 最后一条被省略的日志]
+
+    # 从配置文件读取限流参数
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return LogThrottle(cfg.getint('log', 'rate', fallback=5), cfg.getfloat('log', 'period', fallback=1.0))
+
+    # 日志模板，数字统一替换为#
+    def key(self, message):
+        return self.numberPattern.sub('#', message)
+
+    # 提交一条日志，返回需要输出的日志列表（可能包含上一周期的省略汇总），被限流时返回空列表
+    def submit(self, message, now=None):
+        if not self.rate:
+            return [message]
+        now = time.monotonic() if now is None else now
+        key = self.key(message)
+        output = []
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                if window is not None and window[2]:
+                    output.append(self.summary(window))
+                window = self.windows[key] = [now, 0, 0, None]
+            if window[1] < self.rate:
+                window[1] += 1
+                output.append(message)
+            else:
+                window[2] += 1
+                window[3] = message
+        return output
+
+    # 输出已结束周期的省略汇总，并清理过期的模板
+    def flush(self, now=None):
+        now = time.monotonic() if now is None else now
+        output = []
+        with self.lock:
+            for key, window in list(self.windows.items()):
+                if now - window[0] >= self.period:
+                    if window[2]:
+                        output.append(self.summary(window))
+                    del self.windows[key]
+        return output
+
+    def summary(self, window):
+        return '{}（{:.0f}秒内另有{}条相似日志已省略）'.format(window[3], self.period, window[2])
+
+
+# 日志视图，CoreUI、DataManageUI和DataRecordUI共用
+# 后台线程从日志队列接收日志并限流，界面线程按固定间隔把积攒的日志一次性写入文本框
+# 连续的相同日志合并为一行，文本框最多保留maxLines行，超出后自动删除最早的日志
+class LogView:
+    def __init__(self, textEdit, logQueue, interval=200, maxLines=1000, rate=5, period=1.0):
+        self.textEdit = textEdit
+        self.logQueue = logQueue
+        self.interval = interval  # 写入文本框的间隔（毫秒）
+        self.maxLines = maxLines  # 文本框最多保留的行数
+        self.throttle = LogThrottle(rate, period)
+
+        self.lock = threading.Lock()
+        self.pending = deque(maxlen=maxLines)  # 待写入的日志：[时间, 日志, 重复次数]，积压超过maxLines时丢弃最早的
+        self.droppedCount = 0  # 因积压丢弃的日志数
+
+        self.textEdit.document().setMaximumBlockCount(maxLines)
+        self.timer = QTimer(textEdit)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(interval)
+
+        self.receiveThread = threading.Thread(target=self.receive, daemon=True)  # 日志接收后台线程
+        self.receiveThread.start()
+
+    # 从配置文件读取参数
+    @staticmethod
+    def fromConfig(textEdit, logQueue, path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return LogView(
+            textEdit, logQueue,
+            cfg.getint('log', 'interval', fallback=200),
+            cfg.getint('log', 'max_lines', fallback=1000),
+            cfg.getint('log', 'rate', fallback=5),
+            cfg.getfloat('log', 'period', fallback=1.0),
+        )
+
+    # 系统日志服务常驻，接收并处理系统日志
+    def receive(self):
+        while True:
+            log = self.logQueue.get()
+            if log:
+                for message in self.throttle.submit(log):
+                    self.append(message)
+
+    def append(self, message):
+        with self.lock:
+            if self.pending and self.pending[-1][1] == message:
+                self.pending[-1][2] += 1
+                return
+            if len(self.pending) == self.pending.maxlen:
+                self.droppedCount += 1
+            self.pending.append([datetime.now(), message, 1])
+
+    # 定时器事件，在界面线程中把积攒的日志一次性写入文本框
+    def flush(self):
+        for message in self.throttle.flush():
+            self.append(message)
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, deque(maxlen=self.maxLines)
+            droppedCount, self.droppedCount = self.droppedCount, 0
+
+        lines = []
+        if droppedCount:
+            lines.append('{} Warning：日志过多，已丢弃{}条'.format(
+                pending[0][0].strftime('[%Y/%m/%d %H:%M:%S]'), droppedCount))
+        for timestamp, message, count in pending:
+            line = timestamp.strftime('[%Y/%m/%d %H:%M:%S]') + ' ' + message
+            lines.append(line if count == 1 else '{}（×{}）'.format(line, count))
+
+        self.textEdit.moveCursor(QTextCursor.End)
+        self.textEdit.insertPlainText('\n'.join(lines) + '\n')
+        self.textEdit.ensureCursorVisible()  # 自动滚屏
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import deque
+from configparser import ConfigParser
+
+
+# 人脸检测线程各阶段的耗时统计
+# 检测线程每帧按阶段记录耗时（同一阶段在一帧内多次出现时累加），界面线程定期读取最近若干帧的分位数
+# 同时累计各阶段的总耗时和次数，导出为Prometheus文本格式，供本地采集程序读取
+class PipelineMetrics:
+    # 阶段名称及显示名称
+    stages = (
+        ('capture', '读取'),
+        ('preprocess', '灰度/均衡化'),
+        ('detect', '人脸检测'),
+        ('tracker', '跟踪器更新'),
+        ('association', '人脸关联'),
+        ('predict', '人脸识别'),
+        ('database', '数据库查询'),
+        ('annotate', '绘制'),
+        ('queue', '图像队列'),
+        ('frame', '整帧'),
+    )
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self, window=300):
+        self.lock = threading.Lock()
+        self.window = window  # 计算分位数使用的最近帧数
+        self.samples = {stage: deque(maxlen=window) for stage, _ in self.stages}  # 最近各帧的阶段耗时（秒）
+        self.sums = dict.fromkeys(self.samples, 0.0)  # 累计耗时（秒）
+        self.counts = dict.fromkeys(self.samples, 0)  # 累计次数
+        self.frameTimes = deque(maxlen=window)  # 最近各帧的结束时间，用于计算帧率
+        self.counters = {'frames': 0, 'faces': 0, 'recognitions': 0}  # 累计帧数、检测到的人脸数和识别次数
+        self.level = 0  # 帧调度器当前的处理级别
+        self.levelFrames = {}  # 各处理级别累计的帧数
+        self.tracer = None  # 可选的TraceRecorder，设置后各阶段同时记录为trace事件
+
+        # 当前帧，只由检测线程访问
+        self.frameStart = 0.0
+        self.lapStart = 0.0
+        self.current = {}
+
+    # 从配置文件读取统计窗口大小
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return PipelineMetrics(cfg.getint('metrics', 'window', fallback=300))
+
+    # 开始一帧
+    def beginFrame(self):
+        self.frameStart = self.lapStart = time.perf_counter()
+        self.current = {}
+
+    # 结束一个阶段，记录从上一个阶段结束到现在的耗时
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.current[stage] = self.current.get(stage, 0.0) + now - self.lapStart
+        if self.tracer is not None:
+            self.tracer.span(stage, self.lapStart, now)
+        self.lapStart = now
+
+    # 结束一帧，提交本帧各阶段的耗时，返回整帧耗时（秒）
+    def endFrame(self, faces=0, recognitions=0, trackers=0, level=0):
+        now = time.perf_counter()
+        self.current['frame'] = now - self.frameStart
+        if self.tracer is not None:
+            self.tracer.span('frame', self.frameStart, now, args={
+                'frame': self.counters['frames'], 'faces': faces, 'trackers': trackers, 'level': level})
+            self.tracer.checkSpike(now - self.frameStart)
+        with self.lock:
+            for stage, seconds in self.current.items():
+                self.samples[stage].append(seconds)
+                self.sums[stage] += seconds
+                self.counts[stage] += 1
+            self.frameTimes.append(now)
+            self.counters['frames'] += 1
+            self.counters['faces'] += faces
+            self.counters['recognitions'] += recognitions
+            self.level = level
+            self.levelFrames[level] = self.levelFrames.get(level, 0) + 1
+        return self.current['frame']
+
+    # 最近窗口内的帧率
+    def fps(self):
+        with self.lock:
+            if len(self.frameTimes) < 2:
+                return 0.0
+            return (len(self.frameTimes) - 1) / (self.frameTimes[-1] - self.frameTimes[0])
+
+    # 最近窗口内各阶段耗时的分位数（毫秒），返回{阶段: (p50, p95, p99)}，没有样本的阶段不返回
+    def percentiles(self):
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items() if values}
+        return {stage: tuple(1000 * values[min(len(values) - 1, int(q * len(values)))] for q in self.quantiles)
+                for stage, values in samples.items()}
+
+    # 状态栏显示的简要信息
+    def summary(self):
+        percentiles = self.percentiles()
+        text = 'FPS：{:.1f}'.format(self.fps())
+        for stage in ('detect', 'predict', 'frame'):
+            if stage in percentiles:
+                text += '  {}：{:.1f}/{:.1f} ms'.format(dict(self.stages)[stage], *percentiles[stage][:2])
+        if self.level:
+            text += '  降级：{}'.format(self.level)
+        return text
+
+    # 各阶段的详细信息，每行一个阶段
+    def details(self):
+        percentiles = self.percentiles()
+        lines = ['最近{}帧各阶段耗时（p50/p95/p99，毫秒）'.format(self.window)]
+        for stage, name in self.stages:
+            if stage in percentiles:
+                lines.append('{}：{:.2f} / {:.2f} / {:.2f}'.format(name, *percentiles[stage]))
+        return '\n'.join(lines)
+
+    # 生成Prometheus文本格式
+    def prometheusText(self):
+        percentiles = self.percentiles()
+        with self.lock:
+            sums, counts, counters = dict(self.sums), dict(self.counts), dict(self.counters)
+            level, levelFrames = self.level, dict(self.levelFrames)
+        lines = ['# HELP face_pipeline_stage_seconds Time spent in each stage of the face processing loop.',
+                 '# TYPE face_pipeline_stage_seconds summary']
+        for stage, _ in self.stages:
+            for q, value in zip(self.quantiles, percentiles.get(stage, ())):
+                lines.append('face_pipeline_stage_seconds{{stage="{}",quantile="{}"}} {:.6f}'.format(
+                    stage, q, value / 1000))
+            lines.append('face_pipeline_stage_seconds_sum{{stage="{}"}} {:.6f}'.format(stage, sums[stage]))
+            lines.append('face_pipeline_stage_seconds_count{{stage="{}"}} {}'.format(stage, counts[stage]))
+        for name, value in counters.items():
+            lines.append('# TYPE face_pipeline_{}_total counter'.format(name))
+            lines.append('face_pipeline_{}_total {}'.format(name, value))
+        lines.append('# TYPE face_pipeline_fps gauge')
+        lines.append('face_pipeline_fps {:.2f}'.format(self.fps()))
+        lines.append('# HELP face_pipeline_degradation_level Current frame scheduler level, 0 means no degradation.')
+        lines.append('# TYPE face_pipeline_degradation_level gauge')
+        lines.append('face_pipeline_degradation_level {}'.format(level))
+        lines.append('# TYPE face_pipeline_level_frames_total counter')
+        for value, frames in sorted(levelFrames.items()):
+            lines.append('face_pipeline_level_frames_total{{level="{}"}} {}'.format(value, frames))
+        return '\n'.join(lines) + '\n'
+
+    # 写入Prometheus文本文件，先写临时文件再替换，采集程序不会读到写了一半的文件
+    def writePrometheus(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            file.write(self.prometheusText())
+        os.replace(path + '.tmp', path)
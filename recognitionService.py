@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import logging.config
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+
+import cv2
+import numpy
+
+from faceDatabase import FaceDatabase
+from faceDetector import FaceDetector
+from facePreprocess import FacePreprocessor
+from recognizerWatcher import TrainingDataWatcher
+
+# 本地人脸识别HTTP服务，供门禁控制器、考勤机等提交人脸图片并获取身份
+# 与识别界面使用相同的检测参数（config/detector.cfg）、识别模型（recognizer目录，热加载）和users表，但不依赖PyQt5
+# 并发请求中的图片先进入队列，由批处理协程按批（最多max_batch张，最多等待max_delay毫秒）分发到工作线程检测和识别
+#
+# POST /recognize        请求体为一张图片（Content-Type为image/*或application/octet-stream），
+#                        或JSON：{"image": "<base64>"}或{"images": ["<base64>", ...]}
+#                        返回{"faces": [...]}，批量时返回{"results": [{"faces": [...]}, ...]}，与提交顺序一致
+# GET  /metrics          Prometheus文本格式的延迟、队列深度和批大小统计
+# GET  /health           模型版本和用户数
+#
+# 本机测试：
+#   python recognitionService.py
+#   curl --data-binary @face.jpg -H "Content-Type: image/jpeg" http://127.0.0.1:8765/recognize
+#   curl http://127.0.0.1:8765/metrics
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super(ServiceError, self).__init__(message)
+        self.status = status
+
+
+# 服务统计：请求延迟、排队时间、识别耗时和批大小，导出为Prometheus文本格式
+class ServiceMetrics:
+    quantiles = (0.5, 0.95, 0.99)
+    stages = ('request', 'queue', 'process')  # 整个请求、在队列中等待、所在批次的检测和识别
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.samples = {stage: deque(maxlen=window) for stage in self.stages}  # 最近的耗时（秒）
+        self.sums = dict.fromkeys(self.stages, 0.0)
+        self.counts = dict.fromkeys(self.stages, 0)
+        self.batchSizes = deque(maxlen=window)
+        self.counters = {'images': 0, 'faces': 0, 'batches': 0}
+        self.responses = {}  # HTTP状态码 -> 次数
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+            self.sums[stage] += seconds
+            self.counts[stage] += 1
+
+    def batch(self, size, faces):
+        with self.lock:
+            self.batchSizes.append(size)
+            self.counters['batches'] += 1
+            self.counters['images'] += size
+            self.counters['faces'] += faces
+
+    def response(self, status):
+        with self.lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    def prometheusText(self, queueDepth, workersBusy, modelVersion):
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+            sums, counts, counters = dict(self.sums), dict(self.counts), dict(self.counters)
+            batchSizes, responses = list(self.batchSizes), dict(self.responses)
+        lines = ['# HELP face_service_seconds Latency of the recognition service by stage.',
+                 '# TYPE face_service_seconds summary']
+        for stage in self.stages:
+            values = samples[stage]
+            for q in self.quantiles if values else ():
+                lines.append('face_service_seconds{{stage="{}",quantile="{}"}} {:.6f}'.format(
+                    stage, q, values[min(len(values) - 1, int(q * len(values)))]))
+            lines.append('face_service_seconds_sum{{stage="{}"}} {:.6f}'.format(stage, sums[stage]))
+            lines.append('face_service_seconds_count{{stage="{}"}} {}'.format(stage, counts[stage]))
+        for name, value in counters.items():
+            lines.append('# TYPE face_service_{}_total counter'.format(name))
+            lines.append('face_service_{}_total {}'.format(name, value))
+        lines.append('# TYPE face_service_responses_total counter')
+        for status, count in sorted(responses.items()):
+            lines.append('face_service_responses_total{{status="{}"}} {}'.format(status, count))
+        lines.append('# HELP face_service_batch_size Mean number of images per batch over the recent window.')
+        lines.append('# TYPE face_service_batch_size gauge')
+        lines.append('face_service_batch_size {:.2f}'.format(sum(batchSizes) / len(batchSizes) if batchSizes else 0))
+        lines.append('# HELP face_service_queue_depth Images waiting to be batched.')
+        lines.append('# TYPE face_service_queue_depth gauge')
+        lines.append('face_service_queue_depth {}'.format(queueDepth))
+        lines.append('# TYPE face_service_workers_busy gauge')
+        lines.append('face_service_workers_busy {}'.format(workersBusy))
+        lines.append('# TYPE face_service_model_version gauge')
+        lines.append('face_service_model_version {}'.format(modelVersion))
+        return '\n'.join(lines) + '\n'
+
+
+# 检测和识别，在工作线程中按批调用
+class RecognitionWorker:
+    def __init__(self, watcher, preprocessor, faceDatabase, confidenceThreshold=50, margin=0, maxSide=640):
+        self.watcher = watcher  # 训练数据热加载线程，提供当前识别器
+        self.preprocessor = preprocessor
+        self.faceDatabase = faceDatabase  # 按人脸ID查询用户
+        self.confidenceThreshold = confidenceThreshold  # 置信度评分低于该值才认为是可靠识别
+        self.margin = margin  # 最优与次优用户的最小距离差
+        self.maxSide = maxSide  # 检测前把大图缩小到该边长
+        self.local = threading.local()  # 每个工作线程使用自己的Haar分类器，detectMultiScale不是线程安全的
+
+    def detector(self):
+        if not hasattr(self.local, 'detector'):
+            self.local.detector = FaceDetector.fromConfig()
+        return self.local.detector
+
+    # 处理一批图片，返回与输入顺序一致的结果列表，无法解码的图片返回ServiceError
+    def process(self, images):
+        recognizer = self.watcher.recognizer  # 同一批使用同一个模型
+        return [self.recognize(recognizer, data) for data in images]
+
+    def recognize(self, recognizer, data):
+        frame = cv2.imdecode(numpy.frombuffer(data, dtype=numpy.uint8), cv2.IMREAD_GRAYSCALE)
+        if frame is None:
+            return ServiceError(400, '无法解码图片')
+        scale = min(1.0, self.maxSide / float(max(frame.shape)))
+        small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else frame
+        faces = []
+        for rect in self.detector().detect(small, scale):
+            x, y, w, h = (int(round(v / scale)) for v in rect)
+            result = {'box': [x, y, w, h], 'face_id': None, 'confidence': None, 'known': False}
+            face = self.preprocessor.normalize(frame, (x, y, w, h)) if recognizer is not None else None
+            if face is not None:
+                face_id, confidence, isAmbiguous = self.match(recognizer, face)
+                if face_id < 0:  # 人脸库为空
+                    faces.append(result)
+                    continue
+                result.update({'face_id': int(face_id), 'confidence': round(float(confidence), 2),
+                               'known': bool(confidence < self.confidenceThreshold and not isAmbiguous)})
+                if result['known']:
+                    # 数据库文件存在后才查询，避免创建空数据库
+                    user = self.faceDatabase.getUserByFaceID(face_id) if self.faceDatabase.exists() else None
+                    if user:
+                        result.update({'stu_id': user[0], 'cn_name': user[2], 'en_name': user[3]})
+                    else:  # 模型中有该人脸ID，但数据库中没有对应用户
+                        result['known'] = False
+            faces.append(result)
+        return {'faces': faces}
+
+    # 与FaceProcessingThread.recognizeFace的判定一致
+    def match(self, recognizer, face):
+        if self.margin > 0 and hasattr(recognizer, 'match'):
+            candidates = recognizer.match(face, 2)
+            face_id, confidence = candidates[0] if candidates else (-1, float('inf'))
+            return face_id, confidence, len(candidates) > 1 and candidates[1][1] - confidence < self.margin
+        face_id, confidence = recognizer.predict(face)
+        return face_id, confidence, False
+
+
+# 微批处理：并发请求中的图片进入同一个队列，每个批处理协程取出一批后交给线程池处理
+class MicroBatcher:
+    def __init__(self, worker, metrics, maxBatch=8, maxDelay=5.0, workers=2, queueSize=256):
+        self.worker = worker
+        self.metrics = metrics
+        self.maxBatch = maxBatch  # 每批最多的图片数
+        self.maxDelay = maxDelay / 1000.0  # 收到一批中的第一张图片后最多等待的时间（秒）
+        self.workers = workers  # 同时处理的批数
+        self.queueSize = queueSize  # 队列已满时直接拒绝请求，避免积压
+        self.queue = None  # 待处理的图片，在事件循环中由start创建
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Recognition')
+        self.busy = 0  # 正在处理的批数
+
+    # 在事件循环中调用：Python 3.10之前asyncio.Queue绑定创建时的事件循环，须在运行服务的事件循环中创建
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queueSize)
+        return [asyncio.ensure_future(self.batchLoop()) for _ in range(self.workers)]
+
+    # 队列中等待组批的图片数
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    # 提交一张图片，返回识别结果
+    async def submit(self, data):
+        future = asyncio.get_event_loop().create_future()
+        try:
+            self.queue.put_nowait((data, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise ServiceError(503, '识别队列已满，请稍后重试')
+        result = await future
+        if isinstance(result, ServiceError):
+            raise result
+        return result
+
+    async def batchLoop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.maxDelay
+            while len(batch) < self.maxBatch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                # 不使用wait_for：Python 3.12之前超时与get同时完成时，wait_for会取消get并丢掉已取出的图片
+                # 超时后检查getter是否已完成，未完成时取消，Queue.get被取消时图片仍留在队列中
+                getter = asyncio.ensure_future(self.queue.get())
+                await asyncio.wait([getter], timeout=timeout)
+                if not getter.done():
+                    getter.cancel()
+                    break
+                batch.append(getter.result())
+
+            start = time.perf_counter()
+            for _, _, queuedAt in batch:
+                self.metrics.observe('queue', start - queuedAt)
+            self.busy += 1
+            try:
+                results = await loop.run_in_executor(self.executor, self.worker.process,
+                                                     [data for data, _, _ in batch])
+            except Exception as e:
+                logging.exception('识别服务处理失败')
+                results = [ServiceError(500, '识别失败：{}'.format(e))] * len(batch)
+            finally:
+                self.busy -= 1
+            self.metrics.observe('process', time.perf_counter() - start)
+            self.metrics.batch(len(batch), sum(len(result['faces']) for result in results if isinstance(result, dict)))
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():  # 客户端已断开时future已被取消
+                    future.set_result(result)
+
+
+# 最小的HTTP/1.1服务，只使用标准库，支持keep-alive
+class RecognitionService:
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+    def __init__(self, batcher, metrics, watcher, faceDatabase, maxBody=8, maxImages=32):
+        self.batcher = batcher
+        self.metrics = metrics
+        self.watcher = watcher
+        self.faceDatabase = faceDatabase
+        self.maxBody = maxBody * 1024 * 1024  # 请求体最大字节数
+        self.maxImages = maxImages  # 一次请求最多的图片数
+
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        watcher = TrainingDataWatcher.fromConfig(path)  # 加载和同步模型的日志只写入logging
+        faceDatabase = FaceDatabase()
+        worker = RecognitionWorker(watcher, FacePreprocessor.fromConfig(path), faceDatabase,
+                                   cfg.getfloat('service', 'confidence_threshold', fallback=50),
+                                   cfg.getfloat('recognizer', 'margin', fallback=0),
+                                   cfg.getint('service', 'max_side', fallback=640))
+        metrics = ServiceMetrics()
+        batcher = MicroBatcher(worker, metrics,
+                               cfg.getint('service', 'max_batch', fallback=8),
+                               cfg.getfloat('service', 'max_delay', fallback=5),
+                               cfg.getint('service', 'workers', fallback=2),
+                               cfg.getint('service', 'queue_size', fallback=256))
+        return RecognitionService(batcher, metrics, watcher, faceDatabase,
+                                  cfg.getint('service', 'max_body', fallback=8),
+                                  cfg.getint('service', 'max_images', fallback=32))
+
+    async def handleConnection(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                method, target, version = requestLine.decode('latin-1').split(None, 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                start = time.perf_counter()
+                length = int(headers.get('content-length', 0))
+                if length > self.maxBody:
+                    status, contentType, body = self.error(ServiceError(413, '请求体超过{}字节'.format(self.maxBody)))
+                    self.respond(writer, status, contentType, body, False)
+                    break
+                payload = await reader.readexactly(length) if length else b''
+                try:
+                    status, contentType, body = await self.route(method, target.split('?')[0], headers, payload)
+                except ServiceError as e:
+                    status, contentType, body = self.error(e)
+                except Exception as e:
+                    logging.exception('识别服务请求处理失败')
+                    status, contentType, body = self.error(ServiceError(500, str(e)))
+                self.metrics.response(status)
+                if target.startswith('/recognize'):
+                    self.metrics.observe('request', time.perf_counter() - start)
+
+                keepAlive = headers.get('connection', '').lower() != 'close' and version.strip() == 'HTTP/1.1'
+                self.respond(writer, status, contentType, body, keepAlive)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, payload):
+        if path == '/recognize':
+            if method != 'POST':
+                raise ServiceError(405, '请使用POST提交图片')
+            return self.json(200, await self.recognize(headers.get('content-type', ''), payload))
+        if path == '/metrics':
+            text = self.metrics.prometheusText(self.batcher.depth(), self.batcher.busy, self.watcher.version)
+            return 200, 'text/plain; version=0.0.4', text.encode('utf-8')
+        if path == '/health':
+            recognizer = self.watcher.recognizer
+            return self.json(200, {'status': 'ok' if recognizer is not None else 'no model',
+                                   'model_version': self.watcher.version,
+                                   'users': self.faceDatabase.userCount() if self.faceDatabase.exists() else 0})
+        raise ServiceError(404, '未知路径{}'.format(path))
+
+    async def recognize(self, contentType, payload):
+        if not contentType.startswith('application/json'):
+            return await self.batcher.submit(payload)
+        try:
+            request = json.loads(payload.decode('utf-8'))
+            if 'images' in request:
+                images = [base64.b64decode(image) for image in request['images']]
+            else:
+                images = [base64.b64decode(request['image'])]
+        except (ValueError, KeyError, TypeError):
+            raise ServiceError(400, 'JSON请求体应为{"image": "<base64>"}或{"images": ["<base64>", ...]}')
+        if len(images) > self.maxImages:
+            raise ServiceError(413, '一次最多提交{}张图片'.format(self.maxImages))
+        # 批量请求中的每张图片分别进入队列，与其它请求的图片一起组批
+        results = await asyncio.gather(*[self.batcher.submit(image) for image in images], return_exceptions=True)
+        results = [self.error(result, False) if isinstance(result, ServiceError) else result for result in results]
+        return {'results': results} if 'images' in request else results[0]
+
+    def error(self, e, encode=True):
+        if not encode:
+            return {'error': str(e), 'status': e.status}
+        return self.json(e.status, {'error': str(e)})
+
+    @staticmethod
+    def json(status, data):
+        return status, 'application/json; charset=utf-8', json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def respond(self, writer, status, contentType, body, keepAlive):
+        head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+            status, self.reasons.get(status, ''), contentType, len(body), 'keep-alive' if keepAlive else 'close')
+        writer.write(head.encode('latin-1') + body)
+
+    async def serve(self, host, port):
+        # 先在当前线程加载一次模型，再由热加载线程监视模型文件的变化
+        self.watcher.check()
+        self.watcher.start()
+        if self.watcher.recognizer is None:
+            logging.warning('未找到已训练的人脸识别模型，只返回人脸检测结果')
+        self.batcher.start()
+        server = await asyncio.start_server(self.handleConnection, host, port)
+        logging.info('人脸识别服务已启动：http://{}:{}'.format(host, port))
+        print('人脸识别服务已启动：http://{}:{}'.format(host, port))
+        await server.wait_closed()  # 服务关闭前一直等待，Python 3.6的Server没有serve_forever
+
+
+if __name__ == '__main__':
+    cfg = ConfigParser()
+    cfg.read('./config/recognizer.cfg', encoding='utf-8-sig')
+    parser = argparse.ArgumentParser(description='本地人脸识别HTTP服务')
+    parser.add_argument('--host', default=cfg.get('service', 'host', fallback='127.0.0.1'), help='监听地址')
+    parser.add_argument('--port', type=int, default=cfg.getint('service', 'port', fallback=8765), help='监听端口')
+    args = parser.parse_args()
+
+    logging.config.fileConfig('./config/logging.cfg')
+    cv2.setNumThreads(1)  # 并行度由工作线程数决定
+    # 服务在这个事件循环中创建和运行；不使用asyncio.run，Python 3.6没有该函数
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(RecognitionService.fromConfig().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,221 @@
+import logging
+import os
+import threading
+import time
+from configparser import ConfigParser
+
+import cv2
+import numpy as np
+
+from faceGallery import GalleryFormatError, GalleryRecognizer, GalleryStore, ShardedRecognizer, listShards, loadGallery
+
+TRAINING_DATA = './recognizer/trainingData.yml'  # 训练数据模型位置
+GALLERY_DATA = './recognizer/trainingData.fgal'  # 二进制人脸库位置
+GALLERY_STORE = './recognizer/gallery'  # 按用户分段的人脸库位置
+SHARD_DATA = './recognizer/shards'  # 分片人脸库位置
+
+
+# 训练数据热加载线程，监视模型文件的变化，在后台加载新模型后再交给人脸检测线程替换
+# backend为auto时，优先使用按用户分段的人脸库目录，其次加载YAML模型、二进制人脸库和分片人脸库中较新的那一个
+# 二进制人脸库使用内存映射，冷启动几乎不耗时；使用分段人脸库时以训练生成的二进制人脸库为快照，
+# 只应用快照之后增删的用户段，之后的用户增删也会增量同步到正在使用的识别器
+class TrainingDataWatcher(threading.Thread):
+    def __init__(self, trainingData=TRAINING_DATA, galleryData=GALLERY_DATA, galleryStore=GALLERY_STORE,
+                 shardData=SHARD_DATA, backend='auto', metric='chisqr', shards=1, interval=2, logQueue=None):
+        super(TrainingDataWatcher, self).__init__(daemon=True)
+        self.isRunning = True  # 线程是否正在运行
+        self.trainingData = trainingData  # 训练数据模型位置
+        self.galleryData = galleryData  # 二进制人脸库位置
+        self.galleryStore = GalleryStore(galleryStore)  # 按用户分段的人脸库
+        self.shardData = shardData  # 分片人脸库目录
+        # 识别后端：auto，lbph（OpenCV LBPH），gallery（向量化人脸库匹配），store（分段人脸库）或sharded（分片人脸库）
+        self.backend = backend
+        self.metric = metric  # gallery后端使用的距离
+        self.shards = shards  # store后端加载时切分的分片数
+        self.interval = interval  # 检查模型文件的时间间隔（秒）
+        self.logQueue = logQueue  # 界面日志队列，为None时只写入logging
+
+        self.recognizer = None  # 当前可用的人脸识别器
+        self.version = 0  # 模型版本号，每成功加载一次自增
+        self.loadTime = 0  # 最近一次加载模型的耗时（毫秒）
+        self.lastModified = None  # 最近一次处理过的模型文件及其修改时间
+        self.storeSegments = {}  # 已同步到识别器的用户段及其修改时间
+        self.storeModified = None  # 最近一次列出用户段时人脸库目录的修改时间
+        self.isStoreLoaded = False  # 是否已加载过分段人脸库
+        self.snapshotModified = None  # 分段人脸库使用的快照（二进制人脸库）的修改时间，快照不存在时为None
+        self.retired = []  # 已被替换、等待释放的识别器
+
+    # 从配置文件读取识别后端、距离和分片数
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg', logQueue=None):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return TrainingDataWatcher(backend=cfg.get('recognizer', 'backend', fallback='auto'),
+                                   metric=cfg.get('recognizer', 'metric', fallback='chisqr'),
+                                   shards=cfg.getint('recognizer', 'shards', fallback=1),
+                                   logQueue=logQueue)
+
+    def run(self):
+        while self.isRunning:
+            self.check()
+            time.sleep(self.interval)
+
+    # 检查一次模型文件，有变化时加载
+    def check(self):
+        self.closeRetired()
+        if self.backend == 'store' or (self.backend == 'auto' and os.path.isdir(self.galleryStore.root)):
+            self.syncStore()
+        else:
+            self.checkTrainingData()
+
+    # 检查模型文件是否变化
+    def checkTrainingData(self):
+        latest = None
+        if self.backend == 'lbph':
+            paths = (self.trainingData,)
+        elif self.backend == 'gallery':
+            paths = (self.galleryData,)
+        elif self.backend == 'sharded':
+            paths = (self.shardData,)
+        else:
+            paths = (self.trainingData, self.galleryData, self.shardData)
+        for path in paths:
+            # 获取模型文件修改时间，分片人脸库取所有分片中最新的修改时间
+            files = listShards(path) if path == self.shardData else [path]
+            try:
+                modified = (max(os.path.getmtime(file) for file in files), path)
+            except (OSError, ValueError):  # 模型文件不存在
+                continue
+            if latest is None or modified > latest:
+                latest = modified
+
+        if latest is not None and latest != self.lastModified:  # 模型文件发生了变化
+            self.lastModified = latest  # 加载失败时不重复尝试，等待下一次模型文件变化
+            self.load(latest[1])
+
+    # 同步分段人脸库：重新训练生成新的快照时重新加载；否则在人脸库目录变化时列出用户段，
+    # 少量用户变化时增量更新正在使用的识别器，大量变化时在后台整体重建后替换
+    def syncStore(self):
+        snapshotModified = self.fileModified(self.galleryData)
+        if not self.isStoreLoaded or snapshotModified != self.snapshotModified:
+            self.isStoreLoaded = True  # 加载失败时不重复尝试，等待下一次快照或用户段变化
+            self.snapshotModified = snapshotModified
+            self.load(self.galleryStore.root)
+            return
+
+        storeModified = self.galleryStore.modified()  # 先取目录修改时间，列出用户段期间的变化留到下一次检查
+        if storeModified == self.storeModified:
+            return
+        segments = self.galleryStore.segments()
+        if segments == self.storeSegments:
+            self.storeModified = storeModified
+            return
+
+        changed = [label for label, modified in segments.items() if self.storeSegments.get(label) != modified]
+        removed = [label for label in self.storeSegments if label not in segments]
+        recognizer = self.recognizer
+        if not isinstance(recognizer, (GalleryRecognizer, ShardedRecognizer)) or len(changed) + len(removed) > len(segments) // 2:
+            self.storeSegments, self.storeModified = segments, storeModified
+            self.load(self.galleryStore.root)
+            return
+
+        synced = dict(self.storeSegments)
+        isSynced = True
+        for label in removed:
+            recognizer.removeUser(label)
+            synced.pop(label, None)
+        for label in changed:
+            try:
+                recognizer.addUser(label, self.galleryStore.loadSegment(label).histograms)
+            except Exception as e:  # 用户段正在写入或已被删除，下一次检查时重试
+                logging.warning('同步人脸库用户段{}失败：{}'.format(label, e))
+                isSynced = False
+                continue
+            synced[label] = segments[label]
+        self.storeSegments = synced
+        if isSynced:
+            self.storeModified = storeModified
+        self.version += 1
+        logging.info('人脸库v{}已同步：新增/更新{}人，删除{}人'.format(self.version, len(changed), len(removed)))
+        self.log('Info：人脸库v{}已同步，新增/更新{}人，删除{}人'.format(self.version, len(changed), len(removed)))
+
+    # 在后台加载模型，加载完成后整体替换识别器引用，不阻塞人脸检测线程
+    def load(self, path):
+        start = time.perf_counter()
+        try:
+            if path == self.galleryStore.root:
+                recognizer, self.storeSegments, self.storeModified = self.loadStore()
+            elif path == self.shardData:
+                recognizer = ShardedRecognizer.read(listShards(path), self.metric)  # 内存映射加载各个分片
+            elif path == self.galleryData:
+                recognizer = GalleryRecognizer.read(path, self.metric)  # 内存映射加载二进制人脸库
+            else:
+                recognizer = cv2.face.LBPHFaceRecognizer_create()  # 创建人脸分类器
+                recognizer.read(path)  # 加载已经训练好的数据模型
+        except Exception as e:
+            logging.error('加载训练数据{}失败'.format(path))
+            self.log('Error：加载人脸识别模型失败，继续使用当前模型')
+        else:
+            self.loadTime = (time.perf_counter() - start) * 1000
+            self.version += 1
+            # 引用赋值是原子操作，人脸检测线程在下一帧开始时使用新模型
+            previous, self.recognizer = self.recognizer, recognizer
+            if hasattr(previous, 'close'):
+                # 正在处理的帧可能仍在使用旧的识别器，等到下一次检查时再释放分片线程池
+                self.retired.append(previous)
+            logging.info('人脸识别模型v{}（{}）加载完成，耗时{:.1f}ms'.format(self.version, path, self.loadTime))
+            self.log('Info：人脸识别模型v{}加载完成，耗时{:.1f}ms'.format(self.version, self.loadTime))
+
+    # 加载分段人脸库：内存映射加载快照，再应用快照之后新增、更新和删除的用户段
+    # 尚未训练（没有快照）或快照之后变化的用户过多时，合并加载全部用户段
+    # 返回识别器、已同步的用户段及人脸库目录的修改时间
+    def loadStore(self):
+        storeModified = self.galleryStore.modified()
+        segments = self.galleryStore.segments()
+        gallery, changed, removed = None, [], []
+        if self.snapshotModified is not None:
+            try:
+                gallery = loadGallery(self.galleryData)
+            except (OSError, GalleryFormatError) as e:
+                logging.warning('加载人脸库快照{}失败，合并加载全部用户段：{}'.format(self.galleryData, e))
+            else:
+                labels = set(np.unique(gallery.labels).tolist())  # 只读取标签向量
+                changed = [label for label, modified in segments.items()
+                           if label not in labels or modified > self.snapshotModified]
+                removed = [label for label in labels if label not in segments]
+                if len(changed) + len(removed) > len(segments) // 2:
+                    gallery = None
+        if gallery is None:
+            gallery, changed, removed = self.galleryStore.load(), [], []
+
+        if self.shards > 1:
+            recognizer = ShardedRecognizer.fromGallery(gallery, self.shards, self.metric)
+        else:
+            recognizer = GalleryRecognizer(gallery, self.metric)
+        for label in removed:
+            recognizer.removeUser(label)
+        for label in changed:
+            recognizer.addUser(label, self.galleryStore.loadSegment(label).histograms)
+        return recognizer, segments, storeModified
+
+    # 文件的修改时间，文件不存在时返回None
+    @staticmethod
+    def fileModified(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    # 写入界面日志
+    def log(self, message):
+        if self.logQueue is not None:
+            self.logQueue.put(message)
+
+    # 释放已被替换的识别器
+    def closeRetired(self):
+        while self.retired:
+            self.retired.pop().close()
+
+    def stop(self):
+        self.isRunning = False
+        self.closeRetired()
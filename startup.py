@@ -0,0 +1,65 @@
+import importlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 启动耗时统计：主线程按顺序标记各阶段，后台预热的各项单独计时，全部完成后汇总报告
+class StartupTimer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases = []  # 主线程各阶段：(名称, 耗时（秒）)
+        self.background = []  # 后台预热各项：(名称, 耗时（秒）)
+        self.readyTime = None  # 窗口显示时距启动的时间（秒）
+
+    # 结束一个主线程阶段，耗时为上一次标记到现在
+    def mark(self, name):
+        now = time.perf_counter()
+        with self.lock:
+            self.phases.append((name, now - self.last))
+            self.last = now
+
+    # 窗口已显示，用户可以开始操作
+    def ready(self):
+        self.mark('显示窗口')
+        self.readyTime = self.last - self.start
+
+    # 统计一项后台预热的耗时
+    @contextmanager
+    def measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.background.append((name, time.perf_counter() - start))
+
+    def report(self):
+        with self.lock:
+            phases, background = list(self.phases), list(self.background)
+        text = '启动耗时：' + '，'.join('{} {:.0f} ms'.format(name, seconds * 1000) for name, seconds in phases)
+        if self.readyTime is not None:
+            text += '；窗口显示共{:.0f} ms'.format(self.readyTime * 1000)
+        if background:
+            text += '；后台预热：' + '，'.join('{} {:.0f} ms'.format(name, seconds * 1000)
+                                          for name, seconds in background)
+        return text
+
+
+optionalModules = {}  # 已尝试导入的可选依赖，导入失败的记为None
+optionalModulesLock = threading.Lock()
+
+
+# 按需导入可选依赖，第一次使用时才导入；未安装或当前系统不支持时返回None，只记录一次警告
+def optionalModule(name):
+    with optionalModulesLock:
+        if name not in optionalModules:
+            try:
+                optionalModules[name] = importlib.import_module(name)
+            except ImportError as e:
+                logging.warning('无法导入{}：{}'.format(name, e))
+                optionalModules[name] = None
+        return optionalModules[name]
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from configparser import ConfigParser
+from datetime import datetime
+
+
+# 帧级飞行记录器，在环形缓冲区中保留最近的阶段事件，按需或出现慢帧时导出为Chrome/Perfetto可读的trace文件
+# 导出的文件可在chrome://tracing或https://ui.perfetto.dev中打开
+class TraceRecorder:
+    def __init__(self, enabled=False, capacity=20000, spikeThreshold=200.0, cooldown=30.0, outputDir='./traces'):
+        self.enabled = enabled  # 是否记录，关闭时各记录函数立即返回
+        self.spikeThreshold = spikeThreshold  # 整帧耗时超过该值（毫秒）时自动导出，0表示不自动导出
+        self.cooldown = cooldown  # 两次自动导出的最小间隔（秒），避免持续卡顿时反复写文件
+        self.outputDir = outputDir  # 导出目录
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=capacity)  # (阶段, 类别, 线程ID, 开始时间, 结束时间, 参数)，时间为perf_counter秒
+        self.threadNames = {}  # 线程ID -> 线程名
+        self.lastSpikeDump = 0.0
+
+    # 从配置文件读取记录器参数
+    @staticmethod
+    def fromConfig(path='./config/recognizer.cfg'):
+        cfg = ConfigParser()
+        cfg.read(path, encoding='utf-8-sig')
+        return TraceRecorder(
+            cfg.getboolean('trace', 'enabled', fallback=False),
+            cfg.getint('trace', 'capacity', fallback=20000),
+            cfg.getfloat('trace', 'spike_threshold', fallback=200.0),
+            cfg.getfloat('trace', 'cooldown', fallback=30.0),
+            cfg.get('trace', 'output_dir', fallback='./traces'),
+        )
+
+    # 记录一个区间事件，start和end为time.perf_counter()的返回值
+    def span(self, name, start, end, category='pipeline', args=None):
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        with self.lock:
+            if thread.ident not in self.threadNames:
+                self.threadNames[thread.ident] = thread.name
+            self.events.append((name, category, thread.ident, start, end, args))
+
+    # 记录一个瞬时事件
+    def instant(self, name, category='pipeline', args=None):
+        now = time.perf_counter()
+        self.span(name, now, now, category, args)
+
+    # 一帧结束时调用，整帧耗时超过阈值时在后台线程中导出，不阻塞检测线程
+    def checkSpike(self, frameSeconds):
+        if not self.enabled or self.spikeThreshold <= 0 or frameSeconds * 1000 < self.spikeThreshold:
+            return None
+        now = time.perf_counter()
+        if now - self.lastSpikeDump < self.cooldown:
+            return None
+        self.lastSpikeDump = now
+        path = self.newPath('spike')
+        logging.warning('单帧耗时{:.0f} ms，导出trace文件：{}'.format(frameSeconds * 1000, path))
+        threading.Thread(target=self.dump, args=(path,), daemon=True).start()
+        return path
+
+    def newPath(self, reason):
+        return os.path.join(self.outputDir, 'trace_{}_{}.json'.format(
+            datetime.now().strftime('%Y%m%d%H%M%S'), reason))
+
+    # 导出当前缓冲区中的事件，返回文件路径
+    def dump(self, path=None):
+        path = path or self.newPath('manual')
+        with self.lock:
+            events = list(self.events)
+            threadNames = dict(self.threadNames)
+
+        pid = os.getpid()
+        traceEvents = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                       for tid, name in threadNames.items()]
+        base = min(event[3] for event in events) if events else 0.0  # 整帧事件在各阶段之后记录，开始时间却更早
+        for name, category, tid, start, end, args in events:
+            event = {'name': name, 'cat': category, 'pid': pid, 'tid': tid,
+                     'ts': round((start - base) * 1e6, 1)}  # 微秒
+            if end > start:
+                event['ph'] = 'X'
+                event['dur'] = round((end - start) * 1e6, 1)
+            else:
+                event['ph'] = 'i'
+                event['s'] = 't'
+            if args:
+                event['args'] = args
+            traceEvents.append(event)
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, file)
+        os.replace(path + '.tmp', path)
+        return path